@@ -2,15 +2,21 @@ import logging
 import os
 from datetime import datetime
 from fastapi.routing import APIRouter
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.requests import Request
-from fastapi import Header, HTTPException
-from typing import Optional, Annotated
+from starlette.requests import ClientDisconnect
+from fastapi import Body, Header, HTTPException, Query
+from typing import Optional, Annotated, AsyncIterator, BinaryIO, Iterator
 from services import SERVICE
 from config import CONFIG
+from config.config import DEFAULT_TOPIC, ReplicationFormat
 from models.models import Message, SecondaryServer, ServerStatus
-from utils.exceptions import AuthorizationError, MessageDuplicationError, ReadOnlyException
+from utils.exceptions import AuthorizationError, MessageDuplicationError, ReadOnlyException, \
+    ReorderBufferOverflowError, WriteConcernTimeoutError, UnexpectedResponse, OwnerWorkerError, \
+    ConsistencyTimeoutError, TopicNotFoundError, SecondaryAheadError
 from utils.other import delay
+from utils.serialization import dumps, join_array
+from utils.shutdown import EXITING, until_exit
 from registries import SECONDARIES_REGISTRY
 
 
@@ -20,30 +26,92 @@ secondary_router = APIRouter()
 
 @master_router.get('/messages', status_code=200)
 @secondary_router.get('/messages', status_code=200)
-async def get_message_list(x_token: Annotated[str, Header()]):
+async def get_message_list(x_token: Annotated[str, Header()],
+                           since_id: Annotated[int, Query(ge=0)] = 0,
+                           limit: Annotated[Optional[int], Query(ge=1)] = None,
+                           stream: bool = False,
+                           min_id: Annotated[int, Query(ge=0)] = 0,
+                           wait: Annotated[float, Query(ge=0, le=CONFIG.LONG_POLL_MAX_WAIT)] = 0,
+                           topic: str = DEFAULT_TOPIC):
+    """
+    messages of topic with ids greater than since_id (at most limit of them)
+    if stream is set, messages are sent lazily one per line (ndjson)
+    min_id is a consistency token (message id returned by master): response waits up to READ_MIN_ID_TIMEOUT seconds
+    until server has every message up to it
+    wait (long-poll): if there are no messages after since_id, response waits up to wait seconds for the next one
+    """
     try:
-        message_registry = SERVICE.get_message_list(api_key=x_token)
-    except AuthorizationError as e:
+        if min_id:
+            await SERVICE.wait_for_message(api_key=x_token, min_id=min_id, timeout=CONFIG.READ_MIN_ID_TIMEOUT,
+                                           topic=topic)
+        if wait:
+            await SERVICE.wait_after(api_key=x_token, since_id=since_id, timeout=wait, topic=topic)
+        if stream:
+            return StreamingResponse(
+                content=stream_messages(SERVICE.stream_messages(api_key=x_token, since_id=since_id, limit=limit,
+                                                                topic=topic)),
+                media_type='application/x-ndjson'
+            )
+        messages, last_id = await SERVICE.read_messages(api_key=x_token, since_id=since_id, limit=limit, topic=topic)
+    except (AuthorizationError, TopicNotFoundError, OwnerWorkerError, ConsistencyTimeoutError) as e:
         raise HTTPException(status_code=e.status_code, detail=str(e))
 
-    return JSONResponse(
-        content={"data": message_registry.list()},
+    content = b'{"data":' + join_array(messages)
+    if limit is not None:
+        content += b',"next_since_id":' + dumps(last_id)
+    return Response(
+        content=content + b'}',
+        media_type='application/json',
         status_code=200
     )
 
 
-@master_router.put('/messages', status_code=200)
-@secondary_router.put('/messages', status_code=200)
-async def post_message(x_token: Annotated[str, Header()],
-                       message: Message,
-                       wc: Optional[int] = None):
+async def stream_messages(chunks: AsyncIterator[list[bytes]]) -> AsyncIterator[bytes]:
     """
-    wc (write concern) default value is set to total registered secondaries + 1 (master)
-    if server is secondary, wc parameter is ignored
+    stream ends early if owner worker of master is lost, client continues after the last message it got
     """
-    await delay(*[int(x) for x in (os.getenv('DELAY', '0,0').split(','))])
-    # wc = wc or SECONDARIES_REGISTRY.servers_number+1
+    try:
+        async for chunk in chunks:
+            yield b'\n'.join(chunk) + b'\n'
+    except OwnerWorkerError:
+        return
+
 
+@master_router.get('/messages/subscribe', status_code=200)
+@secondary_router.get('/messages/subscribe', status_code=200)
+async def subscribe_to_messages(x_token: Annotated[str, Header()],
+                                since_id: Annotated[int, Query(ge=0)] = 0,
+                                last_event_id: Annotated[Optional[int], Header(ge=0)] = None,
+                                topic: str = DEFAULT_TOPIC):
+    """
+    server-sent events with messages after since_id: every event is a json array of messages committed together,
+    its id is the id of the last of them. reconnecting client continues after last-event-id header.
+    comment is sent every SUBSCRIPTION_HEARTBEAT seconds without new messages to keep the connection open
+    """
+    try:
+        chunks = SERVICE.subscribe(api_key=x_token, since_id=max(since_id, last_event_id or 0),
+                                   heartbeat=CONFIG.SUBSCRIPTION_HEARTBEAT, topic=topic)
+    except (AuthorizationError, TopicNotFoundError, OwnerWorkerError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return StreamingResponse(content=server_sent_events(chunks), media_type='text/event-stream',
+                             headers={'cache-control': 'no-cache'})
+
+
+async def server_sent_events(chunks: AsyncIterator[tuple[list[bytes], int]]) -> AsyncIterator[bytes]:
+    """
+    stream ends if owner worker of master is lost, client reconnects with last-event-id
+    """
+    try:
+        async for messages, last_id in until_exit(chunks):
+            if not messages:
+                yield b': heartbeat\n\n'
+                continue
+            yield b'id: ' + dumps(last_id) + b'\ndata: ' + join_array(messages) + b'\n\n'
+    except OwnerWorkerError:
+        return
+
+
+def validate_wc(wc: Optional[int]) -> int:
     wc = wc or SECONDARIES_REGISTRY.quorum
     if wc <= 0 or wc > SECONDARIES_REGISTRY.servers_number+1:
         raise HTTPException(status_code=400,
@@ -53,49 +121,252 @@ async def post_message(x_token: Annotated[str, Header()],
                                    f'Currently {SECONDARIES_REGISTRY.healthy_servers_number} out of '
                                    f'{SECONDARIES_REGISTRY.servers_number} secondaries are reachable!'
                             )
+    return wc
+
+
+@master_router.put('/messages', status_code=200)
+@secondary_router.put('/messages', status_code=200)
+async def post_message(x_token: Annotated[str, Header()],
+                       message: Message,
+                       wc: Optional[int] = None,
+                       topic: str = DEFAULT_TOPIC):
+    """
+    message is registered in topic, every topic has its own sequence of ids
+    wc (write concern) default value is set to total registered secondaries + 1 (master)
+    if server is secondary, wc parameter is ignored
+    if wc is not reached in WC_TIMEOUT seconds, message is returned with 202 status code
+    id of the message is also returned in x-consistency-token header to be used as min_id for reads from secondaries
+    """
+    await delay(*[int(x) for x in (os.getenv('DELAY', '0,0').split(','))])
+    # wc = wc or SECONDARIES_REGISTRY.servers_number+1
+
+    wc = validate_wc(wc)
     try:
         _ = await SERVICE.register_message(
             message=message,
             api_key=x_token,
-            wc=wc
+            wc=wc,
+            topic=topic
         )
-    except (AuthorizationError, MessageDuplicationError, ReadOnlyException) as e:
+    except (AuthorizationError, TopicNotFoundError, MessageDuplicationError, ReadOnlyException,
+            ReorderBufferOverflowError, OwnerWorkerError) as e:
         raise HTTPException(status_code=e.status_code, detail=str(e))
+    except WriteConcernTimeoutError as e:
+        return JSONResponse(content={**message.dict(), 'detail': str(e)}, status_code=e.status_code,
+                            headers={'x-consistency-token': str(message.meta.message_id)})
 
-    return JSONResponse(content=message.dict())
+    return Response(content=message.encode(), media_type='application/json',
+                    headers={'x-consistency-token': str(message.meta.message_id)})
+
+
+@master_router.put('/messages/batch', status_code=200)
+@secondary_router.put('/messages/batch', status_code=200)
+async def post_message_batch(x_token: Annotated[str, Header()],
+                             messages: list[Message],
+                             wc: Optional[int] = None,
+                             topic: str = DEFAULT_TOPIC):
+    """
+    messages are registered under contiguous range of ids, response is sent when every message is delivered to wc
+    if server is secondary, wc parameter is ignored and messages which already exist on server are skipped
+    """
+    await delay(*[int(x) for x in (os.getenv('DELAY', '0,0').split(','))])
+    wc = validate_wc(wc)
+    try:
+        message_ids = await SERVICE.register_messages(
+            messages=messages,
+            api_key=x_token,
+            wc=wc,
+            topic=topic
+        )
+    except (AuthorizationError, TopicNotFoundError, ReadOnlyException, ReorderBufferOverflowError,
+            OwnerWorkerError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except WriteConcernTimeoutError as e:
+        return JSONResponse(content={'data': e.message_ids, 'detail': str(e)}, status_code=e.status_code,
+                            headers={'x-consistency-token': str(e.message_ids[-1])})
+
+    return JSONResponse(content={'data': message_ids},
+                        headers={'x-consistency-token': str(message_ids[-1])} if message_ids else None)
+
+
+@secondary_router.put('/replication/batch', status_code=200)
+async def replicate_message_batch(x_token: Annotated[str, Header()], request: Request, topic: str = DEFAULT_TOPIC):
+    """
+    batch replicated by master in binary wire format, messages which already exist on secondary are skipped
+    """
+    try:
+        message_ids = await SERVICE.register_encoded_messages(api_key=x_token, data=await request.body(), topic=topic)
+    except (AuthorizationError, TopicNotFoundError, ReorderBufferOverflowError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(content={'data': message_ids})
 
 
 @master_router.post('/secondary/register', status_code=200)
-async def register_to_master(_id: str, x_token: Annotated[str, Header()], request: Request):
+async def register_to_master(_id: str, x_token: Annotated[str, Header()], request: Request, last_id: int = 0,
+                             x_content_encodings: Annotated[str, Header()] = '',
+                             x_replication_format: Annotated[ReplicationFormat, Header()] = ReplicationFormat.JSON,
+                             last_ids: Annotated[dict[str, int], Body(embed=True)] = {}):
+    """
+    last_id is the highest contiguous message id registered on secondary, only messages after it are sent back
+    last_ids are the same ids for other topics
+    x-content-encodings are compressions secondary can decode, replication requests are compressed with one of them
+    x-replication-format is the format of replicated messages secondary accepts (json or binary)
+    response has ids of the last messages secondary is caught up to (to become ready) and epoch of master
+    """
     try:
-        service_id = await SERVICE.register_service(
+        result = await SERVICE.register_service(
             service=SecondaryServer(
                 id=_id,
                 host=request.client.host,
                 port=CONFIG.SECONDARY_PORT or request.client.port,
                 status=ServerStatus.HEALTHY,
-                last_status_change=datetime.now()
+                last_status_change=datetime.now(),
+                encodings=[encoding.strip() for encoding in x_content_encodings.split(',') if encoding.strip()],
+                replication_format=x_replication_format.value
             ),
-            api_key=x_token
+            api_key=x_token,
+            last_id=last_id,
+            last_ids=last_ids
         )
-    except AuthorizationError as e:
+    except (AuthorizationError, SecondaryAheadError, OwnerWorkerError) as e:
         raise HTTPException(status_code=e.status_code, detail=str(e))
 
-    return JSONResponse(content={
-        'id': service_id
-    })
+    return JSONResponse(content=result)
+
+
+@master_router.get('/replication/stream', status_code=200)
+async def open_replication_stream(_id: str, x_token: Annotated[str, Header()]):
+    """
+    long-lived stream of replicated messages for secondary: every line is a json array of messages
+    or every frame is a length-prefixed batch if secondary accepts binary format.
+    stream is ended on server exit, secondary opens it again
+    """
+    if EXITING.is_set():
+        raise HTTPException(status_code=503, detail='Server is shutting down')
+    try:
+        channel = SERVICE.open_channel(api_key=x_token, server_id=_id)
+    except (AuthorizationError, UnexpectedResponse, OwnerWorkerError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    async def stream_frames() -> AsyncIterator[bytes]:
+        try:
+            async for frame in channel.stream():
+                yield frame
+        finally:
+            SERVICE.close_channel(server_id=_id, channel=channel)
+
+    return StreamingResponse(stream_frames(), media_type=channel.media_type)
+
+
+@master_router.post('/replication/acks', status_code=200)
+async def receive_replication_acks(_id: str, x_token: Annotated[str, Header()], request: Request):
+    """
+    long-lived stream of cumulative acks from secondary: every line is the highest contiguous message id it has.
+    stream is ended on server exit, secondary opens it again
+    """
+    try:
+        await SERVICE.receive_acks(api_key=x_token, server_id=_id, chunks=until_exit(request.stream()))
+    except (AuthorizationError, OwnerWorkerError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientDisconnect:
+        pass
+    return JSONResponse(content={})
 
 
 @master_router.get('/secondary/list', status_code=200)
 async def get_working_secondaries(x_token: Annotated[str, Header()]):
     try:
-        registry = SERVICE.get_secondaries_registry(api_key=x_token)
-    except AuthorizationError as e:
+        secondaries = await SERVICE.list_secondaries(api_key=x_token)
+    except (AuthorizationError, OwnerWorkerError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return JSONResponse(content={"data": secondaries})
+
+
+@master_router.get('/snapshot', status_code=200)
+async def get_snapshot(x_token: Annotated[str, Header()],
+                       since_id: Annotated[int, Query(ge=0)] = 0,
+                       topic: str = DEFAULT_TOPIC):
+    """
+    messages of snapshot of topic after since_id (one log record per line) to bootstrap a secondary which is far behind.
+    204 if secondary can be caught up by replication
+    """
+    try:
+        snapshot = await SERVICE.get_snapshot(api_key=x_token, since_id=since_id, topic=topic)
+    except (AuthorizationError, TopicNotFoundError, OwnerWorkerError) as e:
         raise HTTPException(status_code=e.status_code, detail=str(e))
-    return JSONResponse(content={"data": registry.list()})
+    if snapshot is None:
+        return Response(status_code=204)
+    file = open(snapshot['path'], 'rb')
+    file.seek(snapshot['offset'])
+    return StreamingResponse(content=read_file(file), media_type='application/x-ndjson',
+                             headers={'x-snapshot-id': str(snapshot['last_id'])})
+
+
+def read_file(file: BinaryIO, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    with file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+@master_router.get('/secondary/reader', status_code=200)
+async def get_reader(x_token: Annotated[str, Header()],
+                     min_id: Annotated[int, Query(ge=0)] = 0,
+                     topic: str = DEFAULT_TOPIC):
+    """
+    healthy secondary to send reads to: one of those which already have min_id of topic or the least lagged one
+    """
+    try:
+        reader = await SERVICE.pick_reader(api_key=x_token, min_id=min_id, topic=topic)
+    except (AuthorizationError, TopicNotFoundError, UnexpectedResponse, OwnerWorkerError) as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return JSONResponse(content=reader)
 
 
 @master_router.get('/healthcheck', status_code=200)
+def master_healthcheck():
+    """
+    epoch of master is sent in x-master-epoch header, secondaries register again when it changes
+    """
+    return PlainTextResponse('HEALTHY', headers={'x-master-epoch': SERVICE.epoch} if SERVICE.epoch else None)
+
+
 @secondary_router.get('/healthcheck', status_code=200)
 def healthcheck():
     return PlainTextResponse('HEALTHY')
+
+
+@master_router.get('/ready', status_code=200)
+@secondary_router.get('/ready', status_code=200)
+def ready():
+    """
+    secondary is ready when it is registered to master and has every message master had at registration,
+    master worker is ready when it is connected to the owner worker
+    """
+    if not SERVICE.is_ready:
+        return PlainTextResponse('NOT READY', status_code=503)
+    return PlainTextResponse('READY')
+
+
+@master_router.get('/metrics', status_code=200)
+@secondary_router.get('/metrics', status_code=200)
+async def metrics():
+    """
+    metrics in prometheus text format
+    """
+    try:
+        text = await SERVICE.render_metrics()
+    except OwnerWorkerError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return PlainTextResponse(text, media_type='text/plain; version=0.0.4')
+
+
+# routes of topics are added after the rest, so /messages/batch and /messages/subscribe aren't taken for topics
+for router in (master_router, secondary_router):
+    router.add_api_route('/messages/{topic}/batch', post_message_batch, methods=['PUT'], status_code=200)
+    router.add_api_route('/messages/{topic}/subscribe', subscribe_to_messages, methods=['GET'], status_code=200)
+    router.add_api_route('/messages/{topic}', post_message, methods=['PUT'], status_code=200)
+    router.add_api_route('/messages/{topic}', get_message_list, methods=['GET'], status_code=200)
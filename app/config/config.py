@@ -1,4 +1,5 @@
 import os
+import re
 from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings
 import enum
@@ -11,6 +12,26 @@ class RetryMechanism(enum.Enum):
     EXPONENTIAL = 'exponential'
 
 
+class FsyncPolicy(enum.Enum):
+    ALWAYS = 'always'
+    INTERVAL = 'interval'
+    NEVER = 'never'
+
+
+class MessageStore(enum.Enum):
+    DICT = 'dict'
+    COLUMNAR = 'columnar'
+
+
+DEFAULT_TOPIC = 'default'
+RESERVED_TOPICS = (DEFAULT_TOPIC, 'batch', 'subscribe')
+
+
+class ReplicationFormat(enum.Enum):
+    JSON = 'json'
+    BINARY = 'binary'
+
+
 class Config(BaseSettings):
     HOSTNAME: str = Field(alias='HOSTNAME')
     MASTER_HOST: str = Field(alias='MASTER_HOST')
@@ -28,6 +49,43 @@ class Config(BaseSettings):
     MESSAGE_POST_RETRY_INTERVAL: int = Field(alias='MESSAGE_POST_RETRY_INTERVAL', ge=1)
     MESSAGE_POST_RETRIES_MECHANISM: RetryMechanism = Field(alias='MESSAGE_POST_RETRIES_MECHANISM',
                                                            default='exponential')
+    WC_TIMEOUT: Optional[int] = Field(alias='WC_TIMEOUT', default=None, ge=1)
+    REPLICATION_BATCH_SIZE: int = Field(alias='REPLICATION_BATCH_SIZE', default=100, ge=1)
+    REPLICATION_BATCH_WINDOW_MS: int = Field(alias='REPLICATION_BATCH_WINDOW_MS', default=5, ge=0)
+    REPLICATION_WINDOW: int = Field(alias='REPLICATION_WINDOW', default=4, ge=1)
+    REPLICATION_QUEUE_SIZE: int = Field(alias='REPLICATION_QUEUE_SIZE', default=10000, ge=1)
+    CATCHUP_CHUNK_SIZE: int = Field(alias='CATCHUP_CHUNK_SIZE', default=1000, ge=1)
+    REORDER_BUFFER_LIMIT: int = Field(alias='REORDER_BUFFER_LIMIT', default=100000, ge=1)
+    GAP_FILL_TIMEOUT: int = Field(alias='GAP_FILL_TIMEOUT', default=5, ge=1)
+    MESSAGE_STORE: MessageStore = Field(alias='MESSAGE_STORE', default='dict')
+    MESSAGE_LOG_DIR: Optional[str] = Field(alias='MESSAGE_LOG_DIR', default=None)
+    MESSAGE_LOG_SEGMENT_SIZE: int = Field(alias='MESSAGE_LOG_SEGMENT_SIZE', default=64 * 1024 * 1024, ge=1)
+    MESSAGE_LOG_FSYNC: FsyncPolicy = Field(alias='MESSAGE_LOG_FSYNC', default='interval')
+    MESSAGE_LOG_FSYNC_INTERVAL_MS: int = Field(alias='MESSAGE_LOG_FSYNC_INTERVAL_MS', default=100, ge=1)
+    SNAPSHOT_DIR: Optional[str] = Field(alias='SNAPSHOT_DIR', default=None)
+    SNAPSHOT_INTERVAL: int = Field(alias='SNAPSHOT_INTERVAL', default=60, ge=1)
+    SNAPSHOT_RETAIN_MESSAGES: int = Field(alias='SNAPSHOT_RETAIN_MESSAGES', default=100000, ge=0)
+    COMPRESSION_CODECS: list[str] = Field(alias='COMPRESSION_CODECS', default=['gzip'])
+    COMPRESSION_THRESHOLD: int = Field(alias='COMPRESSION_THRESHOLD', default=1024, ge=0)
+    COMPRESSION_STREAM_DELAY_MS: int = Field(alias='COMPRESSION_STREAM_DELAY_MS', default=10, ge=0)
+    REPLICATION_FORMAT: ReplicationFormat = Field(alias='REPLICATION_FORMAT', default='binary')
+    HTTP2: bool = Field(alias='HTTP2', default=False)
+    POOL_MAX_CONNECTIONS: int = Field(alias='POOL_MAX_CONNECTIONS', default=100, ge=1)
+    POOL_MAX_KEEPALIVE_CONNECTIONS: int = Field(alias='POOL_MAX_KEEPALIVE_CONNECTIONS', default=20, ge=1)
+    POOL_KEEPALIVE_EXPIRY: int = Field(alias='POOL_KEEPALIVE_EXPIRY', default=60, ge=1)
+    RETRY_JITTER: float = Field(alias='RETRY_JITTER', default=0.1, ge=0, le=1)
+    RETRY_CONCURRENCY: int = Field(alias='RETRY_CONCURRENCY', default=100, ge=1)
+    PHI_THRESHOLD: float = Field(alias='PHI_THRESHOLD', default=8, gt=0)
+    PHI_WINDOW: int = Field(alias='PHI_WINDOW', default=100, ge=2)
+    REPLICATION_STREAM: bool = Field(alias='REPLICATION_STREAM', default=True)
+    LOG_QUEUE_SIZE: int = Field(alias='LOG_QUEUE_SIZE', default=10000, ge=1)
+    LOG_SAMPLING: dict[str, float] = Field(alias='LOG_SAMPLING', default_factory=dict)
+    LOG_RATE_LIMIT: float = Field(alias='LOG_RATE_LIMIT', default=0, ge=0)
+    READ_MIN_ID_TIMEOUT: float = Field(alias='READ_MIN_ID_TIMEOUT', default=5, ge=0)
+    SUBSCRIPTION_HEARTBEAT: float = Field(alias='SUBSCRIPTION_HEARTBEAT', default=15, gt=0)
+    LONG_POLL_MAX_WAIT: float = Field(alias='LONG_POLL_MAX_WAIT', default=60, ge=0)
+    TOPICS: list[str] = Field(alias='TOPICS', default=[])
+    MASTER_WORKERS_SOCKET: Optional[str] = Field(alias='MASTER_WORKERS_SOCKET', default=None)
     CLIENT_TOKEN: str = Field(alias='API_TOKEN')
     SERVICE_TOKEN: Optional[str] = None
 
@@ -46,6 +104,14 @@ class Config(BaseSettings):
             raise ValueError('MAX_MESSAGE_POST_RETRY_DELAY must be less or equal to SECONDARY_REMOVAL_DELAY')
         if self.MESSAGE_POST_RETRY_INTERVAL > self.MAX_MESSAGE_POST_RETRY_DELAY:
             raise ValueError('MESSAGE_POST_RETRY_INTERVAL must be less or equal to MAX_MESSAGE_POST_RETRY_DELAY')
+        if self.POOL_MAX_KEEPALIVE_CONNECTIONS > self.POOL_MAX_CONNECTIONS:
+            raise ValueError('POOL_MAX_KEEPALIVE_CONNECTIONS must be less or equal to POOL_MAX_CONNECTIONS')
+        for topic in self.TOPICS:
+            if not re.fullmatch(r'[A-Za-z0-9_.-]+', topic) or topic in RESERVED_TOPICS:
+                raise ValueError(f'Topic name {topic!r} must consist of letters, digits, "_", "." or "-" '
+                                 f'and must not be one of {", ".join(RESERVED_TOPICS)}')
+        if len(set(self.TOPICS)) != len(self.TOPICS):
+            raise ValueError('TOPICS must be unique')
 
         return self
 
@@ -1,15 +1,24 @@
 from services import SERVICE
+from config import CONFIG
+from utils.log_pipeline import LOG_PIPELINE
 from models.models import ServiceType
 from fastapi import FastAPI
 from api.api import master_router, secondary_router
+from utils.compression import CompressionMiddleware
+from utils.shutdown import chain_exit_signals
 
 
 app = FastAPI()
+app.add_middleware(CompressionMiddleware,
+                   threshold=CONFIG.COMPRESSION_THRESHOLD,
+                   delay=CONFIG.COMPRESSION_STREAM_DELAY_MS / 1000)
+chain_exit_signals(on_exit=SERVICE.end_streams)
 
 
 @app.on_event('startup')
 def init():
     global app
+    LOG_PIPELINE.start()
     SERVICE.start()
 
     app.include_router(router={
@@ -17,6 +26,12 @@ def init():
         ServiceType.SECONDARY: secondary_router
     }[SERVICE.service_type])
 
+
+@app.on_event('shutdown')
+async def shutdown():
+    await SERVICE.stop()
+    LOG_PIPELINE.stop()
+
 # if __name__ == '__main__':
 #     os.environ['SERVICE_TYPE'] = sys.argv[2]
 #     uvicorn.run(app=app, port=int(sys.argv[1]))
@@ -1,8 +1,9 @@
 import enum
 from datetime import datetime
-from pydantic import BaseModel, IPvAnyAddress
+from pydantic import BaseModel, IPvAnyAddress, PrivateAttr
 from typing import Optional, Dict, Any
 from models.item import Item
+from utils.serialization import dumps
 
 
 class MessageMeta(BaseModel):
@@ -19,12 +20,14 @@ class MessageMeta(BaseModel):
 
 class Message(Item):
     meta: Optional[MessageMeta] = None
+    _encoded: Optional[bytes] = PrivateAttr(default=None)
 
-    def register(self, message_id: int):
+    def register(self, message_id: int, registered_at: Optional[datetime] = None):
         self.meta = MessageMeta(
             message_id=message_id,
-            registered_at=datetime.now()
+            registered_at=registered_at or datetime.now()
         )
+        self._encoded = None
         return self
 
     def dict(self, *args, **kwargs):
@@ -32,6 +35,25 @@ class Message(Item):
         res['meta'] = self.meta.dict()
         return res
 
+    def encode(self) -> bytes:
+        """
+        json bytes equal to json of self.dict()
+        message, id and registration time don't change after registration, so they are encoded once and cached,
+        registered_to is encoded on every call
+        """
+        if self._encoded is None:
+            self._encoded = self.encode_prefix(message=dumps(self.message), message_id=self.meta.message_id,
+                                               registered_at=self.meta.registered_at)
+        return self._encoded + b',"registered_to":' + dumps(list(self.meta.registered_to)) + b'}}'
+
+    @staticmethod
+    def encode_prefix(message: bytes, message_id: int, registered_at: datetime) -> bytes:
+        """
+        cached part of encoded message from already json-encoded message text
+        """
+        return b'{"message":' + message + b',"meta":{"message_id":' + dumps(message_id) + \
+            b',"registered_at":' + dumps(str(registered_at))
+
     def __str__(self):
         message_str = f"message: {self.message}"
         if self.meta:
@@ -65,6 +87,8 @@ class SecondaryServer(BaseModel):
     port: int
     status: ServerStatus
     last_status_change: datetime
+    encodings: list[str] = []
+    replication_format: str = 'json'
 
     def dict(self, *args, **kwargs) -> Dict[str, Any]:
         return {
@@ -72,5 +96,7 @@ class SecondaryServer(BaseModel):
             'host': str(self.host),
             'port': self.port,
             'status': self.status.name,
-            'last_status_change': self.last_status_change.strftime('%Y-%m-%d %H:%M:%S')
+            'last_status_change': self.last_status_change.strftime('%Y-%m-%d %H:%M:%S'),
+            'encodings': self.encodings,
+            'replication_format': self.replication_format
         }
\ No newline at end of file
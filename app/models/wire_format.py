@@ -0,0 +1,88 @@
+"""
+binary replication format of master to secondary traffic.
+batch is a sequence of records: message_id (u64), registered_at (i64, microseconds since epoch),
+length of message text (u32) followed by utf-8 text. registered_to is not replicated (as in message log).
+on replication stream every batch is a frame prefixed with its length (u32)
+"""
+import struct
+from datetime import datetime, timedelta
+from models.models import Message, MessageMeta
+
+RECORD = struct.Struct('!QqI')
+FRAME = struct.Struct('!I')
+MEDIA_TYPE = 'application/x-replication-batch'
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+META_FIELDS = frozenset(MessageMeta.model_fields)
+MESSAGE_FIELDS = frozenset(Message.model_fields)
+_set = object.__setattr__
+
+
+def encode_batch(messages: list[Message]) -> bytes:
+    parts = []
+    for message in messages:
+        text = message.message.encode('utf-8')
+        parts.append(RECORD.pack(message.meta.message_id,
+                                 (message.meta.registered_at - EPOCH) // MICROSECOND,
+                                 len(text)))
+        parts.append(text)
+    return b''.join(parts)
+
+
+def decode_batch(data: bytes) -> list[Message]:
+    """
+    messages are constructed without validation, batch comes from master authenticated with SERVICE_TOKEN
+    """
+    messages = []
+    offset, size = 0, len(data)
+    while offset < size:
+        if size - offset < RECORD.size:
+            raise ValueError('Replicated batch is truncated')
+        message_id, registered_at, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        messages.append(_construct(message=data[offset:offset + length].decode('utf-8'),
+                                   message_id=message_id,
+                                   registered_at=EPOCH + registered_at * MICROSECOND))
+        offset += length
+    if offset != size:
+        raise ValueError('Replicated batch is truncated')
+    return messages
+
+
+def _construct(message: str, message_id: int, registered_at: datetime) -> Message:
+    """
+    what Message.model_construct(meta=MessageMeta.model_construct(...)) does without looking up defaults
+    of every field, which costs more than the rest of decoding
+    """
+    meta = object.__new__(MessageMeta)
+    _set(meta, '__dict__', {'message_id': message_id, 'registered_at': registered_at, 'registered_to': set()})
+    _set(meta, '__pydantic_fields_set__', set(META_FIELDS))
+    _set(meta, '__pydantic_extra__', None)
+    _set(meta, '__pydantic_private__', None)
+    constructed = object.__new__(Message)
+    _set(constructed, '__dict__', {'message': message, 'meta': meta})
+    _set(constructed, '__pydantic_fields_set__', set(MESSAGE_FIELDS))
+    _set(constructed, '__pydantic_extra__', None)
+    _set(constructed, '__pydantic_private__', {'_encoded': None})
+    return constructed
+
+
+def encode_frame(messages: list[Message]) -> bytes:
+    batch = encode_batch(messages)
+    return FRAME.pack(len(batch)) + batch
+
+
+def split_frames(buffer: bytearray) -> list[bytes]:
+    """
+    complete frames are taken from the beginning of buffer, incomplete one is left in it
+    """
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= FRAME.size:
+        length = FRAME.unpack_from(buffer, offset)[0]
+        if len(buffer) - offset - FRAME.size < length:
+            break
+        frames.append(bytes(buffer[offset + FRAME.size:offset + FRAME.size + length]))
+        offset += FRAME.size + length
+    del buffer[:offset]
+    return frames
@@ -1,7 +1,52 @@
+import os
+from typing import Optional
+from config import CONFIG
+from config.config import DEFAULT_TOPIC, MessageStore
+from registries.message_log import MessageLog
 from registries.message_registry import MessageRegistry
+from registries.snapshot import SnapshotStore
+from registries.columnar_registry import ColumnarMessageRegistry
 from registries.secondaries_registry import ServiceRegistry
 
 
-MESSAGE_REGISTRY = MessageRegistry()
-SECONDARIES_REGISTRY = ServiceRegistry()
+def topic_dir(path: Optional[str], topic: str) -> Optional[str]:
+    """
+    messages of default topic are kept in the directory itself, other topics in its subdirectories
+    """
+    if not path or topic == DEFAULT_TOPIC:
+        return path
+    return os.path.join(path, 'topics', topic)
+
+
+def create_message_registry() -> MessageRegistry:
+    """
+    every topic has its own registry: id sequence, reorder buffer, message log and snapshots (see open_storage)
+    """
+    return {
+        MessageStore.DICT: MessageRegistry,
+        MessageStore.COLUMNAR: ColumnarMessageRegistry
+    }[CONFIG.MESSAGE_STORE](awaited_limit=CONFIG.REORDER_BUFFER_LIMIT)
+
 
+def open_storage():
+    """
+    message logs and snapshots of every topic are opened only by the process which owns registries,
+    worker processes of master which forward requests to the owner never touch them
+    """
+    for topic, registry in MESSAGE_REGISTRIES.items():
+        log_dir, snapshot_dir = topic_dir(CONFIG.MESSAGE_LOG_DIR, topic), topic_dir(CONFIG.SNAPSHOT_DIR, topic)
+        if log_dir:
+            registry.log = MessageLog(path=log_dir,
+                                      segment_size=CONFIG.MESSAGE_LOG_SEGMENT_SIZE,
+                                      fsync_policy=CONFIG.MESSAGE_LOG_FSYNC,
+                                      fsync_interval=CONFIG.MESSAGE_LOG_FSYNC_INTERVAL_MS / 1000)
+        if snapshot_dir:
+            registry.snapshots = SnapshotStore(path=snapshot_dir)
+
+
+MESSAGE_REGISTRY: MessageRegistry = create_message_registry()
+MESSAGE_REGISTRIES: dict[str, MessageRegistry] = {
+    DEFAULT_TOPIC: MESSAGE_REGISTRY,
+    **{topic: create_message_registry() for topic in CONFIG.TOPICS}
+}
+SECONDARIES_REGISTRY = ServiceRegistry()
@@ -0,0 +1,127 @@
+from array import array
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+from models.models import Message, MessageMeta
+from registries.message_log import MessageLog
+from registries.message_registry import MessageRegistry
+from registries.snapshot import SnapshotStore
+from utils.serialization import dumps, loads
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class ColumnarMessageRegistry(MessageRegistry):
+    """
+    message registry which keeps messages in columns instead of per-message objects:
+    - ids are implicit (message with id N is stored at position N-1)
+    - registration times are microseconds since epoch in a typed array
+    - message texts are stored json-encoded in one append-only byte arena,
+      so encoded messages (responses, replication) are assembled from it without encoding texts again
+    - acknowledgements are bitmaps (one bit per message) indexed by server
+    Message objects are materialized on access, so their changes are not saved back, use ack() instead.
+    after compaction positions start from compacted_id
+    """
+    def __init__(self, log: Optional[MessageLog] = None, awaited_limit: Optional[int] = None,
+                 snapshots: Optional[SnapshotStore] = None):
+        super().__init__(log=log, awaited_limit=awaited_limit, snapshots=snapshots)
+        self.registered_at = array('q')
+        self.offsets = array('Q', [0])
+        self.arena = bytearray()
+        self.servers: dict[str, int] = dict()
+        self.ack_bitmaps: list[bytearray] = []
+
+    def _store(self, message: Message):
+        if message.meta.message_id != self.compacted_id + len(self.registered_at) + 1:
+            raise ValueError(f'Message(id: {message.meta.message_id}) is not next to '
+                             f'the last stored id ({self.compacted_id + len(self.registered_at)})')
+        self.registered_at.append((message.meta.registered_at - EPOCH) // MICROSECOND)
+        self.arena += dumps(message.message)
+        self.offsets.append(len(self.arena))
+        for server_id in message.meta.registered_to:
+            self.ack(message_id=message.meta.message_id, server_id=server_id)
+
+    def _drop(self, until_id: int):
+        """
+        whole bytes of ack bitmaps are dropped, so number of dropped messages is a multiple of 8
+        """
+        dropped = (until_id - self.compacted_id) // 8 * 8
+        if dropped <= 0:
+            return
+        cut = self.offsets[dropped]
+        del self.registered_at[:dropped]
+        self.offsets = array('Q', [offset - cut for offset in self.offsets[dropped:]])
+        del self.arena[:cut]
+        for bitmap in self.ack_bitmaps:
+            del bitmap[:dropped // 8]
+        self.compacted_id += dropped
+
+    def ack(self, message_id: int, server_id: str) -> bool:
+        if message_id <= self.compacted_id:
+            return False
+        if server_id not in self.servers:
+            self.servers[server_id] = len(self.ack_bitmaps)
+            self.ack_bitmaps.append(bytearray())
+        bitmap = self.ack_bitmaps[self.servers[server_id]]
+        position = message_id - self.compacted_id - 1
+        byte, bit = position >> 3, 1 << (position & 7)
+        if len(bitmap) <= byte:
+            bitmap.extend(bytes(byte - len(bitmap) + 1024))
+        if bitmap[byte] & bit:
+            return False
+        bitmap[byte] |= bit
+        return True
+
+    def acks(self, message_id: int) -> int:
+        if message_id <= self.compacted_id:
+            return 0
+        return len(self._registered_to(message_id))
+
+    def _registered_to(self, message_id: int) -> set[str]:
+        position = message_id - self.compacted_id - 1
+        byte, bit = position >> 3, 1 << (position & 7)
+        return {server_id for server_id, index in self.servers.items()
+                if len(self.ack_bitmaps[index]) > byte and self.ack_bitmaps[index][byte] & bit}
+
+    def memory_usage(self, sample: int = 100) -> int:
+        return (self.registered_at.itemsize * len(self.registered_at) + self.offsets.itemsize * len(self.offsets)
+                + len(self.arena) + sum(len(bitmap) for bitmap in self.ack_bitmaps))
+
+    def __getitem__(self, message_id: int) -> Message:
+        if message_id not in self:
+            raise KeyError(message_id)
+        position = message_id - self.compacted_id - 1
+        text = bytes(self.arena[self.offsets[position]:self.offsets[position + 1]])
+        registered_at = EPOCH + self.registered_at[position] * MICROSECOND
+        message = Message.model_construct(
+            message=loads(text),
+            meta=MessageMeta.model_construct(
+                message_id=message_id,
+                registered_at=registered_at,
+                registered_to=self._registered_to(message_id)
+            )
+        )
+        message._encoded = Message.encode_prefix(message=text, message_id=message_id, registered_at=registered_at)
+        return message
+
+    def __contains__(self, message_id) -> bool:
+        return isinstance(message_id, int) and \
+            self.compacted_id < message_id <= self.compacted_id + len(self.registered_at)
+
+    def __len__(self) -> int:
+        return len(self.registered_at)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.compacted_id + 1, self.compacted_id + len(self.registered_at) + 1))
+
+    def get(self, message_id: int, default=None) -> Optional[Message]:
+        return self[message_id] if message_id in self else default
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[message_id] for message_id in self]
+
+    def items(self):
+        return [(message_id, self[message_id]) for message_id in self]
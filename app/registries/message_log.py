@@ -0,0 +1,184 @@
+import asyncio
+import json
+import logging
+import mmap
+import os
+import threading
+from datetime import datetime
+from typing import BinaryIO, Iterator, Optional
+from config.config import FsyncPolicy
+from models.models import Message, MessageMeta
+
+
+class MessageLog:
+    """
+    append-only log of messages split into segment files named after id of their first message.
+    every record is a json line; records appended in one call are written together.
+    fsync never runs on the event loop: with always policy appends made while one fsync runs
+    are synced together by the next one (group commit), writers wait for it with sync()
+    """
+    SUFFIX = '.log'
+
+    def __init__(self,
+                 path: str,
+                 segment_size: int,
+                 fsync_policy: FsyncPolicy = FsyncPolicy.INTERVAL,
+                 fsync_interval: float = 0.1):
+        self.path = path
+        self.segment_size = segment_size
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self.segment: Optional[BinaryIO] = None
+        self.dirty: bool = False
+        self.rolled: list[int] = []
+        self.appended: int = 0
+        self.synced: int = 0
+        self.syncing: Optional[asyncio.Future] = None
+        self.closed = threading.Event()
+        os.makedirs(self.path, exist_ok=True)
+        self.flusher: Optional[threading.Thread] = None
+        if self.fsync_policy == FsyncPolicy.INTERVAL:
+            self.flusher = threading.Thread(target=self._flush_periodically, name='message-log-fsync', daemon=True)
+            self.flusher.start()
+
+    def segments(self) -> list[str]:
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(self.SUFFIX))
+
+    def append(self, messages: list[Message]):
+        if not messages:
+            return
+        data = b''.join(self.encode(message) for message in messages)
+        with self.lock:
+            if self.segment is None or self.segment.tell() >= self.segment_size:
+                self._roll(first_id=messages[0].meta.message_id)
+            self.segment.write(data)
+            self.segment.flush()
+            self.dirty = True
+            self.appended += 1
+
+    async def sync(self):
+        """
+        wait until everything appended before the call is on disk (with always policy, others sync in background).
+        concurrent callers share one fsync in a thread
+        """
+        if self.fsync_policy != FsyncPolicy.ALWAYS:
+            return
+        appended = self.appended
+        while self.synced < appended:
+            if self.syncing is None:
+                self.syncing = asyncio.ensure_future(self._sync_appended())
+            await asyncio.shield(self.syncing)
+
+    async def _sync_appended(self):
+        try:
+            with self.lock:
+                appended, fds = self.appended, self._unsynced()
+            await asyncio.to_thread(self._fsync, fds)
+            self.synced = max(self.synced, appended)
+        finally:
+            self.syncing = None
+
+    def replay(self) -> Iterator[Message]:
+        """
+        stream messages from all segments in order of their ids.
+        torn record at the end of the last segment (write interrupted by crash) is truncated,
+        corrupted record anywhere else raises ValueError, since messages after it would be lost
+        """
+        segments = [segment for segment in self.segments() if os.path.getsize(segment) > 0]
+        for segment in segments:
+            with open(segment, 'r+b') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = 0
+                for line in iter(mm.readline, b''):
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('incomplete record')
+                        message = self.decode(line)
+                    except (ValueError, KeyError, TypeError) as e:
+                        if segment != segments[-1] or offset + len(line) < len(mm):
+                            raise ValueError(f'Message log segment {segment} is corrupted at offset {offset}: {e}')
+                        logging.getLogger("uvicorn.error").error(
+                            f'Message log segment {segment} has torn record at offset {offset}. Truncating it')
+                        mm.close()
+                        file.truncate(offset)
+                        return
+                    offset += len(line)
+                    yield message
+
+    def truncate(self, until_id: int):
+        """
+        remove segments which have only messages up to until_id (e.g. they are in snapshot), the last one is kept
+        """
+        with self.lock:
+            segments = self.segments()
+            for segment, next_segment in zip(segments, segments[1:]):
+                if int(os.path.basename(next_segment)[:-len(self.SUFFIX)]) - 1 > until_id:
+                    break
+                os.remove(segment)
+
+    @staticmethod
+    def encode(message: Message) -> bytes:
+        return json.dumps({
+            'message': message.message,
+            'message_id': message.meta.message_id,
+            'registered_at': str(message.meta.registered_at)
+        }).encode('utf-8') + b'\n'
+
+    @staticmethod
+    def decode(line: bytes) -> Message:
+        record = json.loads(line)
+        return Message.model_construct(
+            message=record['message'],
+            meta=MessageMeta.model_construct(message_id=record['message_id'],
+                                             registered_at=datetime.fromisoformat(record['registered_at']),
+                                             registered_to=set())
+        )
+
+    def close(self):
+        self.closed.set()
+        if self.flusher:
+            self.flusher.join()
+        with self.lock:
+            fds = self._unsynced()
+            if self.segment is not None:
+                self.segment.close()
+                self.segment = None
+            self.synced = self.appended
+        self._fsync(fds)
+
+    def _roll(self, first_id: int):
+        """
+        previous segment is synced later with the current one, not while appending
+        """
+        if self.segment is not None:
+            if self.dirty and self.fsync_policy != FsyncPolicy.NEVER:
+                self.rolled.append(os.dup(self.segment.fileno()))
+            self.segment.close()
+            self.dirty = False
+        self.segment = open(os.path.join(self.path, f'{first_id:020d}{self.SUFFIX}'), 'ab')
+
+    def _unsynced(self) -> list[int]:
+        """
+        duplicated descriptors of segments with writes which are not synced yet, so they are synced out of lock.
+        called under lock
+        """
+        fds, self.rolled = self.rolled, []
+        if self.dirty and self.segment is not None and self.fsync_policy != FsyncPolicy.NEVER:
+            fds.append(os.dup(self.segment.fileno()))
+        self.dirty = False
+        return fds
+
+    @staticmethod
+    def _fsync(fds: list[int]):
+        try:
+            for fd in fds:
+                os.fsync(fd)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def _flush_periodically(self):
+        while not self.closed.wait(self.fsync_interval):
+            with self.lock:
+                fds = self._unsynced()
+            self._fsync(fds)
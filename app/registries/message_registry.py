@@ -1,38 +1,317 @@
 from models.models import Message
+import asyncio
 import collections
-from utils.exceptions import MessageDuplicationError
+import heapq
+import itertools
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Iterator, Optional
+from registries.message_log import MessageLog
+from registries.snapshot import SnapshotStore
+from utils.exceptions import MessageDuplicationError, ReorderBufferOverflowError
 
 
-class MessageRegistry(collections.OrderedDict):
-    message_id: int = 0
-    awaited_messages: dict = dict()
-
+class CommitNotifier:
+    """
+    coroutines waiting until registry has every message up to given id.
+    waiters are kept in a heap by id, so a commit wakes only those whose id is reached.
+    subscribers waiting for any new message share one future of the next commit
+    """
     def __init__(self):
+        self.waiters: list[tuple[int, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.abandoned: int = 0
+        self.next_commit: Optional[asyncio.Future] = None
+
+    def notify(self, message_id: int):
+        if self.next_commit is not None:
+            if not self.next_commit.done():
+                self.next_commit.set_result(message_id)
+            self.next_commit = None
+        while self.waiters and self.waiters[0][0] <= message_id:
+            future = heapq.heappop(self.waiters)[2]
+            if not future.done():
+                future.set_result(None)
+
+    async def wait(self, message_id: int, timeout: Optional[float] = None) -> bool:
+        """
+        returns False if message_id was not reached in timeout seconds
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (message_id, next(self.sequence), future))
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._forget()
+            return False
+        return True
+
+    async def wait_next(self, timeout: Optional[float] = None) -> bool:
+        """
+        returns False if nothing was committed in timeout seconds.
+        the shared future is not cancelled on timeout, other subscribers may still wait for it
+        """
+        if self.next_commit is None:
+            self.next_commit = asyncio.get_running_loop().create_future()
+        done, _ = await asyncio.wait((self.next_commit,), timeout=timeout)
+        return bool(done)
+
+    def _forget(self):
+        """
+        waiters which timed out are dropped from heap once they are the majority of it
+        """
+        self.abandoned += 1
+        if self.abandoned * 2 < len(self.waiters):
+            return
+        self.waiters = [waiter for waiter in self.waiters if not waiter[2].done()]
+        heapq.heapify(self.waiters)
+        self.abandoned = 0
+
+
+class MessageRegistry(collections.OrderedDict):
+    def __init__(self, log: Optional[MessageLog] = None, awaited_limit: Optional[int] = None,
+                 snapshots: Optional[SnapshotStore] = None):
+        """
+        awaited_limit is the maximum number of messages received ahead of missing ones
+        messages up to compacted_id are not kept in memory and are read from snapshot
+        """
         super().__init__()
+        self.message_id: int = 0
+        self.compacted_id: int = 0
+        self.awaited_messages: dict[int, Message] = dict()
+        self.awaited_limit = awaited_limit
+        self.progress_at: float = time.monotonic()
+        self.log = log
+        self.snapshots = snapshots
+        self.commits = CommitNotifier()
+
+    def recover(self) -> int:
+        """
+        load messages from log in order to resume from the last logged message_id,
+        messages which are in snapshot are not loaded to memory
+        """
+        if self.snapshots is not None:
+            self.message_id = self.compacted_id = self.snapshots.last_id
+        if self.log is None:
+            return self.message_id
+        for message in self.log.replay():
+            if message.meta.message_id <= self.message_id:
+                continue
+            self._store(message)
+            self.message_id = message.meta.message_id
+
+        return self.message_id
+
+    async def snapshot(self, retain: int, pinned: Callable[[], Optional[int]] = lambda: None):
+        """
+        write messages registered since the last snapshot to a new one in a thread,
+        then drop log segments and messages in memory it covers, except the last retain messages.
+        pinned is the least id of messages which are still used (e.g. awaited by write concern), they are kept too
+        """
+        last_id = self.message_id
+        if self.snapshots is None or last_id <= self.snapshots.last_id:
+            return
+        # registry is changed by the event loop while snapshot is written, so only file i/o is left to the thread
+        messages = list(self.since(since_id=self.snapshots.last_id, limit=last_id - self.snapshots.last_id))
+        await asyncio.to_thread(self.snapshots.write, messages=messages, last_id=last_id)
+        if self.log is not None:
+            self.log.truncate(until_id=last_id)
+        until_id = self.message_id - retain
+        pinned_id = pinned()
+        if pinned_id is not None:
+            until_id = min(until_id, pinned_id - 1)
+        self.compact(until_id=until_id)
+
+    def compact(self, until_id: int):
+        """
+        drop messages up to until_id from memory, only those which are in snapshot
+        """
+        if self.snapshots is None:
+            return
+        self._drop(until_id=min(until_id, self.snapshots.last_id, self.message_id))
+
+    def _drop(self, until_id: int):
+        while self.compacted_id < until_id:
+            self.compacted_id += 1
+            self.pop(self.compacted_id, None)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
 
     def register(self, message: Message) -> int:
         self.message_id += 1
-        self[self.message_id] = message.register(message_id=self.message_id)
+        self._store(message.register(message_id=self.message_id))
+        self._commit(after_id=self.message_id-1)
 
         return self.message_id
 
+    def register_batch(self, messages: list[Message]) -> list[int]:
+        """
+        messages are registered under contiguous range of ids with the same registration time
+        """
+        registered_at = datetime.now()
+        first_id = self.message_id + 1
+        for message in messages:
+            self.message_id += 1
+            self._store(message.register(message_id=self.message_id, registered_at=registered_at))
+        self._commit(after_id=first_id-1)
+
+        return list(range(first_id, self.message_id + 1))
+
     def add(self, message: Message) -> int:
         """
-        message added in order using message.meta.id attribute using recursive exhaustion
+        message added in order using message.meta.id attribute by exhausting awaited list
         """
-        if message.meta.message_id in [*self.awaited_messages, *self]:
-            raise MessageDuplicationError(message_id=message.meta.message_id)
-        self.awaited_messages[message.meta.message_id] = message
+        message_id = message.meta.message_id
+        if message_id <= self.message_id or message_id in self.awaited_messages:
+            raise MessageDuplicationError(message_id=message_id)
+        if self._is_awaited_list_full(message_id=message_id):
+            raise ReorderBufferOverflowError(message_ids=[message_id])
+        self._await(message)
+        last_id = self.message_id
         self._exhaust_awaited_list()
-        return message.meta.message_id
+        self._commit(after_id=last_id)
+        return message_id
+
+    def add_batch(self, messages: list[Message]) -> list[int]:
+        """
+        messages already present in registry are skipped
+        messages which don't fit into full awaited list are rejected after the rest of the batch is added
+        returns ids of added messages
+        """
+        added = []
+        rejected = []
+        last_id = self.message_id
+        for message in messages:
+            message_id = message.meta.message_id
+            if message_id <= self.message_id or message_id in self.awaited_messages:
+                continue
+            if self._is_awaited_list_full(message_id=message_id):
+                rejected.append(message_id)
+                continue
+            self._await(message)
+            added.append(message_id)
+            if message_id == self.message_id + 1:
+                self._exhaust_awaited_list()
+        self._commit(after_id=last_id)
+        if rejected:
+            raise ReorderBufferOverflowError(message_ids=rejected)
+        return added
+
+    def gap(self, timeout: float) -> Optional[tuple[int, int]]:
+        """
+        range of missing ids [first, last] which blocks awaited messages for more than timeout seconds
+        """
+        if not self.awaited_messages or time.monotonic() - self.progress_at < timeout:
+            return None
+        return self.message_id + 1, min(self.awaited_messages) - 1
+
+    def _is_awaited_list_full(self, message_id: int) -> bool:
+        """
+        next message is always accepted since it is exhausted immediately
+        """
+        return self.awaited_limit is not None \
+            and len(self.awaited_messages) >= self.awaited_limit \
+            and message_id != self.message_id + 1
+
+    def _await(self, message: Message):
+        if not self.awaited_messages:
+            self.progress_at = time.monotonic()
+        self.awaited_messages[message.meta.message_id] = message
 
     def _exhaust_awaited_list(self):
-        try:
-            self[self.message_id+1] = self.awaited_messages.pop(self.message_id+1)
+        if not self.awaited_messages:
+            return
+        last_id = self.message_id
+        while self.message_id+1 in self.awaited_messages:
+            self._store(self.awaited_messages.pop(self.message_id+1))
             self.message_id += 1
-            self._exhaust_awaited_list()
-        except KeyError:
+        if self.message_id > last_id:
+            self.progress_at = time.monotonic()
+
+    def ack(self, message_id: int, server_id: str) -> bool:
+        """
+        mark message as delivered to server
+        returns False if it was already marked or message is compacted
+        """
+        if message_id <= self.compacted_id:
+            return False
+        registered_to = self[message_id].meta.registered_to
+        if server_id in registered_to:
+            return False
+        registered_to.add(server_id)
+        return True
+
+    def acks(self, message_id: int) -> int:
+        """
+        number of servers message was delivered to
+        """
+        if message_id <= self.compacted_id:
+            return 0
+        return len(self[message_id].meta.registered_to)
+
+    def memory_usage(self, sample: int = 100) -> int:
+        """
+        estimated number of bytes taken by stored messages, average message size is measured on the last ones
+        """
+        sampled = [self[message_id] for message_id in range(max(self.message_id - sample, 0) + 1, self.message_id + 1)
+                   if message_id in self]
+        if not sampled:
+            return sys.getsizeof(self)
+        sampled_size = sum(sys.getsizeof(message) + sys.getsizeof(message.__dict__) + sys.getsizeof(message.message)
+                           + sys.getsizeof(message.meta) + sys.getsizeof(message.meta.__dict__)
+                           + sys.getsizeof(message.meta.registered_at) + sys.getsizeof(message.meta.registered_to)
+                           + sys.getsizeof(message._encoded)
+                           for message in sampled)
+        return sys.getsizeof(self) + sampled_size * len(self) // len(sampled)
+
+    def _store(self, message: Message):
+        self[message.meta.message_id] = message
+
+    def _commit(self, after_id: int):
+        """
+        messages which became contiguous after given id are logged and coroutines waiting for them are woken
+        """
+        self._write_log(after_id=after_id)
+        if self.message_id > after_id:
+            self.commits.notify(message_id=self.message_id)
+
+    async def wait_for(self, message_id: int, timeout: Optional[float] = None) -> bool:
+        """
+        wait until registry has every message up to message_id, returns False if it didn't happen in timeout seconds
+        """
+        if message_id <= self.message_id:
+            return True
+        return await self.commits.wait(message_id=message_id, timeout=timeout)
+
+    async def wait_after(self, since_id: int, timeout: Optional[float] = None) -> bool:
+        """
+        wait until registry has a message with id greater than since_id (long-poll, subscriptions),
+        returns False if it didn't happen in timeout seconds
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self.message_id <= since_id:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if (remaining is not None and remaining <= 0) or not await self.commits.wait_next(timeout=remaining):
+                return False
+        return True
+
+    def _write_log(self, after_id: int):
+        """
+        append messages which became contiguous after given id to the log
+        """
+        if self.log is None or after_id >= self.message_id:
             return
+        self.log.append([self[message_id] for message_id in range(after_id+1, self.message_id+1)])
+
+    async def persist(self):
+        """
+        wait until logged messages are on disk, before they are acknowledged
+        """
+        if self.log is not None:
+            await self.log.sync()
 
     def dict(self) -> dict:
         result = {}
@@ -40,5 +319,43 @@ class MessageRegistry(collections.OrderedDict):
             result[key] = value.dict()
         return result
 
-    def list(self):
-        return [value.dict() for key, value in self.items()]
\ No newline at end of file
+    def since(self, since_id: int = 0, limit: Optional[int] = None) -> Iterator[Message]:
+        """
+        iterate over contiguous messages with ids greater than since_id (at most limit of them)
+        ids are contiguous so position of since_id is found without scanning registry.
+        compacted messages are read from snapshot (also if registry is compacted while iterating)
+        """
+        last_id = self.message_id if limit is None else min(self.message_id, since_id + limit)
+        message_id = max(since_id, 0)
+        while message_id < last_id:
+            if message_id < self.compacted_id:
+                compacted = self._read_snapshot(since_id=message_id, until_id=min(self.compacted_id, last_id))
+                yield from compacted
+                message_id = compacted[-1].meta.message_id
+            else:
+                message_id += 1
+                yield self[message_id]
+
+    async def read(self, since_id: int = 0, limit: Optional[int] = None) -> list[Message]:
+        """
+        messages since() iterates over, compacted ones are read from snapshot in a thread
+        """
+        last_id = self.message_id if limit is None else min(self.message_id, since_id + limit)
+        message_id, compacted = max(since_id, 0), []
+        if message_id < min(self.compacted_id, last_id):
+            compacted = await asyncio.to_thread(self._read_snapshot, since_id=message_id,
+                                                until_id=min(self.compacted_id, last_id))
+            message_id = compacted[-1].meta.message_id
+        return compacted + list(self.since(since_id=message_id, limit=last_id - message_id))
+
+    def _read_snapshot(self, since_id: int, until_id: int) -> list[Message]:
+        """
+        compacted messages with ids in (since_id, until_id], every one of them must be in snapshot
+        """
+        messages = list(self.snapshots.read(since_id=since_id, until_id=until_id))
+        if len(messages) != until_id - since_id:
+            raise ValueError(f'Snapshot has {len(messages)} of compacted messages {since_id + 1}-{until_id}')
+        return messages
+
+    def list(self, since_id: int = 0, limit: Optional[int] = None):
+        return [value.dict() for value in self.since(since_id=since_id, limit=limit)]
\ No newline at end of file
@@ -1,4 +1,6 @@
 import collections
+from datetime import datetime
+from typing import Callable, Optional
 from models.models import SecondaryServer, ServerStatus
 
 
@@ -7,17 +9,36 @@ class ServiceRegistry(collections.UserDict):
         super().__init__(*args, **kwargs)
         self.servers_number: int = 0
         self.healthy_servers_number: int = 0
+        self.on_register: list[Callable[[SecondaryServer], None]] = []
+        self.on_remove: list[Callable[[str], None]] = []
+        self.on_status_change: list[Callable[[SecondaryServer], None]] = []
 
     @property
     def quorum(self):
         return (self.healthy_servers_number+1)//2 + 1
 
+    def subscribe(self,
+                  on_register: Optional[Callable[[SecondaryServer], None]] = None,
+                  on_remove: Optional[Callable[[str], None]] = None,
+                  on_status_change: Optional[Callable[[SecondaryServer], None]] = None):
+        """
+        callbacks are called after secondary is added to or removed from registry or its status is changed
+        """
+        if on_register:
+            self.on_register.append(on_register)
+        if on_remove:
+            self.on_remove.append(on_remove)
+        if on_status_change:
+            self.on_status_change.append(on_status_change)
+
     def register(self, service: SecondaryServer) -> str:
         if service.id in self:
             self.remove(server_id=service.id)
         self[service.id] = service
         self.servers_number += 1
         self.healthy_servers_number += 1
+        for callback in self.on_register:
+            callback(service)
 
         return service.id
 
@@ -25,12 +46,25 @@ class ServiceRegistry(collections.UserDict):
         server = self.pop(server_id)
         self.servers_number -= 1
         self.healthy_servers_number -= server.status.value
+        for callback in self.on_remove:
+            callback(server_id)
 
     def update_status(self, server_id: str, new_status: ServerStatus):
         if self[server_id].status == new_status:
             return
         self.healthy_servers_number += new_status.value - self[server_id].status.value
         self[server_id].status = new_status
+        self[server_id].last_status_change = datetime.now()
+        for callback in self.on_status_change:
+            callback(self[server_id])
+
+    def replace(self, servers: list[SecondaryServer]):
+        """
+        set registry to a copy of another one (e.g. of owner worker) without calling callbacks
+        """
+        self.data = {server.id: server for server in servers}
+        self.servers_number = len(servers)
+        self.healthy_servers_number = sum(server.status.value for server in servers)
 
     def dict(self) -> dict:
         result = {}
@@ -0,0 +1,111 @@
+import os
+import shutil
+from typing import BinaryIO, Iterable, Iterator, Optional
+from models.models import Message
+from registries.message_log import MessageLog
+
+
+class SnapshotStore:
+    """
+    compact copy of registry: messages 1..last_id as log records (json lines) in one file named after last_id.
+    new snapshot is the previous one with messages registered after it appended, it is written to temporary file
+    and renamed, so there is always a complete snapshot. the previous snapshot is kept while it may still be read.
+    byte offset of every INDEX_STEP-th message is kept in memory to read snapshot from any message id
+    """
+    SUFFIX = '.snapshot'
+    INDEX_STEP = 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: Optional[str] = None
+        self.last_id: int = 0
+        self.index: list[int] = []
+        os.makedirs(self.path, exist_ok=True)
+        self.load()
+
+    def snapshots(self) -> list[str]:
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(self.SUFFIX))
+
+    def load(self):
+        """
+        use the latest complete snapshot
+        """
+        snapshots = self.snapshots()
+        if not snapshots:
+            return
+        index, offset = [], 0
+        with open(snapshots[-1], 'rb') as file:
+            for position, line in enumerate(file):
+                if position % self.INDEX_STEP == 0:
+                    index.append(offset)
+                offset += len(line)
+        self.file = snapshots[-1]
+        self.last_id = int(os.path.basename(self.file)[:-len(self.SUFFIX)])
+        self.index = index
+
+    def write(self, messages: Iterable[Message], last_id: int):
+        """
+        messages are the ones registered after the current snapshot up to last_id.
+        blocking (copies the current snapshot), so it is called from a thread
+        """
+        for name in os.listdir(self.path):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.path, name))
+        file = os.path.join(self.path, f'{last_id:020d}{self.SUFFIX}')
+        if self.file is not None:
+            shutil.copyfile(self.file, f'{file}.tmp')
+        index = list(self.index)
+        with open(f'{file}.tmp', 'ab') as snapshot:
+            offset = snapshot.tell()
+            position = self.last_id
+            chunk = []
+            for message in messages:
+                if position % self.INDEX_STEP == 0:
+                    index.append(offset + sum(len(record) for record in chunk))
+                chunk.append(MessageLog.encode(message))
+                position += 1
+                if len(chunk) == self.INDEX_STEP:
+                    offset += self._write_chunk(snapshot, chunk)
+            offset += self._write_chunk(snapshot, chunk)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        if position != last_id:
+            os.remove(f'{file}.tmp')
+            raise ValueError(f'Snapshot up to message {last_id} got messages up to {position}')
+        os.rename(f'{file}.tmp', file)
+        previous, self.file, self.last_id, self.index = self.file, file, last_id, index
+        for outdated in self.snapshots():
+            if outdated not in (previous, file):
+                os.remove(outdated)
+
+    @staticmethod
+    def _write_chunk(snapshot: BinaryIO, chunk: list[bytes]) -> int:
+        data = b''.join(chunk)
+        snapshot.write(data)
+        chunk.clear()
+        return len(data)
+
+    def offset(self, since_id: int) -> int:
+        """
+        byte offset of the first message with id greater than since_id
+        """
+        with open(self.file, 'rb') as file:
+            return self._seek(file, since_id=since_id)
+
+    def _seek(self, file: BinaryIO, since_id: int) -> int:
+        block = min(since_id // self.INDEX_STEP, len(self.index) - 1)
+        offset = file.seek(self.index[block])
+        for _ in range(since_id - block * self.INDEX_STEP):
+            offset += len(file.readline())
+        return offset
+
+    def read(self, since_id: int, until_id: int) -> Iterator[Message]:
+        """
+        messages with ids in (since_id, until_id]
+        """
+        if self.file is None or since_id >= until_id:
+            return
+        with open(self.file, 'rb') as file:
+            self._seek(file, since_id=since_id)
+            for _ in range(min(until_id, self.last_id) - since_id):
+                yield MessageLog.decode(file.readline())
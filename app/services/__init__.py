@@ -1,10 +1,25 @@
 import os
 from typing import Union
+from config import CONFIG
+from services.ipc import acquire_ownership
 from services.server import Master, Secondary
+from services.multiworker import WorkerOwner, MasterProxy
 from models.models import ServiceType
 
 
-SERVICE: Union[Master, Secondary] = {
-        ServiceType.MASTER: Master,
+def create_master() -> Union[Master, WorkerOwner, MasterProxy]:
+    """
+    with MASTER_WORKERS_SOCKET every worker process of master calls it:
+    the first one becomes owner of registries, others forward requests to it
+    """
+    if not CONFIG.MASTER_WORKERS_SOCKET:
+        return Master()
+    if acquire_ownership(path=f'{CONFIG.MASTER_WORKERS_SOCKET}.lock') is None:
+        return MasterProxy(path=CONFIG.MASTER_WORKERS_SOCKET)
+    return WorkerOwner(path=CONFIG.MASTER_WORKERS_SOCKET)
+
+
+SERVICE: Union[Master, MasterProxy, Secondary] = {
+        ServiceType.MASTER: create_master,
         ServiceType.SECONDARY: Secondary
     }[ServiceType(os.getenv("SERVICE_TYPE"))]()
@@ -0,0 +1,76 @@
+import asyncio
+from typing import Optional
+
+
+class AckWaiter:
+    __slots__ = ('wc', 'remaining', 'future')
+
+    def __init__(self, wc: int):
+        self.wc = wc
+        self.remaining = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class AckTracker:
+    """
+    counts acknowledgements of messages awaited by clients
+    waiter is resolved when every its message is acknowledged by wc servers
+    only messages below their write concern are kept, so every acknowledgement is processed in O(1)
+    """
+    def __init__(self):
+        self.pending: dict[int, list] = dict()
+
+    def track(self, message_ids: list[int], acks: list[int], wc: int) -> AckWaiter:
+        """
+        acks is the number of acknowledgements every message already has
+        """
+        waiter = AckWaiter(wc=wc)
+        for message_id, count in zip(message_ids, acks):
+            if count < wc:
+                self.pending[message_id] = [count, waiter]
+                waiter.remaining += 1
+        if waiter.remaining == 0:
+            waiter.future.set_result(None)
+        return waiter
+
+    def lowest_pending(self) -> Optional[int]:
+        """
+        the least id of messages clients still wait acknowledgements of, they must stay in registry
+        """
+        return min(self.pending, default=None)
+
+    def ack(self, message_id: int):
+        entry = self.pending.get(message_id)
+        if entry is None:
+            return
+        entry[0] += 1
+        waiter: AckWaiter = entry[1]
+        if entry[0] < waiter.wc:
+            return
+        del self.pending[message_id]
+        waiter.remaining -= 1
+        if waiter.remaining == 0 and not waiter.future.done():
+            waiter.future.set_result(None)
+
+    async def wait(self, waiter: AckWaiter, message_ids: list[int], timeout: Optional[float] = None) -> int:
+        """
+        wait until write concern is reached or timeout passes
+        returns the least number of acknowledgements among messages
+        """
+        try:
+            await asyncio.wait_for(waiter.future, timeout=timeout)
+            return waiter.wc
+        except asyncio.TimeoutError:
+            return min((entry[0] for entry in (self.pending.get(message_id) for message_id in message_ids)
+                        if entry is not None and entry[1] is waiter), default=waiter.wc)
+        finally:
+            self.discard(waiter=waiter, message_ids=message_ids)
+
+    def discard(self, waiter: AckWaiter, message_ids: list[int]):
+        if waiter.remaining == 0:
+            return
+        for message_id in message_ids:
+            entry = self.pending.get(message_id)
+            if entry is not None and entry[1] is waiter:
+                del self.pending[message_id]
+        waiter.remaining = 0
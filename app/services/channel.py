@@ -0,0 +1,73 @@
+import asyncio
+import collections
+from typing import AsyncIterator, Callable
+from models.models import Message
+from models.wire_format import MEDIA_TYPE, encode_frame
+from utils.exceptions import ChannelClosedError
+from utils.serialization import join_array
+
+
+class ReplicationChannel:
+    """
+    long-lived replication stream from master to one secondary.
+    every frame is a json array of messages on its own line, frames are written to
+    an open chunked response, so there is no request per batch.
+    secondary answers with cumulative acks (its highest contiguous message id) on a separate stream,
+    one ack resolves all frames up to that id.
+    if binary is set, frames are length-prefixed batches of binary wire format instead of json lines
+    """
+    def __init__(self, service_id: str, on_ack: Callable[[int], None], binary: bool = False):
+        self.service_id = service_id
+        self.on_ack = on_ack
+        self.binary = binary
+        self.media_type = MEDIA_TYPE if binary else 'application/x-ndjson'
+        self.frames: asyncio.Queue[bytes] = asyncio.Queue()
+        self.pending: collections.deque[list] = collections.deque()
+        self.acked_id: int = 0
+        self.closed: bool = False
+
+    async def send(self, messages: list[Message], timeout: float):
+        """
+        returns when secondary acknowledged every message of the frame
+        """
+        if self.closed:
+            raise ChannelClosedError(service_id=self.service_id)
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append([messages[0].meta.message_id, messages[-1].meta.message_id, future])
+        if self.binary:
+            self.frames.put_nowait(encode_frame(messages))
+        else:
+            self.frames.put_nowait(join_array(message.encode() for message in messages) + b'\n')
+        await asyncio.wait_for(future, timeout=timeout)
+
+    def ack(self, acked_id: int):
+        """
+        messages of sent frames up to acked_id are acknowledged one by one with on_ack
+        """
+        self.acked_id = max(self.acked_id, acked_id)
+        while self.pending and self.pending[0][0] <= acked_id:
+            frame = self.pending[0]
+            first_id, last_id, future = frame
+            for message_id in range(first_id, min(last_id, acked_id) + 1):
+                self.on_ack(message_id)
+            if last_id > acked_id:
+                frame[0] = acked_id + 1
+                break
+            self.pending.popleft()
+            if not future.done():
+                future.set_result(None)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        while True:
+            frame = await self.frames.get()
+            if not frame:
+                return
+            yield frame
+
+    def close(self):
+        self.closed = True
+        self.frames.put_nowait(b'')
+        while self.pending:
+            _, _, future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(ChannelClosedError(service_id=self.service_id))
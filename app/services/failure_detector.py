@@ -0,0 +1,76 @@
+import collections
+import math
+import time
+from typing import Optional
+
+
+class PhiAccrualDetector:
+    """
+    phi accrual failure detector of one secondary.
+    intervals between heartbeats (acknowledged requests and healthchecks) are kept in a sliding window,
+    phi is a suspicion level that the next heartbeat is not coming: -log10 of probability
+    to wait longer than already elapsed time, assuming normally distributed intervals.
+    acceptable_pause is added to expected interval (secondary is not probed while it acks replication),
+    min_std keeps a few lucky regular intervals from making detector too sensitive
+    """
+    def __init__(self, window: int, min_std: float, acceptable_pause: float):
+        self.intervals: collections.deque[float] = collections.deque(maxlen=window)
+        self.min_std = min_std
+        self.acceptable_pause = acceptable_pause
+        self.last_heartbeat: float = time.monotonic()
+
+    def heartbeat(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.intervals.append(now - self.last_heartbeat)
+        self.last_heartbeat = now
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        return (time.monotonic() if now is None else now) - self.last_heartbeat
+
+    def phi(self, now: Optional[float] = None) -> float:
+        if self.intervals:
+            mean = sum(self.intervals) / len(self.intervals)
+            std = math.sqrt(sum((interval - mean) ** 2 for interval in self.intervals) / len(self.intervals))
+        else:
+            mean, std = 0, 0
+        z = (self.elapsed(now) - mean - self.acceptable_pause) / max(std, self.min_std)
+        p_later = math.erfc(z / math.sqrt(2)) / 2
+        return -math.log10(p_later) if p_later > 0 else math.inf
+
+
+class FailureDetector(collections.UserDict):
+    """
+    phi accrual detectors of all secondaries by their ids
+    """
+    def __init__(self, threshold: float, window: int, min_std: float, acceptable_pause: float):
+        super().__init__()
+        self.threshold = threshold
+        self.window = window
+        self.min_std = min_std
+        self.acceptable_pause = acceptable_pause
+
+    def watch(self, server_id: str):
+        self[server_id] = PhiAccrualDetector(window=self.window,
+                                             min_std=self.min_std,
+                                             acceptable_pause=self.acceptable_pause)
+
+    def heartbeat(self, server_id: str):
+        detector = self.get(server_id)
+        if detector:
+            detector.heartbeat()
+
+    def is_idle(self, server_id: str, after: float) -> bool:
+        """
+        secondary without heartbeats for more than after seconds has to be probed explicitly
+        """
+        return self[server_id].elapsed() >= after
+
+    def is_available(self, server_id: str) -> bool:
+        return self[server_id].phi() < self.threshold
+
+    def status(self, server_id: str) -> dict:
+        detector = self.get(server_id)
+        if not detector:
+            return {}
+        return {'phi': round(min(detector.phi(), 1e6), 3),
+                'last_heartbeat_ago': round(detector.elapsed(), 3)}
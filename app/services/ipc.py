@@ -0,0 +1,169 @@
+import asyncio
+import fcntl
+import itertools
+import logging
+import os
+import struct
+from typing import Awaitable, Callable, Optional
+from utils.exceptions import OwnerWorkerError
+from utils.serialization import dumps, loads
+
+FRAME_HEADER = struct.Struct('!II')
+Handler = Callable[..., Awaitable[tuple[dict, bytes]]]
+
+
+def write_frame(writer: asyncio.StreamWriter, header: dict, body: bytes = b''):
+    """
+    frame is a json header and raw body (e.g. already encoded messages), both prefixed with their lengths
+    """
+    encoded = dumps(header)
+    writer.write(FRAME_HEADER.pack(len(encoded), len(body)) + encoded + body)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    header_size, body_size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    data = await reader.readexactly(header_size + body_size)
+    return loads(data[:header_size]), data[header_size:]
+
+
+def acquire_ownership(path: str) -> Optional[int]:
+    """
+    the first worker process which locks the file becomes owner, lock is held until the process exits.
+    returns descriptor of locked file or None if another process owns it
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class IpcServer:
+    """
+    unix socket server of the owner worker.
+    request {'op', 'id', 'args'} is answered with {'id', 'result'} or {'id', 'error'},
+    request without id is not answered; events are pushed to all connected workers with broadcast
+    """
+    def __init__(self, path: str, handlers: dict[str, Handler],
+                 on_connect: Optional[Callable[[asyncio.StreamWriter], None]] = None,
+                 on_disconnect: Optional[Callable[[asyncio.StreamWriter], None]] = None):
+        self.path = path
+        self.handlers = handlers
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.connections: set[asyncio.StreamWriter] = set()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        for writer in self.connections:
+            writer.close()
+
+    def broadcast(self, header: dict, body: bytes = b''):
+        for writer in self.connections:
+            write_frame(writer, header, body)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections.add(writer)
+        if self.on_connect:
+            self.on_connect(writer)
+        try:
+            while True:
+                header, body = await read_frame(reader)
+                asyncio.get_running_loop().create_task(self._handle(writer, header, body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            if self.on_disconnect:
+                self.on_disconnect(writer)
+            writer.close()
+
+    async def _handle(self, writer: asyncio.StreamWriter, header: dict, body: bytes):
+        response, response_body = {'id': header.get('id')}, b''
+        try:
+            response['result'], response_body = await self.handlers[header['op']](
+                writer, body=body, **header.get('args', {}))
+        except Exception as e:
+            response['error'] = {
+                'kind': type(e).__name__,
+                'error': str(e),
+                'status_code': getattr(e, 'status_code', 500),
+                'details': {key: value for key, value in vars(e).items()
+                            if isinstance(value, (str, int, float, bool, list)) or value is None}
+            }
+            if header.get('id') is None:
+                logging.getLogger("uvicorn.error").error(f"Request {header['op']} of worker failed: {e!r}")
+        if header.get('id') is not None and not writer.is_closing():
+            write_frame(writer, response, response_body)
+
+
+class IpcClient:
+    """
+    connection of a worker to the owner worker, calls are multiplexed by request id
+    """
+    def __init__(self, path: str, on_event: Callable[[dict, bytes], None]):
+        self.path = path
+        self.on_event = on_event
+        self.ids = itertools.count(1)
+        self.pending: dict[int, asyncio.Future] = dict()
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.connected = asyncio.Event()
+
+    async def connect(self, retry_interval: float):
+        """
+        (re)connect to the owner whenever connection is lost
+        """
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(path=self.path)
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(retry_interval)
+                continue
+            self.connected.set()
+            try:
+                while True:
+                    header, body = await read_frame(reader)
+                    future = self.pending.pop(header['id'], None) if 'id' in header else None
+                    if future is None:
+                        self.on_event(header, body)
+                    elif future.done():
+                        continue
+                    elif 'error' in header:
+                        future.set_exception(OwnerWorkerError(**header['error']))
+                    else:
+                        future.set_result((header['result'], body))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            self.connected.clear()
+            self.writer.close()
+            self.writer = None
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(OwnerWorkerError(error='Connection to owner worker was lost'))
+            self.pending.clear()
+            self.on_event({'event': 'disconnected'}, b'')
+            await asyncio.sleep(retry_interval)
+
+    async def call(self, op: str, body: bytes = b'', **args) -> tuple[dict, bytes]:
+        if self.writer is None:
+            raise OwnerWorkerError(error='Owner worker is not available')
+        request_id = next(self.ids)
+        future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        write_frame(self.writer, {'op': op, 'id': request_id, 'args': args}, body)
+        return await future
+
+    def send(self, op: str, body: bytes = b'', **args):
+        """
+        request without response
+        """
+        if self.writer is not None:
+            write_frame(self.writer, {'op': op, 'args': args}, body)
@@ -0,0 +1,391 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+from config import CONFIG
+from config.config import DEFAULT_TOPIC, ReplicationFormat
+from models.models import Message, MessageMeta, SecondaryServer
+from registries import MESSAGE_REGISTRIES, SECONDARIES_REGISTRY
+from services.channel import ReplicationChannel
+from services.ipc import IpcServer, IpcClient, write_frame
+from services.server import Master, Server
+from utils.exceptions import AuthorizationError, ReadOnlyException, UnexpectedResponse, WriteConcernTimeoutError
+
+
+class WorkerOwner(Master):
+    """
+    master worker process which owns message registry, id sequence, replication and write concern tracking.
+    other worker processes (MasterProxy) send client writes, reads and secondary registrations to it
+    through unix socket, so messages of all workers are ordered by one sequencer
+    """
+    def __init__(self, path: str):
+        super().__init__()
+        self.ipc = IpcServer(path=path,
+                             handlers={
+                                 'register': self._register,
+                                 'register_service': self._register_service,
+                                 'secondaries': self._secondaries,
+                                 'reader': self._reader,
+                                 'snapshot': self._snapshot_file,
+                                 'read': self._read,
+                                 'wait': self._wait,
+                                 'wait_for': self._wait_for,
+                                 'open_stream': self._open_stream,
+                                 'close_stream': self._close_stream,
+                                 'ack': self._ack,
+                                 'metrics': self._metrics
+                             },
+                             on_connect=self._send_secondaries,
+                             on_disconnect=self._close_streams)
+        self.streams: dict[asyncio.StreamWriter, dict[str, ReplicationChannel]] = dict()
+        self.snapshot_scheduled: bool = False
+        SECONDARIES_REGISTRY.subscribe(on_register=self._schedule_snapshot,
+                                       on_remove=self._schedule_snapshot,
+                                       on_status_change=self._schedule_snapshot)
+
+    def start(self):
+        super().start()
+        asyncio.get_event_loop().create_task(self.ipc.start())
+
+    async def stop(self):
+        self.ipc.close()
+        await super().stop()
+
+    def _snapshot(self) -> dict:
+        return {'event': 'secondaries',
+                'epoch': self.epoch,
+                'data': [server.model_dump(mode='json') for server in SECONDARIES_REGISTRY.values()]}
+
+    def _schedule_snapshot(self, *_):
+        """
+        workers get a copy of secondaries registry once per loop iteration however many changes were made
+        """
+        if self.snapshot_scheduled:
+            return
+        self.snapshot_scheduled = True
+        asyncio.get_running_loop().call_soon(self._broadcast_snapshot)
+
+    def _broadcast_snapshot(self):
+        self.snapshot_scheduled = False
+        self.ipc.broadcast(self._snapshot())
+
+    def _send_secondaries(self, connection: asyncio.StreamWriter):
+        write_frame(connection, self._snapshot())
+
+    async def _register(self, connection: asyncio.StreamWriter, body: bytes, messages: list[str], wc: int,
+                        topic: str = DEFAULT_TOPIC):
+        registered = [Message(message=message) for message in messages]
+        result = {}
+        try:
+            await self.register_messages(api_key=CONFIG.CLIENT_TOKEN, messages=registered, wc=wc, topic=topic)
+        except WriteConcernTimeoutError as e:
+            result['acks'] = e.acks
+        result['meta'] = [MESSAGE_REGISTRIES[topic][message.meta.message_id].meta.dict() for message in registered]
+        return result, b''
+
+    async def _register_service(self, connection: asyncio.StreamWriter, body: bytes, service: dict, last_id: int,
+                                last_ids: Optional[dict[str, int]] = None):
+        result = await self.register_service(service=SecondaryServer.model_validate(service),
+                                             api_key=CONFIG.SERVICE_TOKEN,
+                                             last_id=last_id,
+                                             last_ids=last_ids)
+        return result, b''
+
+    async def _secondaries(self, connection: asyncio.StreamWriter, body: bytes):
+        return {'data': await self.list_secondaries(api_key=CONFIG.CLIENT_TOKEN)}, b''
+
+    async def _reader(self, connection: asyncio.StreamWriter, body: bytes, min_id: int, topic: str = DEFAULT_TOPIC):
+        return {'data': await self.pick_reader(api_key=CONFIG.CLIENT_TOKEN, min_id=min_id, topic=topic)}, b''
+
+    async def _snapshot_file(self, connection: asyncio.StreamWriter, body: bytes, since_id: int,
+                             topic: str = DEFAULT_TOPIC):
+        return {'data': await self.get_snapshot(api_key=CONFIG.SERVICE_TOKEN, since_id=since_id, topic=topic)}, b''
+
+    async def _read(self, connection: asyncio.StreamWriter, body: bytes, since_id: int, limit: Optional[int],
+                    topic: str = DEFAULT_TOPIC):
+        messages, last_id = await self.read_messages(api_key=CONFIG.SERVICE_TOKEN, since_id=since_id, limit=limit,
+                                                     topic=topic)
+        return {'last_id': last_id}, b'\n'.join(messages)
+
+    async def _wait(self, connection: asyncio.StreamWriter, body: bytes, since_id: int, timeout: float,
+                    topic: str = DEFAULT_TOPIC):
+        return {'data': await self.wait_after(api_key=CONFIG.SERVICE_TOKEN, since_id=since_id, timeout=timeout,
+                                              topic=topic)}, b''
+
+    async def _wait_for(self, connection: asyncio.StreamWriter, body: bytes, min_id: int, timeout: float,
+                        topic: str = DEFAULT_TOPIC):
+        await self.wait_for_message(api_key=CONFIG.SERVICE_TOKEN, min_id=min_id, timeout=timeout, topic=topic)
+        return {}, b''
+
+    async def _open_stream(self, connection: asyncio.StreamWriter, body: bytes, server_id: str):
+        channel = self.open_channel(api_key=CONFIG.SERVICE_TOKEN, server_id=server_id)
+        self.streams.setdefault(connection, dict())[server_id] = channel
+        asyncio.get_running_loop().create_task(self._forward(connection, channel))
+        return {}, b''
+
+    async def _forward(self, connection: asyncio.StreamWriter, channel: ReplicationChannel):
+        try:
+            async for frame in channel.stream():
+                if connection.is_closing():
+                    break
+                write_frame(connection, {'event': 'frame', 'server_id': channel.service_id}, frame)
+        finally:
+            self.close_channel(server_id=channel.service_id, channel=channel)
+            streams = self.streams.get(connection, dict())
+            if streams.get(channel.service_id) is channel:
+                del streams[channel.service_id]
+            if not connection.is_closing():
+                write_frame(connection, {'event': 'frame_end', 'server_id': channel.service_id})
+
+    async def _close_stream(self, connection: asyncio.StreamWriter, body: bytes, server_id: str):
+        channel = self.streams.get(connection, dict()).get(server_id)
+        if channel:
+            self.close_channel(server_id=server_id, channel=channel)
+        return {}, b''
+
+    def _close_streams(self, connection: asyncio.StreamWriter):
+        for server_id, channel in self.streams.pop(connection, dict()).items():
+            self.close_channel(server_id=server_id, channel=channel)
+
+    async def _ack(self, connection: asyncio.StreamWriter, body: bytes, server_id: str, acked_id: int):
+        self.ack_channel(api_key=CONFIG.SERVICE_TOKEN, server_id=server_id, acked_id=acked_id)
+        return {}, b''
+
+    async def _metrics(self, connection: asyncio.StreamWriter, body: bytes):
+        return {}, (await self.render_metrics()).encode()
+
+
+class MasterProxy(Server):
+    """
+    master worker process which parses and validates client requests and sends them to the owner worker.
+    writes of concurrent requests with the same wc are sent to the owner in one request.
+    secondaries registry is a copy pushed by the owner, so wc is validated without asking it.
+    epoch is the one of the owner, worker is not ready until it is connected to the owner.
+    message logs and snapshots are opened only by the owner
+    """
+    owns_storage = False
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.epoch: Optional[str] = None
+        self.owner = IpcClient(path=path, on_event=self._on_event)
+        self.channels: dict[str, ReplicationChannel] = dict()
+        self.batches: dict[tuple[str, int], list[tuple[list[Message], asyncio.Future]]] = dict()
+        self.waits: dict[tuple[str, int], asyncio.Future] = dict()
+
+    def start(self):
+        asyncio.get_event_loop().create_task(self.owner.connect(retry_interval=1))
+
+    @property
+    def is_ready(self) -> bool:
+        return self.epoch is not None
+
+    def end_streams(self):
+        for server_id, channel in list(self.channels.items()):
+            self.close_channel(server_id=server_id, channel=channel)
+
+    def _on_event(self, header: dict, body: bytes):
+        event = header.get('event')
+        if event == 'secondaries':
+            self.epoch = header['epoch']
+            SECONDARIES_REGISTRY.replace([SecondaryServer.model_validate(server) for server in header['data']])
+        elif event == 'frame':
+            channel = self.channels.get(header['server_id'])
+            if channel:
+                channel.frames.put_nowait(body)
+        elif event == 'frame_end':
+            channel = self.channels.get(header['server_id'])
+            if channel:
+                self.close_channel(server_id=header['server_id'], channel=channel)
+        elif event == 'disconnected':
+            self.epoch = None
+            SECONDARIES_REGISTRY.replace([])
+            for server_id, channel in list(self.channels.items()):
+                self.close_channel(server_id=server_id, channel=channel)
+
+    async def render_metrics(self) -> str:
+        """
+        registries, replication and write concern are tracked by the owner, so metrics are the ones of the owner
+        """
+        _, body = await self.owner.call('metrics')
+        return body.decode()
+
+    async def register_message(self, api_key: str, message: Message, wc: int, topic: str = DEFAULT_TOPIC) -> int:
+        if SECONDARIES_REGISTRY.servers_number == 0:
+            raise ReadOnlyException()
+        if not CONFIG.CLIENT_TOKEN == api_key:
+            raise AuthorizationError(service='Message Registration')
+        self.get_message_list(api_key=api_key, topic=topic)
+        await self._register(messages=[message], wc=wc, topic=topic)
+        return message.meta.message_id
+
+    async def register_messages(self, api_key: str, messages: list[Message], wc: int,
+                                topic: str = DEFAULT_TOPIC) -> list[int]:
+        if SECONDARIES_REGISTRY.servers_number == 0:
+            raise ReadOnlyException()
+        if not CONFIG.CLIENT_TOKEN == api_key:
+            raise AuthorizationError(service='Batch Message Registration')
+        self.get_message_list(api_key=api_key, topic=topic)
+        if not messages:
+            return []
+        await self._register(messages=messages, wc=wc, topic=topic)
+        return [message.meta.message_id for message in messages]
+
+    async def _register(self, messages: list[Message], wc: int, topic: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (topic, wc)
+        if key not in self.batches:
+            self.batches[key] = []
+            loop.call_soon(lambda: loop.create_task(self._flush(wc=wc, topic=topic)))
+        self.batches[key].append((messages, future))
+        await future
+
+    async def _flush(self, wc: int, topic: str):
+        batch = self.batches.pop((topic, wc))
+        messages = [message for request_messages, _ in batch for message in request_messages]
+        try:
+            result, _ = await self.owner.call('register', messages=[message.message for message in messages], wc=wc,
+                                              topic=topic)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for message, meta in zip(messages, result['meta']):
+            meta = MessageMeta.model_validate(meta)
+            message.register(message_id=meta.message_id, registered_at=meta.registered_at)
+            message.meta.registered_to = meta.registered_to
+        for request_messages, future in batch:
+            # request may be cancelled while the batch was registered (e.g. on shutdown)
+            if future.done():
+                continue
+            if 'acks' in result:
+                future.set_exception(WriteConcernTimeoutError(
+                    message_ids=[message.meta.message_id for message in request_messages],
+                    wc=wc,
+                    acks=result['acks']
+                ))
+            else:
+                future.set_result(None)
+
+    async def register_service(self, service: SecondaryServer, api_key: str, last_id: int = 0,
+                               last_ids: Optional[dict[str, int]] = None) -> dict:
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Secondary Registration')
+        result, _ = await self.owner.call('register_service', service=service.model_dump(mode='json'),
+                                          last_id=last_id, last_ids=last_ids)
+        return result
+
+    async def list_secondaries(self, api_key: str) -> list[dict]:
+        if not CONFIG.CLIENT_TOKEN == api_key:
+            raise AuthorizationError(service='Get Secondary Registry')
+        result, _ = await self.owner.call('secondaries')
+        return result['data']
+
+    async def pick_reader(self, api_key: str, min_id: int = 0, topic: str = DEFAULT_TOPIC) -> dict:
+        if not CONFIG.CLIENT_TOKEN == api_key:
+            raise AuthorizationError(service='Get Secondary Registry')
+        self.get_message_list(api_key=api_key, topic=topic)
+        result, _ = await self.owner.call('reader', min_id=min_id, topic=topic)
+        return result['data']
+
+    async def get_snapshot(self, api_key: str, since_id: int, topic: str = DEFAULT_TOPIC) -> Optional[dict]:
+        """
+        snapshot is written by the owner, the file is read by this worker directly
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Snapshot')
+        self.get_message_list(api_key=api_key, topic=topic)
+        result, _ = await self.owner.call('snapshot', since_id=since_id, topic=topic)
+        return result['data']
+
+    async def wait_for_message(self, api_key: str, min_id: int, timeout: float, topic: str = DEFAULT_TOPIC):
+        """
+        messages are read from the owner, so it is the owner which waits for them
+        """
+        self.get_message_list(api_key=api_key, topic=topic)
+        await self.owner.call('wait_for', min_id=min_id, timeout=timeout, topic=topic)
+
+    async def wait_after(self, api_key: str, since_id: int, timeout: float, topic: str = DEFAULT_TOPIC) -> bool:
+        """
+        subscribers of this worker at the same position share one wait on the owner,
+        the shared wait may end before timeout of a subscriber which joined it, then the next one is started
+        """
+        self.get_message_list(api_key=api_key, topic=topic)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        key = (topic, since_id)
+        while (remaining := deadline - loop.time()) > 0:
+            wait = self.waits.get(key)
+            if wait is None:
+                wait = asyncio.ensure_future(self.owner.call('wait', since_id=since_id, timeout=remaining, topic=topic))
+                self.waits[key] = wait
+                wait.add_done_callback(lambda _: self.waits.pop(key, None))
+            done, _ = await asyncio.wait((wait,), timeout=remaining)
+            if done and wait.result()[0]['data']:
+                return True
+        return False
+
+    async def read_messages(self, api_key: str, since_id: int = 0, limit: Optional[int] = None,
+                            topic: str = DEFAULT_TOPIC) -> tuple[list[bytes], int]:
+        self.get_message_list(api_key=api_key, topic=topic)
+        result, body = await self.owner.call('read', since_id=since_id, limit=limit, topic=topic)
+        return body.split(b'\n') if body else [], result['last_id']
+
+    def stream_messages(self, api_key: str, since_id: int = 0, limit: Optional[int] = None,
+                        chunk_size: int = 100, topic: str = DEFAULT_TOPIC) -> AsyncIterator[list[bytes]]:
+        """
+        messages are read from the owner in pages of CATCHUP_CHUNK_SIZE
+        """
+        self.get_message_list(api_key=api_key, topic=topic)
+
+        async def chunks() -> AsyncIterator[list[bytes]]:
+            last_id, remaining = since_id, limit
+            while remaining is None or remaining > 0:
+                page = CONFIG.CATCHUP_CHUNK_SIZE if remaining is None else min(remaining, CONFIG.CATCHUP_CHUNK_SIZE)
+                messages, last_id = await self.read_messages(api_key=api_key, since_id=last_id, limit=page,
+                                                             topic=topic)
+                if not messages:
+                    return
+                yield messages
+                if remaining is not None:
+                    remaining -= len(messages)
+
+        return chunks()
+
+    def open_channel(self, api_key: str, server_id: str) -> ReplicationChannel:
+        """
+        replication stream is opened on the owner and its frames are forwarded through this worker
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Replication Stream')
+        if server_id not in SECONDARIES_REGISTRY:
+            raise UnexpectedResponse(service='Replication Stream', status_code=404,
+                                     error=f'Secondary ({server_id}) is not registered')
+        self.close_channel(server_id=server_id)
+        binary = SECONDARIES_REGISTRY[server_id].replication_format == ReplicationFormat.BINARY.value
+        channel = ReplicationChannel(service_id=server_id, on_ack=lambda message_id: None, binary=binary)
+        self.channels[server_id] = channel
+        asyncio.get_running_loop().create_task(self._open_stream(channel=channel))
+        return channel
+
+    async def _open_stream(self, channel: ReplicationChannel):
+        try:
+            await self.owner.call('open_stream', server_id=channel.service_id)
+        except Exception as e:
+            logging.getLogger("uvicorn.error").error(
+                f'Replication stream to {channel.service_id} was not opened on owner worker: {e}')
+            self.close_channel(server_id=channel.service_id, channel=channel)
+
+    def close_channel(self, server_id: str, channel: Optional[ReplicationChannel] = None):
+        if channel is None or self.channels.get(server_id) is channel:
+            channel = self.channels.pop(server_id, None)
+            if channel:
+                self.owner.send('close_stream', server_id=server_id)
+        if channel:
+            channel.close()
+
+    def ack_channel(self, api_key: str, server_id: str, acked_id: int):
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Replication Acks')
+        self.owner.send('ack', server_id=server_id, acked_id=acked_id)
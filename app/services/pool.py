@@ -0,0 +1,58 @@
+import asyncio
+import collections
+import logging
+import httpx
+from typing import Callable, Optional
+from models.models import SecondaryServer
+from config import CONFIG
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ClientPool(collections.UserDict):
+    """
+    long-lived keep-alive http clients, one for every registered secondary.
+    transport_factory replaces network transport of clients (benchmarks use it to run secondaries in-process)
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limits = httpx.Limits(
+            max_connections=CONFIG.POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=CONFIG.POOL_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=CONFIG.POOL_KEEPALIVE_EXPIRY
+        )
+        self.http2 = CONFIG.HTTP2 and HTTP2_AVAILABLE
+        self.transport_factory: Optional[Callable[[SecondaryServer], httpx.AsyncBaseTransport]] = None
+        if CONFIG.HTTP2 and not HTTP2_AVAILABLE:
+            logging.getLogger("default").warning("HTTP2 is enabled but 'h2' package is not installed. "
+                                                 "Falling back to HTTP/1.1")
+
+    def open(self, service: SecondaryServer) -> httpx.AsyncClient:
+        if service.id in self:
+            self.close(server_id=service.id)
+        self[service.id] = httpx.AsyncClient(
+            base_url=f'http://{service.host}:{service.port}',
+            headers={'x-token': CONFIG.SERVICE_TOKEN},
+            limits=self.limits,
+            http2=self.http2,
+            transport=self.transport_factory(service) if self.transport_factory else None
+        )
+        return self[service.id]
+
+    def close(self, server_id: str):
+        client = self.pop(server_id, None)
+        if client is None:
+            return
+        try:
+            asyncio.get_running_loop().create_task(client.aclose())
+        except RuntimeError:
+            pass
+
+    async def aclose(self):
+        clients = list(self.values())
+        self.clear()
+        await asyncio.gather(*[client.aclose() for client in clients])
@@ -0,0 +1,172 @@
+import asyncio
+import collections
+import functools
+import logging
+import time
+from typing import Awaitable, Callable
+from models.models import Message
+from registries.message_registry import MessageRegistry
+from config import CONFIG
+from config.config import DEFAULT_TOPIC
+from utils.exceptions import NotToRetryException
+from utils.log_pipeline import log_event
+from utils.metrics import REPLICATION_LATENCY, REPLICATION_RETRIES
+from utils.other import next_retry_in, get_retry_properties
+from utils.scheduler import RetryScheduler
+
+
+class ReplicationWorker:
+    """
+    replicates messages to a secondary in order of their ids.
+    new messages wait in a bounded queue and are sent in batches of up to REPLICATION_BATCH_SIZE messages
+    (waiting REPLICATION_BATCH_WINDOW_MS for batch to fill) with up to REPLICATION_WINDOW batches in flight.
+    failed batch keeps its place in the window and is retried by shared retry scheduler.
+    if queue overflows or a batch is not delivered after all retries, worker switches to catch-up mode:
+    queue is dropped and messages are read from registry (or its snapshot) in chunks of CATCHUP_CHUNK_SIZE
+    starting after the last sent (or delivered) message until worker reaches the end of registry.
+    every topic is replicated to a secondary by its own worker
+    """
+    def __init__(self,
+                 service_id: str,
+                 registry: MessageRegistry,
+                 publish: Callable[..., Awaitable],
+                 scheduler: RetryScheduler,
+                 topic: str = DEFAULT_TOPIC,
+                 batch_size: int = CONFIG.REPLICATION_BATCH_SIZE,
+                 batch_window: float = CONFIG.REPLICATION_BATCH_WINDOW_MS / 1000,
+                 window: int = CONFIG.REPLICATION_WINDOW,
+                 queue_size: int = CONFIG.REPLICATION_QUEUE_SIZE,
+                 chunk_size: int = CONFIG.CATCHUP_CHUNK_SIZE):
+        self.service_id = service_id
+        self.registry = registry
+        self.publish = publish
+        self.scheduler = scheduler
+        self.topic = topic
+        self.key = service_id if topic == DEFAULT_TOPIC else f'{service_id}/{topic}'
+        self.latency = REPLICATION_LATENCY.labels(service_id)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue_size = queue_size
+        self.window = window
+        self.chunk_size = chunk_size
+        self.queue: collections.deque[Message] = collections.deque()
+        self.sent_id: int = registry.message_id
+        self.acked_id: int = registry.message_id
+        self.acked_batches: dict[int, int] = dict()
+        self.catching_up: bool = False
+        self.in_flight: int = 0
+        self.slots = asyncio.Semaphore(window)
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    def extend(self, messages: list[Message]):
+        if not self.catching_up:
+            if len(self.queue) + len(messages) > self.queue_size:
+                logging.getLogger("default").warning(
+                    f'Replication queue of secondary server (id={self.key}) overflowed. '
+                    f'Switching to catch-up mode from message_id={self.sent_id}')
+                self._catch_up_from(since_id=self.sent_id)
+            else:
+                self.queue.extend(messages)
+        self.wakeup.set()
+
+    def catch_up(self, since_id: int):
+        """
+        replicate all messages after since_id (the last message secondary has).
+        secondary which is ahead of master is rejected on registration
+        """
+        self.acked_id = since_id
+        self.acked_batches.clear()
+        self._catch_up_from(since_id=since_id)
+
+    def status(self) -> dict:
+        return {
+            'mode': 'catch-up' if self.catching_up else 'live',
+            'queue_depth': self.registry.message_id - self.sent_id if self.catching_up else len(self.queue),
+            'in_flight': self.in_flight,
+            'retries': self.scheduler.pending(key=self.key),
+            'acked_id': self.acked_id,
+            'lag': self.registry.message_id - self.acked_id
+        }
+
+    def close(self):
+        self.task.cancel()
+        self.queue.clear()
+        self.scheduler.cancel(key=self.key)
+
+    def _catch_up_from(self, since_id: int):
+        self.queue.clear()
+        self.sent_id = since_id
+        self.catching_up = True
+        self.wakeup.set()
+
+    async def _next_batch(self) -> list[Message]:
+        if self.catching_up:
+            since_id = self.sent_id
+            batch = await self.registry.read(since_id=since_id, limit=self.chunk_size)
+            if self.sent_id != since_id:
+                # catch-up was restarted while compacted messages were read
+                return []
+            if self.sent_id + len(batch) == self.registry.message_id:
+                self.catching_up = False
+        else:
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+        if batch:
+            self.sent_id = batch[-1].meta.message_id
+        return batch
+
+    async def _retry(self, first_id: int, last_id: int, attempt: int):
+        await self._send(batch=await self.registry.read(since_id=first_id - 1, limit=last_id - first_id + 1),
+                         attempt=attempt)
+
+    def _release(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            if not self.catching_up and len(self.queue) < self.batch_size and self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            await self.slots.acquire()
+            batch = await self._next_batch()
+            if not batch:
+                self.slots.release()
+                if not self.catching_up and not self.queue:
+                    self.wakeup.clear()
+                continue
+            self.in_flight += 1
+            asyncio.get_running_loop().create_task(self._send(batch))
+
+    async def _send(self, batch: list[Message], attempt: int = 0):
+        first_id, last_id = batch[0].meta.message_id, batch[-1].meta.message_id
+        started_at = time.perf_counter()
+        try:
+            await self.publish(messages=batch, service_id=self.service_id, topic=self.topic)
+        except NotToRetryException:
+            self._release()
+            return
+        except Exception as e:
+            REPLICATION_RETRIES.labels(self.service_id, type(e.__cause__ or e).__name__).inc()
+            intervals = list(next_retry_in(**get_retry_properties('_publish_batch_to_secondary')))
+            if attempt < len(intervals):
+                log_event("default", logging.INFO, function='_publish_batch_to_secondary', status='retried',
+                          service_id=self.key, message_ids=f'{first_id}-{last_id}', error=e,
+                          next_retry_in=intervals[attempt])
+                self.scheduler.schedule(key=self.key,
+                                        delay=intervals[attempt],
+                                        callback=functools.partial(self._retry, first_id, last_id, attempt + 1))
+                return
+            log_event("uvicorn.error", logging.ERROR, function='_publish_batch_to_secondary', status='failed',
+                      service_id=self.key, message_ids=f'{first_id}-{last_id}', error=e)
+            self._release()
+            self._catch_up_from(since_id=self.acked_id)
+            return
+        self.latency.observe(time.perf_counter() - started_at)
+        self._release()
+        self.acked_batches[first_id] = max(last_id, self.acked_batches.get(first_id, 0))
+        while self.acked_id + 1 in self.acked_batches:
+            self.acked_id = max(self.acked_id, self.acked_batches.pop(self.acked_id + 1))
+        if len(self.acked_batches) > 2 * self.window:
+            self.acked_batches = {first_id: last_id for first_id, last_id in self.acked_batches.items()
+                                  if last_id > self.acked_id}
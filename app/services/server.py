@@ -1,58 +1,315 @@
 import asyncio
+import functools
 import os
+import random
+import uuid
 import httpx
 from datetime import datetime
+from typing import Optional, AsyncIterator
+from pydantic import TypeAdapter
 import logging
-from utils.exceptions import AuthorizationError, UnexpectedResponse, ReadOnlyException, NotToRetryException
-from utils.handlers import async_handler, sync_handler
-from registries import MessageRegistry, ServiceRegistry
+import time
+from utils.exceptions import AuthorizationError, UnexpectedResponse, ReadOnlyException, NotToRetryException, \
+    ReorderBufferOverflowError, WriteConcernTimeoutError, ConsistencyTimeoutError, TopicNotFoundError, \
+    SecondaryAheadError
+from utils.handlers import async_handler
+from utils.serialization import join_array
+from utils.compression import CODECS, negotiate
+from registries import MessageRegistry, ServiceRegistry, MessageLog
 from models.models import ServiceType, SecondaryServer, Message, ServerStatus
+from models.wire_format import MEDIA_TYPE, decode_batch, encode_batch, split_frames
 from config import CONFIG
-from registries import MESSAGE_REGISTRY, SECONDARIES_REGISTRY
+from config.config import DEFAULT_TOPIC, ReplicationFormat
+from registries import MESSAGE_REGISTRY, MESSAGE_REGISTRIES, SECONDARIES_REGISTRY, open_storage
+from services.pool import ClientPool
+from services.replication import ReplicationWorker
+from services.acks import AckTracker
+from services.channel import ReplicationChannel
+from services.failure_detector import FailureDetector
+from utils.scheduler import RetryScheduler
+from utils.metrics import METRICS, REPLICATION_LATENCY, REPLICATION_RETRIES, WC_WAIT, Gauge
+
+MESSAGES_ADAPTER = TypeAdapter(list[Message])
 
 
 class Server:
+    owns_storage: bool = True
+
     def __init__(self):
         self.service_type: ServiceType = ServiceType(os.getenv('SERVICE_TYPE'))
         self.id = os.getenv('HOSTNAME')
+        if self.owns_storage:
+            open_storage()
+        METRICS.register(Gauge(name='message_registry_messages',
+                               documentation='Number of messages in registry',
+                               labels=('topic',),
+                               callback=lambda: {(topic,): len(registry)
+                                                 for topic, registry in MESSAGE_REGISTRIES.items()}))
+        METRICS.register(Gauge(name='message_registry_bytes',
+                               documentation='Estimated memory taken by messages in registry',
+                               labels=('topic',),
+                               callback=lambda: {(topic,): registry.memory_usage()
+                                                 for topic, registry in MESSAGE_REGISTRIES.items()}))
+        if MESSAGE_REGISTRY.snapshots is not None:
+            METRICS.register(Gauge(name='message_registry_snapshot_id',
+                                   documentation='Id of the last message in snapshot',
+                                   labels=('topic',),
+                                   callback=lambda: {(topic,): registry.snapshots.last_id
+                                                     for topic, registry in MESSAGE_REGISTRIES.items()}))
 
     def start(self):
         raise NotImplementedError("Function is not defined for base class")
 
+    @property
+    def is_ready(self) -> bool:
+        return True
+
+    async def _snapshot_periodically(self, interval: int, retain: int):
+        while True:
+            await asyncio.sleep(interval)
+            for topic, registry in MESSAGE_REGISTRIES.items():
+                try:
+                    await registry.snapshot(retain=retain, pinned=functools.partial(self._pinned_id, topic))
+                except (OSError, ValueError) as e:
+                    logging.getLogger("uvicorn.error").error(
+                        f'Snapshot of message registry (topic={topic}) was not written: {e!r}')
+
+    def _pinned_id(self, topic: str) -> Optional[int]:
+        """
+        the least id of messages of topic which must not be compacted from memory
+        """
+        return None
+
+    async def render_metrics(self) -> str:
+        """
+        metrics in prometheus text format
+        """
+        return METRICS.render()
+
+    async def stop(self):
+        for registry in MESSAGE_REGISTRIES.values():
+            registry.close()
+
+    def end_streams(self):
+        """
+        long-lived responses this server writes to are ended before shutdown
+        """
+
+    async def receive_acks(self, api_key: str, server_id: str, chunks: AsyncIterator[bytes]):
+        """
+        stream of cumulative acks of replication stream, one message id per line.
+        ValueError is raised on a line which is not a message id
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Replication Acks')
+        buffer = b''
+        async for chunk in chunks:
+            *lines, buffer = (buffer + chunk).split(b'\n')
+            if not lines:
+                continue
+            acked_ids = [int(line) for line in lines]
+            if min(acked_ids) < 0:
+                raise ValueError(f'Acked message id must not be negative: {min(acked_ids)}')
+            self.ack_channel(api_key=api_key, server_id=server_id, acked_id=acked_ids[-1])
+
     @staticmethod
     async def register_message(**kwargs):
         raise NotImplementedError("Function is not defined for base class")
 
     @staticmethod
-    def get_message_list(api_key) -> MessageRegistry:
+    def get_message_list(api_key, topic: str = DEFAULT_TOPIC) -> MessageRegistry:
         if api_key not in (CONFIG.SERVICE_TOKEN, CONFIG.CLIENT_TOKEN):
             raise AuthorizationError(service='Get Message Registry')
-        return MESSAGE_REGISTRY
+        if topic not in MESSAGE_REGISTRIES:
+            raise TopicNotFoundError(topic=topic)
+        return MESSAGE_REGISTRIES[topic]
+
+    async def wait_for_message(self, api_key: str, min_id: int, timeout: float, topic: str = DEFAULT_TOPIC):
+        """
+        read-your-writes: wait until server has every message up to min_id (id returned to a client by master)
+        """
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        if not await registry.wait_for(message_id=min_id, timeout=timeout):
+            raise ConsistencyTimeoutError(min_id=min_id, message_id=registry.message_id)
+
+    async def wait_after(self, api_key: str, since_id: int, timeout: float, topic: str = DEFAULT_TOPIC) -> bool:
+        """
+        long-poll: wait until server has a message after since_id, False if there is none after timeout seconds
+        """
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        return await registry.wait_after(since_id=since_id, timeout=timeout)
+
+    def subscribe(self, api_key: str, since_id: int, heartbeat: float,
+                  topic: str = DEFAULT_TOPIC) -> AsyncIterator[tuple[list[bytes], int]]:
+        """
+        encoded messages after since_id with id of the last of them, new ones are sent as soon as they are committed.
+        chunk without messages is sent after heartbeat seconds of silence. authorization is checked before streaming
+        """
+        self.get_message_list(api_key=api_key, topic=topic)
+
+        async def chunks() -> AsyncIterator[tuple[list[bytes], int]]:
+            last_id = since_id
+            while True:
+                messages, last_id = await self.read_messages(api_key=api_key, since_id=last_id,
+                                                             limit=CONFIG.CATCHUP_CHUNK_SIZE, topic=topic)
+                if messages:
+                    yield messages, last_id
+                elif not await self.wait_after(api_key=api_key, since_id=last_id, timeout=heartbeat, topic=topic):
+                    yield [], last_id
+
+        return chunks()
+
+    async def read_messages(self, api_key: str, since_id: int = 0, limit: Optional[int] = None,
+                            topic: str = DEFAULT_TOPIC) -> tuple[list[bytes], int]:
+        """
+        encoded messages with ids greater than since_id and id of the last of them (since_id if there are none)
+        """
+        messages = await self.get_message_list(api_key=api_key, topic=topic).read(since_id=since_id, limit=limit)
+        return [message.encode() for message in messages], messages[-1].meta.message_id if messages else since_id
+
+    def stream_messages(self, api_key: str, since_id: int = 0, limit: Optional[int] = None,
+                        chunk_size: int = 100, topic: str = DEFAULT_TOPIC) -> AsyncIterator[list[bytes]]:
+        """
+        encoded messages in chunks, authorization is checked before streaming starts
+        """
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        last_id = registry.message_id if limit is None else min(registry.message_id, since_id + limit)
+
+        async def chunks() -> AsyncIterator[list[bytes]]:
+            message_id = since_id
+            while message_id < last_id:
+                messages = await registry.read(since_id=message_id, limit=min(chunk_size, last_id - message_id))
+                if not messages:
+                    return
+                yield [message.encode() for message in messages]
+                message_id = messages[-1].meta.message_id
+
+        return chunks()
 
 
 class Master(Server):
     def __init__(self):
         super().__init__()
-        self.conditions = dict()
+        self.epoch: Optional[str] = uuid.uuid4().hex
+        self.acks: dict[str, AckTracker] = {topic: AckTracker() for topic in MESSAGE_REGISTRIES}
+        self.retries = RetryScheduler(max_concurrency=CONFIG.RETRY_CONCURRENCY)
+        self.clients = ClientPool()
+        self.detector = FailureDetector(threshold=CONFIG.PHI_THRESHOLD,
+                                        window=CONFIG.PHI_WINDOW,
+                                        min_std=CONFIG.HEALTHCHECK_DELAY / 4,
+                                        acceptable_pause=CONFIG.HEALTHCHECK_DELAY)
+        self.workers: dict[str, dict[str, ReplicationWorker]] = {topic: dict() for topic in MESSAGE_REGISTRIES}
+        self.channels: dict[str, ReplicationChannel] = dict()
+        SECONDARIES_REGISTRY.subscribe(on_register=self._on_service_registered,
+                                       on_remove=self._on_service_removed)
+        METRICS.register(Gauge(name='secondaries_registered',
+                               documentation='Number of registered secondaries',
+                               callback=lambda: SECONDARIES_REGISTRY.servers_number))
+        METRICS.register(Gauge(name='secondaries_healthy',
+                               documentation='Number of healthy secondaries',
+                               callback=lambda: SECONDARIES_REGISTRY.healthy_servers_number))
+        METRICS.register(Gauge(name='replication_lag_messages',
+                               documentation='Number of messages not yet acknowledged by secondary',
+                               labels=('secondary', 'topic'),
+                               callback=lambda: {(server_id, topic): worker.status()['lag']
+                                                 for topic, workers in self.workers.items()
+                                                 for server_id, worker in workers.items()}))
+        METRICS.register(Gauge(name='replication_queue_messages',
+                               documentation='Number of messages waiting to be sent to secondary',
+                               labels=('secondary', 'topic'),
+                               callback=lambda: {(server_id, topic): worker.status()['queue_depth']
+                                                 for topic, workers in self.workers.items()
+                                                 for server_id, worker in workers.items()}))
+        METRICS.register(Gauge(name='replication_pending_retries',
+                               documentation='Number of scheduled replication retries',
+                               callback=self.retries.pending))
+
+    def _on_service_registered(self, service: SecondaryServer):
+        self.clients.open(service=service)
+        self.detector.watch(server_id=service.id)
+        for topic, registry in MESSAGE_REGISTRIES.items():
+            self.workers[topic][service.id] = ReplicationWorker(service_id=service.id,
+                                                                registry=registry,
+                                                                publish=self._publish_batch_to_secondary,
+                                                                scheduler=self.retries,
+                                                                topic=topic)
+
+    def _on_service_removed(self, server_id: str):
+        self.clients.close(server_id=server_id)
+        self.detector.pop(server_id, None)
+        channel = self.channels.pop(server_id, None)
+        if channel:
+            channel.close()
+        for workers in self.workers.values():
+            worker = workers.pop(server_id, None)
+            if worker:
+                worker.close()
+        REPLICATION_LATENCY.remove(server_id)
+        REPLICATION_RETRIES.remove(server_id)
 
     def start(self):
+        for registry in MESSAGE_REGISTRIES.values():
+            registry.recover()
         loop = asyncio.get_event_loop()
         loop.create_task(self._secondaries_healthcheck(
             periodicity=CONFIG.HEALTHCHECK_DELAY,
             remove_after=CONFIG.SECONDARY_REMOVAL_DELAY
         ))
+        if MESSAGE_REGISTRY.snapshots is not None:
+            loop.create_task(self._snapshot_periodically(interval=CONFIG.SNAPSHOT_INTERVAL,
+                                                         retain=CONFIG.SNAPSHOT_RETAIN_MESSAGES))
+
+    async def stop(self):
+        await self.clients.aclose()
+        await super().stop()
 
-    async def register_service(self, service: SecondaryServer, api_key: str) -> tuple[int, str]:
+    def end_streams(self):
+        for server_id, channel in list(self.channels.items()):
+            self.close_channel(server_id=server_id, channel=channel)
+
+    def _pinned_id(self, topic: str) -> Optional[int]:
+        """
+        messages clients wait write concern of are acknowledged in registry, so they are kept in memory
+        """
+        return self.acks[topic].lowest_pending()
+
+    async def register_service(self, service: SecondaryServer, api_key: str, last_id: int = 0,
+                               last_ids: Optional[dict[str, int]] = None) -> dict:
+        """
+        last_id is the highest contiguous message id secondary already has, last_ids are the same for other topics.
+        response has ids of the last messages of every topic secondary is caught up to and epoch of master.
+        secondary with messages master doesn't have (master lost them) is rejected: its ids would be reused
+        """
         if not CONFIG.SERVICE_TOKEN == api_key:
             raise AuthorizationError(service='Secondary Registration')
+        last_ids = {**(last_ids or dict()), DEFAULT_TOPIC: last_id}
+        for topic, since_id in last_ids.items():
+            if topic in MESSAGE_REGISTRIES and since_id > MESSAGE_REGISTRIES[topic].message_id:
+                raise SecondaryAheadError(server_id=service.id, topic=topic, last_id=since_id,
+                                          message_id=MESSAGE_REGISTRIES[topic].message_id)
         service_id = SECONDARIES_REGISTRY.register(service=service)
-        loop = asyncio.get_event_loop()
-        loop.create_task(self.send_all(service_id=service_id))
-        return service_id
+        for topic, workers in self.workers.items():
+            workers[service_id].catch_up(since_id=last_ids.get(topic, 0))
+        return {'id': service_id,
+                'epoch': self.epoch,
+                'last_ids': {topic: registry.message_id for topic, registry in MESSAGE_REGISTRIES.items()}}
 
-    async def send_all(self, service_id: str):
-        for item in MESSAGE_REGISTRY.copy():
-            await self._publish_to_secondary(message=MESSAGE_REGISTRY[item], service_id=service_id)
+    async def get_snapshot(self, api_key: str, since_id: int, topic: str = DEFAULT_TOPIC) -> Optional[dict]:
+        """
+        snapshot file and offset of the first message after since_id for a secondary which is far behind:
+        messages after since_id are compacted or there are more than SNAPSHOT_RETAIN_MESSAGES of them in snapshot.
+        None if the secondary is close enough to be caught up by replication
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Snapshot')
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        snapshots = registry.snapshots
+        if snapshots is None or since_id >= snapshots.last_id or \
+                (since_id >= registry.compacted_id
+                 and snapshots.last_id - since_id <= CONFIG.SNAPSHOT_RETAIN_MESSAGES):
+            return None
+        return {'path': snapshots.file, 'last_id': snapshots.last_id,
+                'offset': await asyncio.to_thread(snapshots.offset, since_id=since_id)}
 
     @staticmethod
     def get_secondaries_registry(api_key: str):
@@ -60,87 +317,229 @@ class Master(Server):
             raise AuthorizationError(service='Get Secondary Registry')
         return SECONDARIES_REGISTRY
 
-    async def register_message(self, api_key: str, message: Message, wc: int) -> int:
+    async def list_secondaries(self, api_key: str) -> list[dict]:
+        return [{**server.dict(),
+                 'replication': self.get_replication_status(server.id),
+                 'liveness': self.get_liveness_status(server.id)}
+                for server in self.get_secondaries_registry(api_key=api_key).values()]
+
+    async def pick_reader(self, api_key: str, min_id: int = 0, topic: str = DEFAULT_TOPIC) -> dict:
+        """
+        healthy secondary to offload reads to: random one of those which already acknowledged min_id of topic,
+        otherwise the least lagged one
+        """
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        workers = self.workers[topic]
+        candidates = [(workers[server.id].acked_id, server)
+                      for server in self.get_secondaries_registry(api_key=api_key).values()
+                      if server.status == ServerStatus.HEALTHY and server.id in workers]
+        if not candidates:
+            raise UnexpectedResponse(service='Read Replica', status_code=503,
+                                     error='There are no healthy secondaries to read from')
+        caught_up = [candidate for candidate in candidates if candidate[0] >= min_id]
+        acked_id, server = random.choice(caught_up) if caught_up else max(candidates, key=lambda c: c[0])
+        return {**server.dict(),
+                'url': f'http://{server.host}:{server.port}',
+                'acked_id': acked_id,
+                'lag': registry.message_id - acked_id}
+
+    def get_replication_status(self, server_id: str) -> dict:
+        """
+        status of default topic replication, other topics are reported under 'topics'
+        """
+        worker = self.workers[DEFAULT_TOPIC].get(server_id)
+        if not worker:
+            return {}
+        status = worker.status()
+        if CONFIG.TOPICS:
+            status['topics'] = {topic: workers[server_id].status() for topic, workers in self.workers.items()
+                                if topic != DEFAULT_TOPIC and server_id in workers}
+        return status
+
+    def get_liveness_status(self, server_id: str) -> dict:
+        return self.detector.status(server_id=server_id)
+
+    def open_channel(self, api_key: str, server_id: str) -> ReplicationChannel:
+        """
+        while channel is open, messages are replicated to secondary through it instead of PUT /messages/batch
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Replication Stream')
+        if server_id not in SECONDARIES_REGISTRY:
+            raise UnexpectedResponse(service='Replication Stream', status_code=404,
+                                     error=f'Secondary ({server_id}) is not registered')
+        self.close_channel(server_id=server_id)
+        binary = SECONDARIES_REGISTRY[server_id].replication_format == ReplicationFormat.BINARY.value
+        channel = ReplicationChannel(service_id=server_id,
+                                     on_ack=functools.partial(self._ack_message, server_id),
+                                     binary=binary)
+        self.channels[server_id] = channel
+        return channel
+
+    def close_channel(self, server_id: str, channel: Optional[ReplicationChannel] = None):
+        """
+        frames which were not acknowledged are failed and retried by replication worker
+        """
+        if channel is None or self.channels.get(server_id) is channel:
+            channel = self.channels.pop(server_id, None)
+        if channel:
+            channel.close()
+
+    def ack_channel(self, api_key: str, server_id: str, acked_id: int):
+        """
+        cumulative ack: secondary has every message up to acked_id
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service='Replication Acks')
+        if server_id not in SECONDARIES_REGISTRY:
+            return
+        self.detector.heartbeat(server_id=server_id)
+        SECONDARIES_REGISTRY.update_status(server_id=server_id, new_status=ServerStatus.HEALTHY)
+        channel = self.channels.get(server_id)
+        if channel:
+            channel.ack(acked_id=acked_id)
+
+    def _ack_message(self, service_id: str, message_id: int, topic: str = DEFAULT_TOPIC):
+        if MESSAGE_REGISTRIES[topic].ack(message_id=message_id, server_id=service_id):
+            self.acks[topic].ack(message_id=message_id)
+
+    async def register_message(self, api_key: str, message: Message, wc: int, topic: str = DEFAULT_TOPIC) -> int:
         if SECONDARIES_REGISTRY.servers_number == 0:
             raise ReadOnlyException()
         if not CONFIG.CLIENT_TOKEN == api_key:
             raise AuthorizationError(service='Message Registration')
-        message_id = MESSAGE_REGISTRY.register(message)
-        MESSAGE_REGISTRY[message_id].meta.registered_to.add(self.id)
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        message_id = registry.register(message)
+        registry.ack(message_id=message_id, server_id=self.id)
 
-        return await self._broadcast(message_id=message_id, wc=wc)
+        try:
+            message_ids, _ = await asyncio.gather(self._broadcast(message_ids=[message_id], wc=wc, topic=topic),
+                                                  registry.persist())
+        finally:
+            message.meta.registered_to = registry[message_id].meta.registered_to
+        return message_ids[0]
 
-    async def _broadcast(self, message_id: int, wc: int) -> int:
+    async def register_messages(self, api_key: str, messages: list[Message], wc: int,
+                                topic: str = DEFAULT_TOPIC) -> list[int]:
+        if SECONDARIES_REGISTRY.servers_number == 0:
+            raise ReadOnlyException()
+        if not CONFIG.CLIENT_TOKEN == api_key:
+            raise AuthorizationError(service='Batch Message Registration')
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        if not messages:
+            return []
+        message_ids = registry.register_batch(messages)
+        for message_id in message_ids:
+            registry.ack(message_id=message_id, server_id=self.id)
+
+        message_ids, _ = await asyncio.gather(self._broadcast(message_ids=message_ids, wc=wc, topic=topic),
+                                              registry.persist())
+        return message_ids
+
+    async def _broadcast(self, message_ids: list[int], wc: int, topic: str = DEFAULT_TOPIC) -> list[int]:
         """
-        broadcasting messages to all secondaries
-        wait message to deliver to wc(number of secondaries) before response to a client
+        broadcasting messages to all secondaries by replication workers of the topic
+        wait every message to deliver to wc(number of secondaries) before response to a client
+        if it takes more than WC_TIMEOUT seconds WriteConcernTimeoutError is raised
         """
-        condition = asyncio.Condition()
-        self.conditions[message_id] = condition
-        message = MESSAGE_REGISTRY[message_id]
-        loop = asyncio.get_event_loop()
+        registry, tracker = MESSAGE_REGISTRIES[topic], self.acks[topic]
+        waiter = tracker.track(message_ids=message_ids,
+                               acks=[registry.acks(message_id) for message_id in message_ids],
+                               wc=wc)
+        messages = [registry[message_id] for message_id in message_ids]
 
-        for service in SECONDARIES_REGISTRY.values():
-            if service.status == ServerStatus.UNHEALTHY:
-                continue
-            loop.create_task(self._publish_to_secondary(message=message,
-                                                        service_id=service.id))
-        async with condition:
-            await condition.wait_for(lambda: len(message.meta.registered_to) >= wc)
-            _ = self.conditions.pop(message_id)
-        return message_id
+        started_at = time.perf_counter()
+        for worker in self.workers[topic].values():
+            worker.extend(messages)
+        acks = await tracker.wait(waiter=waiter, message_ids=message_ids, timeout=CONFIG.WC_TIMEOUT)
+        WC_WAIT.labels(wc).observe(time.perf_counter() - started_at)
+        if acks < wc:
+            raise WriteConcernTimeoutError(message_ids=message_ids, wc=wc, acks=acks)
+        return message_ids
 
-    @async_handler
-    async def _publish_to_secondary(self,
-                                    message: Message,
-                                    service_id: str,
-                                    timeout: int = 100):
+    async def _publish_batch_to_secondary(self,
+                                          messages: list[Message],
+                                          service_id: str,
+                                          timeout: int = 100,
+                                          topic: str = DEFAULT_TOPIC):
+        """
+        replication stream carries default topic, messages of other topics are sent with requests
+        """
         try:
             service: SecondaryServer = SECONDARIES_REGISTRY[service_id]
+            client: httpx.AsyncClient = self.clients[service_id]
         except KeyError:
             raise NotToRetryException(error=f'Service ({service_id}) were removed')
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.put(
-                    url=f'http://{service.host}:{service.port}/messages',
-                    headers={'x-token': CONFIG.SERVICE_TOKEN},
-                    json=message.dict(),
-                    timeout=timeout
-                )
-                response.raise_for_status()
-                message.meta.registered_to.add(service_id)
-            except (httpx.HTTPError, httpx.ConnectError):
-                SECONDARIES_REGISTRY.update_status(server_id=service_id,
-                                                   new_status=ServerStatus.UNHEALTHY)
-                raise Exception(f"Message(id: {message.meta.message_id}) wasn't published to {service.id}; "
-                                f"Server(id={service.id}) changed status to {service.status.name}")
-
-        condition = self.conditions.get(message.meta.message_id)
-        if condition:
-            async with condition:
-                condition.notify()
+        channel = self.channels.get(service_id) if topic == DEFAULT_TOPIC else None
+        if channel:
+            await channel.send(messages=messages, timeout=timeout)
+            return
+        params = None
+        if service.replication_format == ReplicationFormat.BINARY.value:
+            url, content, headers = '/replication/batch', encode_batch(messages), {'content-type': MEDIA_TYPE}
+            if topic != DEFAULT_TOPIC:
+                params = {'topic': topic}
+        else:
+            url = '/messages/batch' if topic == DEFAULT_TOPIC else f'/messages/{topic}/batch'
+            content = join_array(message.encode() for message in messages)
+            headers = {'content-type': 'application/json'}
+        codec = negotiate(','.join(service.encodings))
+        if codec is not None and len(content) >= CONFIG.COMPRESSION_THRESHOLD:
+            content = codec.compress(content)
+            headers['content-encoding'] = codec.name
+        try:
+            response = await client.put(
+                url=url,
+                content=content,
+                headers=headers,
+                params=params,
+                timeout=timeout
+            )
+            response.raise_for_status()
+        except (httpx.HTTPError, httpx.ConnectError) as e:
+            raise Exception(f"Messages(ids: {messages[0].meta.message_id}-{messages[-1].meta.message_id}) "
+                            f"weren't published to {service.id}: {e!r}") from e
 
-    @staticmethod
-    async def _secondaries_healthcheck(periodicity: int, remove_after: int):
-        async def process(client: httpx.AsyncClient, server: SecondaryServer):
+        self.detector.heartbeat(server_id=service_id)
+        SECONDARIES_REGISTRY.update_status(server_id=service_id, new_status=ServerStatus.HEALTHY)
+        for message in messages:
+            self._ack_message(service_id=service_id, message_id=message.meta.message_id, topic=topic)
+
+    async def _secondaries_healthcheck(self, periodicity: int, remove_after: int):
+        """
+        acknowledged replication requests are heartbeats, so only secondaries idle for periodicity are probed.
+        status is set by failure detector instead of a single probe result
+        """
+        async def probe(client: httpx.AsyncClient, server: SecondaryServer):
             try:
-                res = await client.get(f"http://{server.host}:{server.port}/healthcheck")
+                res = await client.get("/healthcheck")
                 res.raise_for_status()
-                SECONDARIES_REGISTRY.update_status(server_id=server.id,
-                                                   new_status=ServerStatus.HEALTHY)
+                self.detector.heartbeat(server_id=server.id)
             except httpx.HTTPError:
+                pass
+
+        def update_status(server: SecondaryServer):
+            if server.id not in SECONDARIES_REGISTRY:
+                return
+            if self.detector.is_available(server_id=server.id):
                 SECONDARIES_REGISTRY.update_status(server_id=server.id,
-                                                   new_status=ServerStatus.UNHEALTHY)
-                if (datetime.now()-server.last_status_change).seconds >= remove_after:
-                    SECONDARIES_REGISTRY.remove(server_id=server.id)
-                    logging.getLogger("error").error(
-                        f'Secondary server (id={server.id}) was removed from master'
-                        f'Please, restart secondary server manually!')
+                                                   new_status=ServerStatus.HEALTHY)
+                return
+            SECONDARIES_REGISTRY.update_status(server_id=server.id,
+                                               new_status=ServerStatus.UNHEALTHY)
+            if (datetime.now()-server.last_status_change).total_seconds() >= remove_after:
+                SECONDARIES_REGISTRY.remove(server_id=server.id)
+                logging.getLogger("error").error(
+                    f'Secondary server (id={server.id}) was removed from master'
+                    f'Please, restart secondary server manually!')
 
         while True:
-            async with httpx.AsyncClient() as client:
-                tasks = [process(client=client, server=server) for server in SECONDARIES_REGISTRY.values()]
-                await asyncio.gather(*tasks)
+            servers = list(SECONDARIES_REGISTRY.values())
+            tasks = [probe(client=self.clients[server.id], server=server)
+                     for server in servers if self.detector.is_idle(server_id=server.id, after=periodicity)]
+            await asyncio.gather(*tasks)
+            for server in servers:
+                update_status(server=server)
             await asyncio.sleep(periodicity)
 
 
@@ -148,25 +547,257 @@ class Secondary(Server):
     def __init__(self):
         super().__init__()
         self.is_registered: bool = False
+        self.is_caught_up: bool = False
+        self.epoch: Optional[str] = None
+        self.rejected_epoch: Optional[str] = None
+        self.joining: Optional[asyncio.Task] = None
+        self.streaming: Optional[asyncio.Task] = None
+        self.progress = asyncio.Event()
+        METRICS.register(Gauge(name='reorder_buffer_messages',
+                               documentation='Number of messages waiting for missing preceding ones',
+                               callback=lambda: sum(len(registry.awaited_messages)
+                                                    for registry in MESSAGE_REGISTRIES.values())))
+        self.master = httpx.AsyncClient(base_url=f"{CONFIG.MASTER_HOST}:{CONFIG.MASTER_PORT}",
+                                        headers={'x-token': CONFIG.SERVICE_TOKEN})
 
     def start(self):
-        self._register_to_master()
-        self.is_registered = True
-
-    @sync_handler
-    def _register_to_master(self):
-        with httpx.Client() as client:
-            response = client.post(
-                url=f"{CONFIG.MASTER_HOST}:{CONFIG.MASTER_PORT}/secondary/register?_id={self.id}",
-                headers={'x-token': CONFIG.SERVICE_TOKEN}
-            )
+        """
+        registration runs in background, so server answers healthchecks while it is retried.
+        it is not ready (GET /ready) until registration and catch-up are complete
+        """
+        for registry in MESSAGE_REGISTRIES.values():
+            registry.recover()
+        loop = asyncio.get_event_loop()
+        self.joining = loop.create_task(self._join_master())
+        loop.create_task(self._watch_master(interval=CONFIG.HEALTHCHECK_DELAY))
+        for topic in MESSAGE_REGISTRIES:
+            loop.create_task(self._fill_gaps(timeout=CONFIG.GAP_FILL_TIMEOUT, topic=topic))
+        if MESSAGE_REGISTRY.snapshots is not None:
+            loop.create_task(self._snapshot_periodically(interval=CONFIG.SNAPSHOT_INTERVAL,
+                                                         retain=CONFIG.SNAPSHOT_RETAIN_MESSAGES))
+
+    async def stop(self):
+        await self.master.aclose()
+        await super().stop()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.is_registered and self.is_caught_up
+
+    async def _join_master(self, epoch: Optional[str] = None):
+        """
+        register to master and wait until every message it had at registration is replicated.
+        master which is behind this secondary (it was restarted without message log) would reuse ids
+        of messages secondary has, so secondary stays not ready until its data is reset manually
+        """
+        self.is_registered = self.is_caught_up = False
+        result = await self._register_to_master()
+        if result is None:
+            return
+        behind = {topic: last_id for topic, last_id in result.get('last_ids', dict()).items()
+                  if topic in MESSAGE_REGISTRIES and last_id < MESSAGE_REGISTRIES[topic].message_id}
+        if result.get('rejected') or behind:
+            self.rejected_epoch = result.get('epoch', epoch)
+            logging.getLogger("uvicorn.error").error(
+                f'Secondary server (id={self.id}) has messages master does not have '
+                f'({result.get("detail") or behind}). It is not ready until its message log is removed '
+                f'or master is restored')
+            return
+        self.is_registered, self.epoch = True, result.get('epoch')
+        if CONFIG.REPLICATION_STREAM and self.streaming is None:
+            self.streaming = asyncio.get_running_loop().create_task(
+                self._stream_from_master(retry_interval=CONFIG.CONNECTION_TO_MASTER_RETRY_INTERVAL))
+        await asyncio.gather(*(MESSAGE_REGISTRIES[topic].wait_for(message_id=last_id)
+                               for topic, last_id in result.get('last_ids', dict()).items()
+                               if topic in MESSAGE_REGISTRIES))
+        self.is_caught_up = True
+        logging.getLogger("uvicorn.error").info(f'Secondary server (id={self.id}) is caught up with master')
+
+    async def _watch_master(self, interval: float):
+        """
+        restarted master has another epoch and doesn't know this secondary, so it is registered again.
+        registration which gave up retrying is also started again once master answers
+        """
+        while True:
+            await asyncio.sleep(interval)
+            if not self.is_registered and not self.joining.done():
+                continue
+            try:
+                response = await self.master.get('/healthcheck', timeout=interval)
+            except httpx.HTTPError:
+                continue
+            epoch = response.headers.get('x-master-epoch')
+            if epoch is None or epoch in (self.epoch, self.rejected_epoch):
+                continue
+            logging.getLogger("uvicorn.error").info(
+                f'Master epoch changed ({self.epoch} -> {epoch}), secondary server (id={self.id}) is registered again')
+            self.joining.cancel()
+            self.joining = asyncio.get_running_loop().create_task(self._join_master(epoch=epoch))
+
+    async def _fill_gaps(self, timeout: int, topic: str = DEFAULT_TOPIC):
+        """
+        pull missing messages from master if they block awaited messages for more than timeout seconds
+        """
+        registry = MESSAGE_REGISTRIES[topic]
+        while True:
+            await asyncio.sleep(timeout)
+            gap = registry.gap(timeout=timeout)
+            if gap is None:
+                continue
+            try:
+                await self._pull_from_master(since_id=gap[0]-1, until_id=gap[1], topic=topic)
+            except (httpx.HTTPError, ReorderBufferOverflowError) as e:
+                logging.getLogger("uvicorn.error").error(
+                    f'Messages with ids {gap[0]}-{gap[1]} (topic={topic}) were not pulled from master: {e}')
+
+    async def _pull_from_master(self, since_id: int, until_id: int, topic: str = DEFAULT_TOPIC):
+        url = '/messages' if topic == DEFAULT_TOPIC else f'/messages/{topic}'
+        while since_id < until_id:
+            response = await self.master.get(url, params={
+                'since_id': since_id,
+                'limit': min(until_id - since_id, CONFIG.CATCHUP_CHUNK_SIZE)
+            })
             response.raise_for_status()
+            messages = [Message.model_validate(message) for message in response.json()['data']]
+            if not messages:
+                return
+            MESSAGE_REGISTRIES[topic].add_batch(messages)
+            since_id = messages[-1].meta.message_id
+
+    async def _stream_from_master(self, retry_interval: int):
+        """
+        keep replication stream from master and stream of acks to master open.
+        while they are down master replicates with PUT /messages/batch
+        """
+        while True:
+            tasks = [asyncio.ensure_future(self._receive_stream()),
+                     asyncio.ensure_future(self._send_acks(heartbeat=CONFIG.HEALTHCHECK_DELAY / 2))]
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            for task in done:
+                if task.exception():
+                    logging.getLogger("uvicorn.error").error(
+                        f'Replication stream from master was closed: {task.exception()!r}')
+            await asyncio.sleep(retry_interval)
+
+    async def _receive_stream(self):
+        async with self.master.stream('GET', '/replication/stream', params={'_id': self.id},
+                                      timeout=httpx.Timeout(None)) as response:
+            response.raise_for_status()
+            async for batch in self._stream_batches(response):
+                try:
+                    MESSAGE_REGISTRY.add_batch(batch)
+                except ReorderBufferOverflowError as e:
+                    logging.getLogger("uvicorn.error").error(f'Replicated messages were rejected: {e}')
+                self.progress.set()
 
     @staticmethod
-    async def register_message(api_key: str, message: Message, **kwargs) -> int:
+    async def _stream_batches(response: httpx.Response) -> AsyncIterator[list[Message]]:
+        """
+        frames of replication stream in the format master chose for it (by content-type)
+        """
+        if response.headers.get('content-type', '').startswith(MEDIA_TYPE):
+            buffer = bytearray()
+            async for chunk in response.aiter_bytes():
+                buffer += chunk
+                for frame in split_frames(buffer):
+                    yield decode_batch(frame)
+            return
+        async for frame in response.aiter_lines():
+            if frame:
+                yield MESSAGES_ADAPTER.validate_json(frame)
+
+    async def _send_acks(self, heartbeat: float):
+        """
+        highest contiguous message id is sent after new messages are added
+        and every heartbeat seconds, so master doesn't need to probe secondary
+        """
+        async def acks() -> AsyncIterator[bytes]:
+            while True:
+                self.progress.clear()
+                acked_id = MESSAGE_REGISTRY.message_id
+                await MESSAGE_REGISTRY.persist()
+                yield f'{acked_id}\n'.encode()
+                try:
+                    await asyncio.wait_for(self.progress.wait(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+
+        response = await self.master.post('/replication/acks', params={'_id': self.id}, content=acks(),
+                                          timeout=httpx.Timeout(None))
+        response.raise_for_status()
+
+    @async_handler
+    async def _register_to_master(self) -> dict:
+        """
+        secondary which is far behind loads snapshot of master first, so only the rest is replicated after registration
+        """
+        for topic in MESSAGE_REGISTRIES:
+            await self._bootstrap_from_snapshot(topic=topic)
+        response = await self.master.post(
+            url='/secondary/register',
+            params={'_id': self.id, 'last_id': MESSAGE_REGISTRY.message_id},
+            json={'last_ids': {topic: registry.message_id for topic, registry in MESSAGE_REGISTRIES.items()
+                               if topic != DEFAULT_TOPIC}},
+            headers={'x-content-encodings': ','.join(CODECS),
+                     'x-replication-format': CONFIG.REPLICATION_FORMAT.value}
+        )
+        if response.status_code == 409:
+            return {'rejected': True, 'detail': response.json().get('detail')}
+        response.raise_for_status()
+        return response.json()
+
+    async def _bootstrap_from_snapshot(self, topic: str = DEFAULT_TOPIC):
+        registry = MESSAGE_REGISTRIES[topic]
+        params = {'since_id': registry.message_id}
+        if topic != DEFAULT_TOPIC:
+            params['topic'] = topic
+        async with self.master.stream('GET', url='/snapshot', params=params,
+                                      timeout=httpx.Timeout(10, read=None)) as response:
+            response.raise_for_status()
+            if response.status_code == 204:
+                return
+            messages = []
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                messages.append(MessageLog.decode(line))
+                if len(messages) == CONFIG.CATCHUP_CHUNK_SIZE:
+                    registry.add_batch(messages)
+                    messages = []
+            registry.add_batch(messages)
+        logging.getLogger("uvicorn.error").info(
+            f"Loaded snapshot of master (topic={topic}) up to message {response.headers.get('x-snapshot-id')}")
+
+    async def register_message(self, api_key: str, message: Message, topic: str = DEFAULT_TOPIC, **kwargs) -> int:
         if not CONFIG.SERVICE_TOKEN == api_key:
             raise AuthorizationError(service="Message Registration")
-        MESSAGE_REGISTRY.add(message)
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        registry.add(message)
+        await registry.persist()
 
         return message.meta.message_id
 
+    async def register_messages(self, api_key: str, messages: list[Message], topic: str = DEFAULT_TOPIC,
+                                **kwargs) -> list[int]:
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service="Batch Message Registration")
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        message_ids = registry.add_batch(messages)
+        await registry.persist()
+
+        return message_ids
+
+    async def register_encoded_messages(self, api_key: str, data: bytes, topic: str = DEFAULT_TOPIC) -> list[int]:
+        """
+        batch in binary wire format is decoded straight into messages, without validation of every field
+        """
+        if not CONFIG.SERVICE_TOKEN == api_key:
+            raise AuthorizationError(service="Batch Message Registration")
+        registry = self.get_message_list(api_key=api_key, topic=topic)
+        message_ids = registry.add_batch(decode_batch(data))
+        await registry.persist()
+
+        return message_ids
+
@@ -0,0 +1,63 @@
+import os
+import pytest
+from datetime import datetime
+
+ENV_FILE = os.path.join(os.path.dirname(__file__), '..', '..', '.env')
+
+# config is read from environment when modules are imported, so it is taken from .env of docker compose
+with open(ENV_FILE) as env:
+    for line in env:
+        name, _, value = line.strip().partition('=')
+        if name and not name.startswith('#'):
+            os.environ.setdefault(name, value)
+os.environ.setdefault('HOSTNAME', 'test')
+os.environ.setdefault('SERVICE_TYPE', 'master')
+
+# app modules are imported after environment is set
+from models.models import Message  # noqa: E402
+from registries.message_registry import MessageRegistry  # noqa: E402
+
+REGISTERED_AT = datetime(2024, 2, 29, 23, 59, 59, 123456)
+
+
+@pytest.fixture
+def messages():
+    """
+    factory of messages with given texts registered under ids from 1
+    """
+    def make(*texts: str) -> list[Message]:
+        return [Message(message=text).register(message_id=message_id, registered_at=REGISTERED_AT)
+                for message_id, text in enumerate(texts, start=1)]
+    return make
+
+
+@pytest.fixture
+def replicated():
+    """
+    factory of messages registered under given ids, as they come from master
+    """
+    def make(*message_ids: int) -> list[Message]:
+        return [Message(message=f'message {message_id}').register(message_id=message_id, registered_at=REGISTERED_AT)
+                for message_id in message_ids]
+    return make
+
+
+@pytest.fixture
+def registered():
+    """
+    factory which registers number of new messages in registry and returns them
+    """
+    def make(registry: MessageRegistry, number: int) -> list[Message]:
+        message_ids = registry.register_batch([Message(message=str(i)) for i in range(number)])
+        return [registry[message_id] for message_id in message_ids]
+    return make
+
+
+@pytest.fixture
+def ids():
+    """
+    ids of messages
+    """
+    def make(messages) -> list[int]:
+        return [message.meta.message_id for message in messages]
+    return make
@@ -0,0 +1,56 @@
+import asyncio
+from services.acks import AckTracker
+
+
+def test_waiter_is_resolved_when_every_message_reaches_write_concern():
+    async def main():
+        tracker = AckTracker()
+        waiter = tracker.track(message_ids=[1, 2], acks=[1, 1], wc=3)
+        wait = asyncio.ensure_future(tracker.wait(waiter=waiter, message_ids=[1, 2]))
+        for message_id in (1, 2, 1):
+            tracker.ack(message_id=message_id)
+        await asyncio.sleep(0)
+        assert not wait.done()
+
+        tracker.ack(message_id=2)
+        assert await wait == 3
+        assert not tracker.pending
+
+    asyncio.run(main())
+
+
+def test_messages_which_already_reached_write_concern_are_not_tracked():
+    async def main():
+        tracker = AckTracker()
+        waiter = tracker.track(message_ids=[1, 2], acks=[2, 2], wc=2)
+        assert waiter.future.done()
+        assert not tracker.pending
+        assert await tracker.wait(waiter=waiter, message_ids=[1, 2], timeout=0) == 2
+
+    asyncio.run(main())
+
+
+def test_timeout_returns_the_least_number_of_acks_and_discards_waiter():
+    async def main():
+        tracker = AckTracker()
+        waiter = tracker.track(message_ids=[1, 2, 3], acks=[1, 1, 1], wc=3)
+        for message_id in (1, 1, 2):
+            tracker.ack(message_id=message_id)
+        assert await tracker.wait(waiter=waiter, message_ids=[1, 2, 3], timeout=0.01) == 1
+        assert not tracker.pending
+        tracker.ack(message_id=3)
+
+    asyncio.run(main())
+
+
+def test_lowest_pending_is_the_least_awaited_message():
+    async def main():
+        tracker = AckTracker()
+        assert tracker.lowest_pending() is None
+        tracker.track(message_ids=[5, 6], acks=[1, 1], wc=2)
+        tracker.track(message_ids=[3], acks=[1], wc=2)
+        assert tracker.lowest_pending() == 3
+        tracker.ack(message_id=3)
+        assert tracker.lowest_pending() == 5
+
+    asyncio.run(main())
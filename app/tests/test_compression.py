@@ -0,0 +1,61 @@
+import asyncio
+import gzip
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from utils.compression import CompressionMiddleware
+
+
+def client(chunks: list[bytes], pause: float = 0) -> httpx.AsyncClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, threshold=100, delay=0.01)
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(pause)
+
+    @app.get('/stream')
+    async def get_stream():
+        return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+    @app.get('/text')
+    async def get_text():
+        return PlainTextResponse(b''.join(chunks))
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test',
+                             headers={'accept-encoding': 'gzip'})
+
+
+async def raw(chunks: list[bytes], url: str, pause: float = 0) -> httpx.Response:
+    async with client(chunks, pause=pause) as http:
+        async with http.stream('GET', url) as response:
+            response.raw_body = b''.join([chunk async for chunk in response.aiter_raw()])
+            return response
+
+
+def test_small_stream_is_not_compressed():
+    response = asyncio.run(raw([b'{"a": 1}\n'] * 3, '/stream'))
+    assert 'content-encoding' not in response.headers
+    assert response.raw_body == b'{"a": 1}\n' * 3
+
+
+def test_stream_reaching_threshold_is_compressed():
+    chunks = [b'{"message": "%d"}\n' % i for i in range(50)]
+    response = asyncio.run(raw(chunks, '/stream'))
+    assert response.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(response.raw_body) == b''.join(chunks)
+
+
+def test_stream_below_threshold_after_delay_is_sent_as_is():
+    chunks = [b'x' * 10] * 20
+    response = asyncio.run(raw(chunks, '/stream', pause=0.02))
+    assert 'content-encoding' not in response.headers
+    assert response.raw_body == b''.join(chunks)
+
+
+def test_response_is_compressed_by_its_length():
+    assert 'content-encoding' not in asyncio.run(raw([b'x' * 99], '/text')).headers
+    response = asyncio.run(raw([b'x' * 100], '/text'))
+    assert response.headers['content-encoding'] == 'gzip'
+    assert gzip.decompress(response.raw_body) == b'x' * 100
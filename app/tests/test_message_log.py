@@ -0,0 +1,77 @@
+import asyncio
+import os
+import pytest
+from config.config import FsyncPolicy
+from models.models import Message
+from registries.message_log import MessageLog
+
+
+def written(path: str, messages: list[Message], segment_size: int = 1 << 20) -> MessageLog:
+    log = MessageLog(path=path, segment_size=segment_size, fsync_policy=FsyncPolicy.NEVER)
+    for message in messages:
+        log.append([message])
+    log.close()
+    return MessageLog(path=path, segment_size=segment_size, fsync_policy=FsyncPolicy.NEVER)
+
+
+def test_replay_returns_messages_in_order(tmp_path, replicated):
+    log = written(str(tmp_path), replicated(*range(1, 51)), segment_size=256)
+    assert len(log.segments()) > 1
+    assert [message.meta.message_id for message in log.replay()] == list(range(1, 51))
+
+
+def test_replay_truncates_torn_tail_of_last_segment(tmp_path, replicated):
+    log = written(str(tmp_path), replicated(1, 2, 3, 4, 5))
+    segment = log.segments()[-1]
+    size = os.path.getsize(segment)
+    with open(segment, 'ab') as file:
+        file.write(b'{"message": "torn')
+
+    assert [message.meta.message_id for message in log.replay()] == [1, 2, 3, 4, 5]
+    assert os.path.getsize(segment) == size
+
+
+def test_replay_fails_on_corruption_before_the_tail(tmp_path, replicated):
+    log = written(str(tmp_path), replicated(1, 2, 3, 4, 5))
+    segment = log.segments()[-1]
+    with open(segment, 'r+b') as file:
+        file.seek(3)
+        file.write(b'\x00\x00')
+
+    with pytest.raises(ValueError):
+        list(log.replay())
+
+
+def test_replay_fails_on_corruption_of_earlier_segment(tmp_path, replicated):
+    log = written(str(tmp_path), replicated(*range(1, 51)), segment_size=256)
+    first, last = log.segments()[0], log.segments()[-1]
+    with open(first, 'ab') as file:
+        file.write(b'{"message": "torn')
+    size = os.path.getsize(last)
+
+    with pytest.raises(ValueError):
+        list(log.replay())
+    assert os.path.getsize(last) == size
+
+
+def test_concurrent_appends_share_one_fsync(tmp_path, monkeypatch, replicated):
+    synced = []
+
+    def fsync(fds: list[int]):
+        synced.append(fds)
+        for fd in fds:
+            os.close(fd)
+    monkeypatch.setattr(MessageLog, '_fsync', staticmethod(fsync))
+
+    async def append_and_sync(log: MessageLog, message: Message):
+        log.append([message])
+        await log.sync()
+
+    async def main():
+        log = MessageLog(path=str(tmp_path), segment_size=1 << 20, fsync_policy=FsyncPolicy.ALWAYS)
+        await asyncio.gather(*(append_and_sync(log, message) for message in replicated(*range(1, 11))))
+        assert log.synced == log.appended == 10
+        assert len(synced) == 1
+        log.close()
+
+    asyncio.run(main())
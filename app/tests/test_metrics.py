@@ -0,0 +1,21 @@
+from utils.metrics import Counter, Histogram
+
+
+def test_remove_drops_every_child_of_leading_labels():
+    retries = Counter(name='retries_total', documentation='retries', labels=('secondary', 'reason'))
+    retries.labels('a', 'ConnectTimeout').inc()
+    retries.labels('a', 'ReadTimeout').inc()
+    retries.labels('b', 'ReadTimeout').inc()
+
+    retries.remove('a')
+    assert list(retries.children) == [('b', 'ReadTimeout')]
+    assert 'secondary="a"' not in retries.render()
+
+
+def test_removed_child_is_created_again():
+    latency = Histogram(name='latency_seconds', documentation='latency', buckets=(1,), labels=('secondary',))
+    latency.labels('a').observe(2)
+    latency.remove('a')
+    latency.remove('missing')
+    latency.labels('a').observe(0.5)
+    assert 'latency_seconds_count{secondary="a"} 1' in latency.render()
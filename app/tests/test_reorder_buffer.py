@@ -0,0 +1,52 @@
+import time
+import pytest
+from registries.message_registry import MessageRegistry
+from utils.exceptions import MessageDuplicationError, ReorderBufferOverflowError
+
+
+def test_messages_out_of_order_are_added_once_gap_is_filled(replicated):
+    registry = MessageRegistry()
+    assert registry.add_batch(replicated(3, 4)) == [3, 4]
+    assert registry.message_id == 0
+
+    registry.add_batch(replicated(2, 1))
+    assert registry.message_id == 4
+    assert not registry.awaited_messages
+    assert [message.meta.message_id for message in registry.since(0)] == [1, 2, 3, 4]
+
+
+def test_duplicates_are_skipped_in_batch_and_rejected_one_by_one(replicated):
+    registry = MessageRegistry()
+    registry.add_batch(replicated(1, 3))
+    assert registry.add_batch(replicated(1, 2, 3)) == [2]
+    with pytest.raises(MessageDuplicationError):
+        registry.add(replicated(3)[0])
+
+
+def test_full_buffer_rejects_messages_but_keeps_the_rest_of_batch(replicated):
+    registry = MessageRegistry(awaited_limit=2)
+    with pytest.raises(ReorderBufferOverflowError) as error:
+        registry.add_batch(replicated(3, 4, 5, 1))
+    assert '5-5' in error.value.error
+    assert registry.message_id == 1
+    assert sorted(registry.awaited_messages) == [3, 4]
+
+
+def test_next_message_is_accepted_by_full_buffer(replicated):
+    registry = MessageRegistry(awaited_limit=1)
+    registry.add(replicated(3)[0])
+    with pytest.raises(ReorderBufferOverflowError):
+        registry.add(replicated(4)[0])
+
+    registry.add(replicated(1)[0])
+    registry.add(replicated(2)[0])
+    assert registry.message_id == 3
+
+
+def test_gap_is_reported_after_timeout(monkeypatch, replicated):
+    registry = MessageRegistry()
+    registry.add_batch(replicated(1, 4, 6))
+    assert registry.gap(timeout=60) is None
+
+    monkeypatch.setattr(time, 'monotonic', lambda: registry.progress_at + 61)
+    assert registry.gap(timeout=60) == (2, 3)
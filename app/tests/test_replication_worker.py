@@ -0,0 +1,88 @@
+import asyncio
+from models.models import Message
+from registries.message_registry import MessageRegistry
+from services.replication import ReplicationWorker
+from utils.scheduler import RetryScheduler
+
+
+class Secondary:
+    """
+    publish callback which holds every batch until it is released by the test
+    """
+    def __init__(self):
+        self.batches: list[list[int]] = []
+        self.releases: list[asyncio.Future] = []
+
+    async def publish(self, messages: list[Message], service_id: str, topic: str):
+        self.batches.append([message.meta.message_id for message in messages])
+        release = asyncio.get_running_loop().create_future()
+        self.releases.append(release)
+        await release
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_in_flight_batches_are_limited_by_window(registered):
+    async def main():
+        registry, secondary = MessageRegistry(), Secondary()
+        worker = ReplicationWorker(service_id='secondary', registry=registry, publish=secondary.publish,
+                                   scheduler=RetryScheduler(max_concurrency=1), batch_size=2, batch_window=0,
+                                   window=2, queue_size=100)
+        worker.extend(registered(registry, 8))
+        await settle()
+        assert secondary.batches == [[1, 2], [3, 4]]
+        assert worker.status()['in_flight'] == 2
+
+        secondary.releases[0].set_result(None)
+        await settle()
+        assert secondary.batches == [[1, 2], [3, 4], [5, 6]]
+        worker.close()
+
+    asyncio.run(main())
+
+
+def test_acked_id_advances_only_over_contiguous_batches(registered):
+    async def main():
+        registry, secondary = MessageRegistry(), Secondary()
+        worker = ReplicationWorker(service_id='secondary', registry=registry, publish=secondary.publish,
+                                   scheduler=RetryScheduler(max_concurrency=1), batch_size=2, batch_window=0,
+                                   window=3, queue_size=100)
+        worker.extend(registered(registry, 6))
+        await settle()
+        assert len(secondary.releases) == 3
+
+        secondary.releases[1].set_result(None)
+        secondary.releases[2].set_result(None)
+        await settle()
+        assert worker.acked_id == 0
+
+        secondary.releases[0].set_result(None)
+        await settle()
+        assert worker.acked_id == 6
+        assert worker.status()['lag'] == 0
+        worker.close()
+
+    asyncio.run(main())
+
+
+def test_overflowed_queue_is_replaced_by_reading_registry(registered):
+    async def main():
+        registry, secondary = MessageRegistry(), Secondary()
+        worker = ReplicationWorker(service_id='secondary', registry=registry, publish=secondary.publish,
+                                   scheduler=RetryScheduler(max_concurrency=1), batch_size=2, batch_window=0,
+                                   window=1, queue_size=3, chunk_size=4)
+        worker.extend(registered(registry, 2))
+        worker.extend(registered(registry, 5))
+        assert worker.status()['mode'] == 'catch-up'
+        await settle()
+        while secondary.releases and not secondary.releases[-1].done():
+            secondary.releases[-1].set_result(None)
+            await settle()
+        assert [message_id for batch in secondary.batches for message_id in batch] == list(range(1, 8))
+        assert worker.status()['mode'] == 'live'
+        worker.close()
+
+    asyncio.run(main())
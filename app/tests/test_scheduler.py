@@ -0,0 +1,69 @@
+import asyncio
+from config.config import RetryMechanism
+from utils.other import next_retry_in
+from utils.scheduler import RetryScheduler
+
+
+def test_retries_run_in_order_of_their_time():
+    async def main():
+        scheduler, runs = RetryScheduler(max_concurrency=10), []
+
+        def retry(name: str):
+            async def callback():
+                runs.append(name)
+            return callback
+
+        for name, delay in (('c', 0.03), ('a', 0.01), ('b', 0.02), ('a2', 0.01)):
+            scheduler.schedule(key='secondary', delay=delay, callback=retry(name))
+        assert scheduler.pending() == 4
+        await asyncio.sleep(0.06)
+        assert runs == ['a', 'a2', 'b', 'c']
+        assert scheduler.pending() == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_retries_are_not_run():
+    async def main():
+        scheduler, runs = RetryScheduler(max_concurrency=10), []
+
+        async def callback():
+            runs.append(1)
+        scheduler.schedule(key='dropped', delay=0.01, callback=callback)
+        scheduler.schedule(key='kept', delay=0.02, callback=callback)
+        assert scheduler.cancel(key='dropped') == 1
+        await asyncio.sleep(0.04)
+        assert runs == [1]
+
+    asyncio.run(main())
+
+
+def test_due_retries_are_limited_by_concurrency():
+    async def main():
+        scheduler, running, peak = RetryScheduler(max_concurrency=2), [0], [0]
+
+        async def callback():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+        for _ in range(5):
+            scheduler.schedule(key='secondary', delay=0, callback=callback)
+        await asyncio.sleep(0.05)
+        assert peak[0] == 2
+        assert scheduler.pending() == 0
+
+    asyncio.run(main())
+
+
+def test_jitter_keeps_intervals_within_bounds():
+    plain = list(next_retry_in(mechanism=RetryMechanism.EXPONENTIAL, max_delay=300, interval=2))
+    for _ in range(100):
+        jittered = list(next_retry_in(mechanism=RetryMechanism.EXPONENTIAL, jitter=0.2, max_delay=300, interval=2))
+        assert len(jittered) == len(plain)
+        for interval, shifted in zip(plain, jittered):
+            assert interval * 0.8 - 0.001 <= shifted <= interval * 1.2 + 0.001
+
+
+def test_no_jitter_keeps_intervals():
+    assert list(next_retry_in(mechanism=RetryMechanism.UNIFORM, jitter=0, max_delay=10, interval=3)) == [3, 3, 3, 3]
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from config.config import FsyncPolicy
+from registries.message_log import MessageLog
+from registries.message_registry import MessageRegistry
+from registries.snapshot import SnapshotStore
+
+
+@pytest.fixture(autouse=True)
+def index_step(monkeypatch):
+    monkeypatch.setattr(SnapshotStore, 'INDEX_STEP', 4)
+
+
+def test_read_from_any_message_through_sparse_index(tmp_path, replicated, ids):
+    snapshots = SnapshotStore(path=str(tmp_path))
+    snapshots.write(replicated(*range(1, 11)), last_id=10)
+    snapshots.write(replicated(*range(11, 24)), last_id=23)
+    assert snapshots.index == [0, *(snapshots.offset(since_id=since_id) for since_id in (4, 8, 12, 16, 20))]
+
+    for since_id in range(23):
+        assert ids(snapshots.read(since_id=since_id, until_id=23)) == list(range(since_id + 1, 24))
+    assert ids(snapshots.read(since_id=5, until_id=9)) == [6, 7, 8, 9]
+    assert ids(snapshots.read(since_id=20, until_id=30)) == [21, 22, 23]
+
+
+def test_loaded_snapshot_has_the_same_index(tmp_path, replicated, ids):
+    snapshots = SnapshotStore(path=str(tmp_path))
+    snapshots.write(replicated(*range(1, 11)), last_id=10)
+    snapshots.write(replicated(*range(11, 14)), last_id=13)
+
+    loaded = SnapshotStore(path=str(tmp_path))
+    assert (loaded.file, loaded.last_id, loaded.index) == (snapshots.file, 13, snapshots.index)
+    assert ids(loaded.read(since_id=9, until_id=13)) == [10, 11, 12, 13]
+
+
+def test_snapshot_with_missing_messages_is_not_saved(tmp_path, replicated):
+    snapshots = SnapshotStore(path=str(tmp_path))
+    with pytest.raises(ValueError):
+        snapshots.write(replicated(*range(1, 6)), last_id=6)
+    assert snapshots.last_id == 0
+    assert not snapshots.snapshots()
+
+
+def test_compacted_registry_reads_from_snapshot_and_keeps_pinned_messages(tmp_path, registered, ids):
+    async def main():
+        registry = MessageRegistry(snapshots=SnapshotStore(path=str(tmp_path)))
+        registered(registry, 20)
+        await registry.snapshot(retain=2, pinned=lambda: 12)
+        assert registry.compacted_id == 11
+        assert 11 not in registry and 12 in registry
+        assert ids(registry.since(since_id=5, limit=10)) == list(range(6, 16))
+
+    asyncio.run(main())
+
+
+def test_registry_recovers_from_snapshot_and_log(tmp_path, registered, ids):
+    async def main():
+        log_dir, snapshot_dir = str(tmp_path / 'log'), str(tmp_path / 'snapshots')
+        registry = MessageRegistry(log=MessageLog(path=log_dir, segment_size=256, fsync_policy=FsyncPolicy.NEVER),
+                                   snapshots=SnapshotStore(path=snapshot_dir))
+        for _ in range(3):
+            registered(registry, 5)
+        await registry.snapshot(retain=0)
+        registered(registry, 5)
+        registry.close()
+
+        recovered = MessageRegistry(log=MessageLog(path=log_dir, segment_size=256, fsync_policy=FsyncPolicy.NEVER),
+                                    snapshots=SnapshotStore(path=snapshot_dir))
+        assert recovered.recover() == 20
+        assert recovered.compacted_id == 15
+        assert ids(recovered.since(since_id=0)) == list(range(1, 21))
+        recovered.close()
+
+    asyncio.run(main())
+
+
+def test_missing_compacted_messages_are_reported(tmp_path, registered, ids):
+    async def main():
+        registry = MessageRegistry(snapshots=SnapshotStore(path=str(tmp_path)))
+        registered(registry, 10)
+        await registry.snapshot(retain=0)
+        assert ids(await registry.read(since_id=3, limit=4)) == [4, 5, 6, 7]
+
+        registry.snapshots.last_id = 5
+        with pytest.raises(ValueError):
+            list(registry.since(since_id=0))
+        with pytest.raises(ValueError):
+            await registry.read(since_id=0)
+
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import pytest
+from models.models import Message
+from models.wire_format import decode_batch, encode_batch, encode_frame, split_frames
+from registries.columnar_registry import ColumnarMessageRegistry
+from utils.serialization import loads
+
+
+def test_batch_round_trip(messages):
+    batch = messages('plain', '', 'юнікод ✓', 'x' * 70000)
+    decoded = decode_batch(encode_batch(batch))
+    assert [message.message for message in decoded] == [message.message for message in batch]
+    assert [message.meta.message_id for message in decoded] == [1, 2, 3, 4]
+    assert all(message.meta.registered_at == batch[0].meta.registered_at for message in decoded)
+    assert all(message.meta.registered_to == set() for message in decoded)
+    assert decoded[2].model_dump() == Message.model_validate(decoded[2].model_dump()).model_dump()
+
+
+def test_empty_batch():
+    assert encode_batch([]) == b''
+    assert decode_batch(b'') == []
+
+
+@pytest.mark.parametrize('cut', [1, 5, 16, 21])
+def test_truncated_batch_is_rejected(cut, messages):
+    data = encode_batch(messages('first', 'second'))
+    with pytest.raises(ValueError):
+        decode_batch(data[:-cut])
+
+
+def test_frames_are_split_when_complete(messages):
+    first, second = encode_frame(messages('a', 'b')), encode_frame(messages('c'))
+    buffer = bytearray(first + second[:3])
+    frames = split_frames(buffer)
+    assert [message.message for message in decode_batch(frames[0])] == ['a', 'b']
+    assert len(frames) == 1 and buffer == second[:3]
+
+    buffer += second[3:]
+    assert [message.message for frame in split_frames(buffer) for message in decode_batch(frame)] == ['c']
+    assert buffer == b''
+
+
+def test_columnar_registry_serves_encoded_messages(messages):
+    registry = ColumnarMessageRegistry()
+    registry.register_batch(messages('plain', '', 'юнікод ✓', '"quoted"\\\n'))
+    registry.ack(message_id=3, server_id='secondary')
+    for message_id in range(1, 5):
+        stored = registry[message_id]
+        assert stored.encode() == Message.model_validate(stored.model_dump()).encode()
+    assert registry[2].message == '' and registry[4].message == '"quoted"\\\n'
+    assert loads(registry[3].encode())['meta']['registered_to'] == ['secondary']
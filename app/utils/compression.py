@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import zlib
+from typing import Optional
+from config import CONFIG
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+
+class Codec:
+    """
+    content encoding. compressor keeps its context between chunks of a stream,
+    so repeated parts of messages (keys, metadata) are compressed as references to the previous chunks
+    """
+    name: str = ''
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = self.decompressor()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def compressor(self):
+        raise NotImplementedError("Function is not defined for base class")
+
+    def decompressor(self):
+        raise NotImplementedError("Function is not defined for base class")
+
+
+class _GzipStreamCompressor:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def sync(self) -> bytes:
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+
+class Gzip(Codec):
+    name = 'gzip'
+
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def compressor(self) -> _GzipStreamCompressor:
+        return _GzipStreamCompressor(level=self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj(47)
+
+
+class _ZstdStreamCompressor:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def sync(self) -> bytes:
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def flush(self) -> bytes:
+        return self.compressor.flush()
+
+
+class _ZstdDecompressor:
+    def __init__(self):
+        self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.decompressor.decompress(data) if data else b''
+
+    @staticmethod
+    def flush() -> bytes:
+        return b''
+
+
+class Zstd(Codec):
+    name = 'zstd'
+
+    def __init__(self, level: int = 3):
+        self.level = level
+
+    def compressor(self) -> _ZstdStreamCompressor:
+        return _ZstdStreamCompressor(level=self.level)
+
+    def decompressor(self) -> _ZstdDecompressor:
+        return _ZstdDecompressor()
+
+
+def _available_codecs() -> dict[str, Codec]:
+    codecs = {'gzip': Gzip()}
+    if ZSTD_AVAILABLE:
+        codecs['zstd'] = Zstd()
+    elif 'zstd' in CONFIG.COMPRESSION_CODECS:
+        logging.getLogger("default").warning("zstd compression is enabled but 'zstandard' package is not installed. "
+                                             "Using the rest of COMPRESSION_CODECS")
+    return {name: codecs[name] for name in CONFIG.COMPRESSION_CODECS if name in codecs}
+
+
+CODECS: dict[str, Codec] = _available_codecs()
+
+
+def negotiate(accepted: str) -> Optional[Codec]:
+    """
+    the first of COMPRESSION_CODECS which is in comma separated list of accepted encodings (q=0 means refused)
+    """
+    names = set()
+    for encoding in accepted.split(','):
+        name, _, params = encoding.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            names.add(name.strip().lower())
+    for name, codec in CODECS.items():
+        if name in names:
+            return codec
+    return None
+
+
+class CompressionMiddleware:
+    """
+    asgi middleware:
+    - request body with content-encoding of one of CODECS is decompressed while it is received
+    - response is compressed with the codec negotiated from accept-encoding if it is at least threshold bytes.
+      streaming response (e.g. replication stream) is held back until its chunks reach threshold
+      or for at most delay seconds, then it is either compressed as a whole with one context
+      (every chunk is flushed so the client can decode it immediately) or sent as is.
+      server-sent events are not compressed
+    """
+    def __init__(self, app, threshold: int, delay: float):
+        self.app = app
+        self.threshold = threshold
+        self.delay = delay
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not CODECS:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope['headers'])
+        encoding = headers.get(b'content-encoding', b'').decode('latin-1').strip().lower()
+        if encoding in CODECS:
+            receive = self._decompressing(receive, decompressor=CODECS[encoding].decompressor())
+            scope = {**scope, 'headers': [(key, value) for key, value in scope['headers']
+                                          if key not in (b'content-encoding', b'content-length')]}
+        codec = negotiate(headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if codec is None:
+            await self.app(scope, receive, send)
+            return
+        sender = _CompressingSender(send=send, codec=codec, threshold=self.threshold, delay=self.delay)
+        try:
+            await self.app(scope, receive, sender)
+        finally:
+            sender.close()
+
+    @staticmethod
+    def _decompressing(receive, decompressor):
+        async def wrapper():
+            message = await receive()
+            if message['type'] == 'http.request':
+                body = decompressor.decompress(message.get('body', b''))
+                if not message.get('more_body', False):
+                    body += decompressor.flush()
+                message = {**message, 'body': body}
+            return message
+        return wrapper
+
+
+class _CompressingSender:
+    def __init__(self, send, codec: Codec, threshold: int, delay: float):
+        self.send = send
+        self.codec = codec
+        self.threshold = threshold
+        self.delay = delay
+        self.start: Optional[dict] = None
+        self.compressor = None
+        self.passthrough: bool = False
+        self.buffer = bytearray()
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task] = None
+
+    async def __call__(self, message: dict):
+        async with self.lock:
+            await self._send(message)
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    async def _send(self, message: dict):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            headers = dict(message.get('headers', []))
+            length = headers.get(b'content-length')
+            self.passthrough = message['status'] in (204, 304) or b'content-encoding' in headers or \
+                headers.get(b'content-type', b'').startswith(b'text/event-stream') or \
+                (length is not None and int(length) < self.threshold)
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.send(message)
+            return
+        body, more_body = message.get('body', b''), message.get('more_body', False)
+        if self.compressor is not None:
+            await self.send({'type': 'http.response.body', 'body': self._compress(body, more_body=more_body),
+                             'more_body': more_body})
+            return
+        self.buffer += body
+        if len(self.buffer) >= self.threshold:
+            self.close()
+            self.compressor = self.codec.compressor()
+            body = self._compress(bytes(self.buffer), more_body=more_body)
+            self.buffer.clear()
+            await self.send(self._compressed_start(content_length=None if more_body else len(body)))
+            await self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+        elif not more_body:
+            self.close()
+            await self._pass_buffered(more_body=False)
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self._pass_after_delay())
+
+    async def _pass_buffered(self, more_body: bool):
+        """
+        response which didn't reach threshold is sent as is
+        """
+        self.passthrough = True
+        await self.send(self.start)
+        await self.send({'type': 'http.response.body', 'body': bytes(self.buffer), 'more_body': more_body})
+        self.buffer.clear()
+
+    async def _pass_after_delay(self):
+        await asyncio.sleep(self.delay)
+        async with self.lock:
+            self.timer = None
+            if not self.passthrough and self.compressor is None:
+                await self._pass_buffered(more_body=True)
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        return self.compressor.compress(body) + (self.compressor.sync() if more_body else self.compressor.flush())
+
+    def _compressed_start(self, content_length: Optional[int]) -> dict:
+        headers = [(key, value) for key, value in self.start.get('headers', []) if key != b'content-length']
+        headers.append((b'content-encoding', self.codec.name.encode()))
+        headers.append((b'vary', b'accept-encoding'))
+        if content_length is not None:
+            headers.append((b'content-length', str(content_length).encode()))
+        return {**self.start, 'headers': headers}
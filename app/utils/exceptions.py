@@ -1,3 +1,5 @@
+from typing import Optional
+
 
 class AuthorizationError(Exception):
     def __init__(self,
@@ -45,6 +47,95 @@ class MessageDuplicationError(Exception):
         return f"status code: {self.status_code}\nerror: {self.error}"
 
 
+class ReorderBufferOverflowError(Exception):
+    def __init__(self,
+                 message_ids: list[int],
+                 status_code: int = 503):
+        self.status_code = status_code
+        self.error = f"Messages with ids {message_ids[0]}-{message_ids[-1]} were rejected: " \
+                     f"too many messages are awaiting missing ones"
+
+    def __str__(self):
+        return f"status code: {self.status_code}; error: {self.error}"
+
+    def __repr__(self):
+        return f"status code: {self.status_code}\nerror: {self.error}"
+
+
+class WriteConcernTimeoutError(Exception):
+    def __init__(self,
+                 message_ids: list[int],
+                 wc: int,
+                 acks: int,
+                 status_code: int = 202):
+        self.message_ids = message_ids
+        self.wc = wc
+        self.acks = acks
+        self.status_code = status_code
+        self.error = f"Write concern was not reached in time: " \
+                     f"{acks} out of {wc} acknowledgements received"
+
+    def __str__(self):
+        return f"status code: {self.status_code}; error: {self.error}"
+
+    def __repr__(self):
+        return f"status code: {self.status_code}\nerror: {self.error}"
+
+
+class ConsistencyTimeoutError(Exception):
+    def __init__(self,
+                 min_id: int,
+                 message_id: int,
+                 status_code: int = 503):
+        self.min_id = min_id
+        self.message_id = message_id
+        self.status_code = status_code
+        self.error = f"Message with id {min_id} was not replicated in time: last message id is {message_id}"
+
+    def __str__(self):
+        return f"status code: {self.status_code}; error: {self.error}"
+
+    def __repr__(self):
+        return f"status code: {self.status_code}\nerror: {self.error}"
+
+
+class TopicNotFoundError(Exception):
+    def __init__(self,
+                 topic: str,
+                 status_code: int = 404):
+        self.topic = topic
+        self.status_code = status_code
+        self.error = f"Topic {topic} does not exist"
+
+    def __str__(self):
+        return f"status code: {self.status_code}; error: {self.error}"
+
+    def __repr__(self):
+        return f"status code: {self.status_code}\nerror: {self.error}"
+
+
+class SecondaryAheadError(Exception):
+    def __init__(self,
+                 server_id: str,
+                 topic: str,
+                 last_id: int,
+                 message_id: int,
+                 status_code: int = 409):
+        self.server_id = server_id
+        self.topic = topic
+        self.last_id = last_id
+        self.message_id = message_id
+        self.status_code = status_code
+        self.error = f"Secondary ({server_id}) has messages up to {last_id} of topic {topic}, " \
+                     f"but master has only up to {message_id}"
+
+    def __str__(self):
+        return f"status code: {self.status_code}; error: {self.error}"
+
+    def __repr__(self):
+        return f"status code: {self.status_code}\nerror: {self.error}"
+
+
 class ReadOnlyException(Exception):
     def __init__(self,
                  status_code: int = 500):
@@ -68,3 +159,34 @@ class NotToRetryException(Exception):
 
     def __repr__(self):
         return f"Error: {self.error}"
+
+
+class ChannelClosedError(Exception):
+    def __init__(self,
+                 service_id: str):
+        self.service_id = service_id
+        self.error = f"Replication stream to {service_id} was closed"
+
+    def __str__(self):
+        return f"Error: {self.error}"
+
+    def __repr__(self):
+        return f"Error: {self.error}"
+
+
+class OwnerWorkerError(Exception):
+    def __init__(self,
+                 error: str,
+                 status_code: int = 503,
+                 kind: str = 'ConnectionError',
+                 details: Optional[dict] = None):
+        self.status_code = status_code
+        self.error = error
+        self.kind = kind
+        self.details = details or {}
+
+    def __str__(self):
+        return f"status code: {self.status_code}; error: {self.error}"
+
+    def __repr__(self):
+        return f"status code: {self.status_code}\nerror: {self.error}"
@@ -1,10 +1,10 @@
 import functools
 import logging
 from typing import Optional
-import time
 import asyncio
 from utils.other import next_retry_in, get_retry_properties
 from utils.exceptions import NotToRetryException
+from utils.log_pipeline import log_event
 
 
 def async_handler(func):
@@ -12,12 +12,7 @@ def async_handler(func):
     async def wrapper(*args, **kwargs):
         if 'api_key' in kwargs:
             _ = kwargs.pop('api_key')
-        message_dict = {
-            'function': func.__name__,
-            'status': 'called'
-        }
-        message_dict.update(kwargs)
-        logging.getLogger("default").info(';'.join([f"{key}={value}" for key, value in message_dict.items()]))
+        log_event("default", logging.INFO, function=func.__name__, status='called', **kwargs)
         exception: Optional[Exception] = None
         for interval in next_retry_in(**get_retry_properties(func.__name__)):
             try:
@@ -28,57 +23,11 @@ def async_handler(func):
                 break
             except Exception as e:
                 exception = e
-                message_dict.update({'status': 'retried', 'error': exception})
-                logging.getLogger("default").info(
-                    ';'.join([f"{key}={value}" for key, value in message_dict.items()])
-                    + f";next_retry_in(sec):{interval}"
-                )
+                log_event("default", logging.INFO, function=func.__name__, status='retried', **kwargs,
+                          error=exception, next_retry_in=interval)
                 await asyncio.sleep(interval)
                 continue
-        message_dict.update({
-            'status': 'failed',
-            'error': exception
-        })
-        message = ';'.join([f"{key}={value}" for key, value in message_dict.items()])
-        logging.getLogger("uvicorn.error").error(message)
-
-    return wrapper
-
-
-def sync_handler(func):
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        if 'api_key' in kwargs:
-            _ = kwargs.pop('api_key')
-        message_dict = {
-            'function': func.__name__,
-            'status': 'called'
-        }
-        exception: Optional[Exception] = None
-        for interval in next_retry_in(**get_retry_properties(func.__name__)):
-            try:
-                message_dict.update(kwargs)
-                message = ';'.join([f"{key}={value}" for key, value in message_dict.items()])
-                logging.getLogger("default").info(message)
-                res = func(*args, **kwargs)
-                return res
-            except NotToRetryException as e:
-                exception = e
-                break
-            except Exception as e:
-                exception = e
-                message_dict.update({'status': 'retried', 'next_retry_in(sec)': f'{interval}', 'error': exception})
-                logging.getLogger("default").info(
-                    ';'.join([f"{key}={value}" for key, value in message_dict.items()])
-                    + f";next_retry_in(sec):{interval}"
-                )
-                time.sleep(interval)
-                continue
-        message_dict.update({
-            'status': 'failed',
-            'error': exception
-        })
-        message = ';'.join([f"{key}={value}" for key, value in message_dict.items()])
-        logging.getLogger("uvicorn.error").error(message)
+        log_event("uvicorn.error", logging.ERROR, function=func.__name__, status='failed', **kwargs,
+                  error=exception)
 
     return wrapper
@@ -0,0 +1,146 @@
+import logging
+import queue
+import random
+import threading
+import time
+from typing import Optional
+from config import CONFIG
+from utils.metrics import METRICS, Counter
+
+LOG_RECORDS_DROPPED = METRICS.register(Counter(
+    name='log_records_dropped_total',
+    documentation='Log records dropped because logging queue was full'
+))
+
+
+class Event:
+    """
+    structured log message, it is joined into 'key=value;...' string only when a handler formats the record
+    """
+    __slots__ = ('fields',)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self):
+        return ';'.join([f"{key}={value}" for key, value in self.fields.items()])
+
+
+class _QueueHandler(logging.Handler):
+    """
+    puts records to logging queue as they are, original handlers of the logger are called from logging thread
+    """
+    def __init__(self, pipeline: 'LogPipeline', handlers: list[logging.Handler]):
+        super().__init__()
+        self.pipeline = pipeline
+        self.handlers = handlers
+
+    def emit(self, record: logging.LogRecord):
+        self.pipeline.put(handlers=self.handlers, record=record)
+
+
+class LogPipeline:
+    """
+    handlers of configured loggers (root, uvicorn.*) are moved to one background thread,
+    so event loop only creates a record and puts it to bounded queue.
+    if queue is full, record is dropped instead of blocking the loop
+    """
+    def __init__(self, queue_size: int):
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.thread: Optional[threading.Thread] = None
+        self.loggers: dict[str, list[logging.Handler]] = dict()
+
+    def start(self, loggers: tuple[str, ...] = ('', 'uvicorn', 'uvicorn.error', 'uvicorn.access')):
+        if self.thread is not None:
+            return
+        for name in loggers:
+            logger = logging.getLogger(name)
+            if not logger.handlers:
+                continue
+            self.loggers[name] = logger.handlers
+            logger.handlers = [_QueueHandler(pipeline=self, handlers=logger.handlers)]
+        self.thread = threading.Thread(target=self._run, name='log-pipeline', daemon=True)
+        self.thread.start()
+
+    def put(self, handlers: list[logging.Handler], record: logging.LogRecord):
+        try:
+            self.queue.put_nowait((handlers, record))
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def stop(self):
+        """
+        write remaining records and give handlers back to their loggers
+        """
+        if self.thread is None:
+            return
+        self.queue.put((None, None))
+        self.thread.join()
+        self.thread = None
+        for name, handlers in self.loggers.items():
+            logging.getLogger(name).handlers = handlers
+        self.loggers.clear()
+
+    def _run(self):
+        while True:
+            handlers, record = self.queue.get()
+            if record is None:
+                return
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class RateLimiter:
+    """
+    token bucket per event: up to rate events per second,
+    number of suppressed events is reported with the next logged one
+    """
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.burst = max(rate, 1)
+        self.buckets: dict[tuple, list] = dict()
+
+    def allow(self, key: tuple) -> Optional[int]:
+        """
+        returns None if event has to be suppressed, otherwise number of events suppressed before it
+        """
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.burst, now, 0]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return None
+        bucket[0] -= 1
+        suppressed, bucket[2] = bucket[2], 0
+        return suppressed
+
+
+LOG_PIPELINE = LogPipeline(queue_size=CONFIG.LOG_QUEUE_SIZE)
+RATE_LIMITER = RateLimiter(rate=CONFIG.LOG_RATE_LIMIT) if CONFIG.LOG_RATE_LIMIT else None
+
+
+def log_event(logger: str, level: int, **fields):
+    """
+    log structured event: nothing is done if level is disabled for the logger.
+    events below WARNING are sampled by LOG_SAMPLING ('function:status' or 'status' keys),
+    all events are limited to LOG_RATE_LIMIT per second for every function and status
+    """
+    log = logging.getLogger(logger)
+    if not log.isEnabledFor(level):
+        return
+    function, status = fields.get('function'), fields.get('status')
+    if level < logging.WARNING and CONFIG.LOG_SAMPLING:
+        rate = CONFIG.LOG_SAMPLING.get(f'{function}:{status}', CONFIG.LOG_SAMPLING.get(status, 1))
+        if rate < 1 and random.random() >= rate:
+            return
+    if RATE_LIMITER is not None:
+        suppressed = RATE_LIMITER.allow(key=(function, status))
+        if suppressed is None:
+            return
+        if suppressed:
+            fields['suppressed'] = suppressed
+    log.log(level, Event(fields))
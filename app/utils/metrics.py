@@ -0,0 +1,174 @@
+import bisect
+import math
+from typing import Callable, Iterable, Union
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type: str = ''
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.children: dict[tuple, object] = dict()
+
+    def labels(self, *values):
+        """
+        children are created once per labels, so hot path keeps a child and only updates its numbers
+        """
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._child()
+        return child
+
+    def remove(self, *values):
+        """
+        drop children whose leading label values are given (e.g. all reasons of a removed secondary),
+        so label values which are gone don't pile up
+        """
+        for labels in [labels for labels in self.children if labels[:len(values)] == values]:
+            del self.children[labels]
+
+    def _child(self):
+        raise NotImplementedError("Function is not defined for base class")
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError("Function is not defined for base class")
+
+    def render(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}',
+                          *self._samples()])
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value: float = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self.children.items()):
+            yield f'{self.name}{_format_labels(self.label_names, values)} {_format_value(child.value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: list[float]):
+        self.bounds = bounds
+        self.counts: list[int] = [0] * (len(bounds) + 1)
+        self.sum: float = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float], labels: tuple[str, ...] = ()):
+        super().__init__(name=name, documentation=documentation, labels=labels)
+        self.bounds = sorted(buckets)
+
+    def _child(self):
+        return _HistogramChild(bounds=self.bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self.children.items()):
+            total = 0
+            for bound, count in zip([*self.bounds, math.inf], child.counts):
+                total += count
+                labels = _format_labels(self.label_names, values, extra=f'le="{_format_value(bound)}"')
+                yield f'{self.name}_bucket{labels} {total}'
+            labels = _format_labels(self.label_names, values)
+            yield f'{self.name}_sum{labels} {_format_value(child.sum)}'
+            yield f'{self.name}_count{labels} {total}'
+
+
+class Gauge(_Metric):
+    """
+    value is read with callback when metrics are collected, so it costs nothing between scrapes.
+    callback returns a number or, for gauge with labels, a dict of numbers by label values
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Callable[[], Union[float, dict[tuple, float]]],
+                 labels: tuple[str, ...] = ()):
+        super().__init__(name=name, documentation=documentation, labels=labels)
+        self.callback = callback
+
+    def _samples(self) -> Iterable[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = dict()
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+
+METRICS = MetricsRegistry()
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+REPLICATION_LATENCY = METRICS.register(Histogram(
+    name='replication_latency_seconds',
+    documentation='Time from sending a batch of messages to a secondary until it is acknowledged',
+    buckets=LATENCY_BUCKETS,
+    labels=('secondary',)
+))
+WC_WAIT = METRICS.register(Histogram(
+    name='write_concern_wait_seconds',
+    documentation='Time master waits for write concern before responding to a client',
+    buckets=LATENCY_BUCKETS,
+    labels=('wc',)
+))
+REPLICATION_RETRIES = METRICS.register(Counter(
+    name='replication_retries_total',
+    documentation='Failed attempts to replicate a batch of messages by reason',
+    labels=('secondary', 'reason')
+))
@@ -10,23 +10,30 @@ def get_retry_properties(func: str) -> dict:
         "default": {
             "max_delay": 300,
             "interval": 10,
-            "mechanism": RetryMechanism.UNIFORM
+            "mechanism": RetryMechanism.UNIFORM,
+            "jitter": CONFIG.RETRY_JITTER
         },
-        "_publish_to_secondary": {
+        "_publish_batch_to_secondary": {
             "max_delay": CONFIG.MAX_MESSAGE_POST_RETRY_DELAY,
             "interval": CONFIG.MESSAGE_POST_RETRY_INTERVAL,
-            "mechanism": CONFIG.MESSAGE_POST_RETRIES_MECHANISM
+            "mechanism": CONFIG.MESSAGE_POST_RETRIES_MECHANISM,
+            "jitter": CONFIG.RETRY_JITTER
         },
         "_register_to_master": {
             "max_delay": CONFIG.MAX_CONNECTION_TO_MASTER_DELAY,
             "interval": CONFIG.CONNECTION_TO_MASTER_RETRY_INTERVAL,
-            "mechanism": CONFIG.CONNECTION_TO_MASTER_RETRY_MECHANISM
+            "mechanism": CONFIG.CONNECTION_TO_MASTER_RETRY_MECHANISM,
+            "jitter": CONFIG.RETRY_JITTER
         }
     }
     return kwargs.get(func, kwargs["default"])
 
 
-def next_retry_in(mechanism: RetryMechanism, **kwargs):
+def next_retry_in(mechanism: RetryMechanism, jitter: float = 0, **kwargs):
+    """
+    intervals are shifted randomly by up to jitter share of their value
+    so retries of many clients are not made at the same moment
+    """
     def _exponential_retry(max_delay: float, interval: int):
         current_delay = 0
         total_delay = 0
@@ -41,13 +48,16 @@ def next_retry_in(mechanism: RetryMechanism, **kwargs):
             total_delay += interval
             yield interval
 
-    return {
+    intervals = {
         RetryMechanism.UNIFORM: _uniform_retry,
         RetryMechanism.EXPONENTIAL: _exponential_retry
     }[mechanism](**kwargs)
+    if not jitter:
+        return intervals
+    return (round(interval * random.uniform(1 - jitter, 1 + jitter), 3) for interval in intervals)
 
 
 async def delay(a, b):
     sleep_time = random.randint(a, b)
-    logging.getLogger('default').info(f'Sleep for {sleep_time}')
+    logging.getLogger('default').info('Sleep for %s', sleep_time)
     await asyncio.sleep(sleep_time)
@@ -0,0 +1,77 @@
+import asyncio
+import collections
+import heapq
+import itertools
+from typing import Awaitable, Callable, Optional
+
+
+class RetryScheduler:
+    """
+    one timer on event loop for all delayed retries instead of a sleeping coroutine per retry.
+    retries are grouped by key (destination), so all of them can be dropped at once,
+    and at most max_concurrency of due retries are running at the same time
+    """
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.running: int = 0
+        self.heap: list[tuple[float, int, str]] = []
+        self.groups: dict[str, dict[int, Callable[[], Awaitable]]] = dict()
+        self.ready: collections.deque[tuple[str, int]] = collections.deque()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.sequence = itertools.count()
+
+    def schedule(self, key: str, delay: float, callback: Callable[[], Awaitable]):
+        loop = asyncio.get_running_loop()
+        retry_id = next(self.sequence)
+        self.groups.setdefault(key, dict())[retry_id] = callback
+        heapq.heappush(self.heap, (loop.time() + delay, retry_id, key))
+        self._arm(loop)
+
+    def cancel(self, key: str) -> int:
+        """
+        drop all pending retries of given key, returns number of dropped retries
+        """
+        return len(self.groups.pop(key, dict()))
+
+    def pending(self, key: Optional[str] = None) -> int:
+        if key is not None:
+            return len(self.groups.get(key, dict()))
+        return sum(len(group) for group in self.groups.values())
+
+    def _arm(self, loop: asyncio.AbstractEventLoop):
+        while self.heap and self.heap[0][1] not in self.groups.get(self.heap[0][2], dict()):
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return
+        when = self.heap[0][0]
+        if self.timer is not None:
+            if self.timer.when() <= when:
+                return
+            self.timer.cancel()
+        self.timer = loop.call_at(when, self._fire)
+
+    def _fire(self):
+        loop = asyncio.get_running_loop()
+        self.timer = None
+        now = loop.time()
+        while self.heap and self.heap[0][0] <= now:
+            _, retry_id, key = heapq.heappop(self.heap)
+            self.ready.append((key, retry_id))
+        self._run_ready(loop)
+        self._arm(loop)
+
+    def _run_ready(self, loop: asyncio.AbstractEventLoop):
+        while self.ready and self.running < self.max_concurrency:
+            key, retry_id = self.ready.popleft()
+            group = self.groups.get(key)
+            callback = group.pop(retry_id, None) if group else None
+            if callback is None:
+                continue
+            if not group:
+                del self.groups[key]
+            self.running += 1
+            loop.create_task(callback()).add_done_callback(self._done)
+
+    def _done(self, _: asyncio.Task):
+        self.running -= 1
+        self._run_ready(asyncio.get_running_loop())
@@ -0,0 +1,23 @@
+import json
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(data: bytes):
+        return json.loads(data)
+
+
+def join_array(items) -> bytes:
+    """
+    json array from already encoded items
+    """
+    return b'[' + b','.join(items) + b']'
@@ -0,0 +1,47 @@
+import asyncio
+from typing import AsyncIterator, Callable, TypeVar
+import uvicorn
+
+T = TypeVar('T')
+EXITING = asyncio.Event()
+
+
+def chain_exit_signals(on_exit: Callable[[], None]):
+    """
+    uvicorn waits for open connections to finish before application shutdown, so long-lived streams
+    (replication stream and acks, subscriptions) would keep the server up forever.
+    on exit signal they are ended first, then uvicorn handles the signal as usual.
+    uvicorn installs Server.handle_exit as signal handler after the application is imported,
+    so it is wrapped at import
+    """
+    handle_exit = uvicorn.Server.handle_exit
+
+    def handler(server: uvicorn.Server, *args, **kwargs):
+        if not EXITING.is_set():
+            EXITING.set()
+            on_exit()
+        handle_exit(server, *args, **kwargs)
+
+    uvicorn.Server.handle_exit = handler
+
+
+async def until_exit(chunks: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    chunks of a long-lived stream until the stream ends or exit signal is received
+    """
+    iterator = chunks.__aiter__()
+    exiting = asyncio.ensure_future(EXITING.wait())
+    try:
+        while True:
+            chunk = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait((chunk, exiting), return_when=asyncio.FIRST_COMPLETED)
+            if not chunk.done():
+                chunk.cancel()
+                return
+            try:
+                result = chunk.result()
+            except StopAsyncIteration:
+                return
+            yield result
+    finally:
+        exiting.cancel()
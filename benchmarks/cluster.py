@@ -0,0 +1,196 @@
+"""
+end-to-end benchmark of master running in-process with stand-in secondaries (no network and no docker):
+- write throughput and latency (p50/p99/p999) for given write concerns, payload sizes and batch sizes
+- GET /messages paginated and streamed
+- catch-up of a secondary registered after the load
+- growth of resident memory of the process
+secondaries answer after configured latency and fail configured share of replication requests
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+
+os.environ.setdefault('DELAY', '0,0')
+os.environ.setdefault('MESSAGE_POST_RETRIES_MECHANISM', 'uniform')
+os.environ.setdefault('MESSAGE_POST_RETRY_INTERVAL', '1')
+os.environ.setdefault('MAX_MESSAGE_POST_RETRY_DELAY', '10')
+import common  # noqa: E402
+import httpx  # noqa: E402
+
+
+class FakeSecondary:
+    """
+    asgi stand-in for secondary: acknowledges replicated batches after latency seconds,
+    fails failure_rate share of them with 500 and answers healthchecks
+    """
+    def __init__(self, latency: float, failure_rate: float):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received: int = 0
+        self.failed: int = 0
+
+    async def __call__(self, scope, receive, send):
+        body, more_body = b'', True
+        while more_body:
+            event = await receive()
+            body += event.get('body', b'')
+            more_body = event.get('more_body', False)
+        status, content = 200, b'HEALTHY'
+        if scope['path'] == '/messages/batch':
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if random.random() < self.failure_rate:
+                self.failed += 1
+                status, content = 500, b'{"detail":"injected failure"}'
+            else:
+                message_ids = [message['meta']['message_id'] for message in json.loads(body)]
+                self.received += len(message_ids)
+                content = json.dumps({'data': message_ids}).encode()
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': content})
+
+
+class Cluster:
+    def __init__(self, latency: float, failure_rate: float):
+        from main import app
+        from services import SERVICE
+        from config import CONFIG
+
+        self.app = app
+        self.service = SERVICE
+        self.config = CONFIG
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.secondaries: dict[str, FakeSecondary] = dict()
+        self.service.clients.transport_factory = lambda server: httpx.ASGITransport(app=self.secondaries[server.id])
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://master',
+                                        headers={'x-token': CONFIG.CLIENT_TOKEN}, timeout=None)
+
+    async def start(self, secondaries: int):
+        await self.app.router.startup()
+        for number in range(secondaries):
+            await self.register(server_id=f'secondary-{number}')
+
+    async def stop(self):
+        await self.client.aclose()
+        await self.app.router.shutdown()
+
+    async def register(self, server_id: str, last_id: int = 0):
+        self.secondaries[server_id] = FakeSecondary(latency=self.latency, failure_rate=self.failure_rate)
+        response = await self.client.post('/secondary/register', params={'_id': server_id, 'last_id': last_id},
+                                          headers={'x-token': self.config.SERVICE_TOKEN})
+        response.raise_for_status()
+
+
+def percentile(values: list[float], share: float) -> float:
+    return round(values[min(len(values) - 1, int(share * len(values)))] * 1000, 2)
+
+
+def row(case: str, messages: int, elapsed: float, **kwargs) -> dict:
+    result = {'case': case, 'wc': '-', 'payload': '-', 'batch': '-', 'messages': messages,
+              'msg_per_sec': round(messages / elapsed), 'p50_ms': '-', 'p99_ms': '-', 'p999_ms': '-',
+              'errors': 0, 'rss_growth_mb': '-'}
+    result.update(kwargs)
+    return result
+
+
+async def write(cluster: Cluster, requests: int, concurrency: int, wc: int, payload: int, batch: int) -> dict:
+    text = 'x' * payload
+    latencies: list[float] = []
+    statuses = collections.Counter()
+    pending = iter(range(requests))
+
+    async def client():
+        for _ in pending:
+            started_at = time.perf_counter()
+            if batch > 1:
+                response = await cluster.client.put('/messages/batch', params={'wc': wc},
+                                                    json=[{'message': text}] * batch)
+            else:
+                response = await cluster.client.put('/messages', params={'wc': wc}, json={'message': text})
+            latencies.append(time.perf_counter() - started_at)
+            statuses[response.status_code] += 1
+
+    rss = common.rss()
+    started_at = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started_at
+    latencies.sort()
+    return row(case='write', messages=requests * batch, elapsed=elapsed, wc=wc, payload=payload, batch=batch,
+               p50_ms=percentile(latencies, 0.5), p99_ms=percentile(latencies, 0.99),
+               p999_ms=percentile(latencies, 0.999), errors=requests - statuses[200],
+               rss_growth_mb=round((common.rss() - rss) / 2 ** 20, 1))
+
+
+async def read(cluster: Cluster, page: int) -> list[dict]:
+    messages, since_id = 0, 0
+    started_at = time.perf_counter()
+    while True:
+        response = await cluster.client.get('/messages', params={'since_id': since_id, 'limit': page})
+        data = response.json()
+        messages += len(data['data'])
+        if not data['data']:
+            break
+        since_id = data['next_since_id']
+    paginated = row(case=f'read (pages of {page})', messages=messages, elapsed=time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    async with cluster.client.stream('GET', '/messages', params={'stream': True}) as response:
+        streamed = sum([1 async for _ in response.aiter_lines()])
+    return [paginated, row(case='read (stream)', messages=streamed, elapsed=time.perf_counter() - started_at)]
+
+
+async def catch_up(cluster: Cluster) -> dict:
+    from registries import MESSAGE_REGISTRY, SECONDARIES_REGISTRY
+
+    started_at = time.perf_counter()
+    await cluster.register(server_id='late-secondary')
+    while cluster.service.get_replication_status('late-secondary')['lag'] > 0:
+        await asyncio.sleep(0.005)
+    result = row(case='catch-up', messages=MESSAGE_REGISTRY.message_id, elapsed=time.perf_counter() - started_at)
+    SECONDARIES_REGISTRY.remove(server_id='late-secondary')
+    return result
+
+
+async def run(args) -> list[dict]:
+    cluster = Cluster(latency=args.latency / 1000, failure_rate=args.failure_rate)
+    await cluster.start(secondaries=args.secondaries)
+    rows = []
+    try:
+        for wc in args.wc:
+            for payload in args.payloads:
+                for batch in args.batch_sizes:
+                    rows.append(await write(cluster, requests=args.requests, concurrency=args.concurrency,
+                                            wc=wc, payload=payload, batch=batch))
+        rows.extend(await read(cluster, page=args.page))
+        rows.append(await catch_up(cluster))
+    finally:
+        await cluster.stop()
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--secondaries', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=1, help='response latency of secondaries in milliseconds')
+    parser.add_argument('--failure-rate', type=float, default=0, help='share of failed replication requests')
+    parser.add_argument('--wc', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--payloads', type=int, nargs='+', default=[32, 1024], help='message sizes in bytes')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100],
+                        help='messages per client request (more than 1 uses PUT /messages/batch)')
+    parser.add_argument('--requests', type=int, default=2000, help='client requests per case')
+    parser.add_argument('--concurrency', type=int, default=50, help='number of concurrent clients')
+    parser.add_argument('--page', type=int, default=1000, help='page size of paginated GET /messages')
+    parser.add_argument('--seed', type=int, default=0, help='seed of injected failures')
+    parser.add_argument('--output', help='file to write json results to')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rows = asyncio.run(run(args))
+    common.report(f'cluster (secondaries={args.secondaries}, latency={args.latency}ms, '
+                  f'failure_rate={args.failure_rate})', rows, output=args.output)
@@ -0,0 +1,41 @@
+"""
+shared setup for benchmarks: makes application modules importable and provides configuration
+defaults from .env so benchmarks can be run without docker, e.g. `python benchmarks/message_log.py`
+"""
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+with open(os.path.join(ROOT, '.env')) as env:
+    for line in env:
+        if '=' in line and not line.startswith('#'):
+            key, value = line.strip().split('=', 1)
+            os.environ.setdefault(key, value)
+os.environ.setdefault('HOSTNAME', 'benchmark')
+os.environ.setdefault('SERVICE_TYPE', 'master')
+
+
+def rss() -> int:
+    """
+    resident set size of current process in bytes (linux only)
+    """
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def report(name: str, rows: list[dict], output: str = None):
+    """
+    print results as a table and optionally write them as json to given file
+    """
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print(name)
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
+    if output:
+        with open(output, 'w') as file:
+            json.dump({'benchmark': name, 'results': rows}, file, indent=2)
@@ -0,0 +1,98 @@
+"""
+bytes on the wire and cpu cost of compression codecs for replication traffic:
+- request: every batch is compressed on its own (PUT /messages/batch, GET /messages, catch-up chunks)
+- stream: batches share one compression context and every batch is flushed (replication stream)
+batches below the threshold are sent uncompressed
+"""
+import argparse
+import random
+import time
+import common
+from models.models import Message
+from utils.compression import Gzip, Zstd, ZSTD_AVAILABLE
+from utils.serialization import join_array
+
+WORDS = ('replica', 'master', 'secondary', 'order', 'payment', 'user', 'event', 'status', 'created', 'updated',
+         'queue', 'log', 'message', 'value', 'total', 'amount', 'region', 'zone', 'id', 'price')
+
+
+def batches(messages: int, payload: int, batch_size: int) -> list[bytes]:
+    """
+    messages are random words and numbers of about payload bytes, encoded as they are replicated
+    """
+    encoded = []
+    for message_id in range(1, messages + 1):
+        text = ''
+        while len(text) < payload:
+            text += f'{random.choice(WORDS)}={random.randint(0, 10 ** 6)} '
+        encoded.append(Message(message=text[:payload]).register(message_id=message_id).encode())
+    return [join_array(encoded[start:start + batch_size]) for start in range(0, messages, batch_size)]
+
+
+def measure(codec, data: list[bytes], mode: str, threshold: int) -> dict:
+    raw = sum(len(batch) for batch in data)
+    started_at = time.process_time()
+    if codec is None:
+        wire = list(data)
+    elif mode == 'stream':
+        compressor = codec.compressor()
+        wire = [compressor.compress(batch) + compressor.sync() for batch in data]
+    else:
+        wire = [codec.compress(batch) if len(batch) >= threshold else batch for batch in data]
+    compress_time = time.process_time() - started_at
+
+    started_at = time.process_time()
+    if codec is not None and mode == 'stream':
+        decompressor = codec.decompressor()
+        decoded = [decompressor.decompress(batch) for batch in wire]
+    elif codec is not None:
+        decoded = [codec.decompress(compressed) if len(batch) >= threshold else compressed
+                   for batch, compressed in zip(data, wire)]
+    else:
+        decoded = wire
+    decompress_time = time.process_time() - started_at
+    assert decoded == data
+
+    return {
+        'codec': codec.name if codec else 'none',
+        'mode': mode,
+        'raw_kb': round(raw / 1024),
+        'wire_kb': round(sum(len(batch) for batch in wire) / 1024),
+        'ratio': round(raw / sum(len(batch) for batch in wire), 2),
+        'compress_ms': round(compress_time * 1000, 1),
+        'decompress_ms': round(decompress_time * 1000, 1),
+        'compress_mb_per_sec': round(raw / 2 ** 20 / compress_time) if codec and compress_time else '-',
+    }
+
+
+def run(messages: int, payload: int, batch_size: int, threshold: int) -> list[dict]:
+    data = batches(messages=messages, payload=payload, batch_size=batch_size)
+    codecs = [Gzip(level=1), Gzip(level=6)] + ([Zstd(level=3)] if ZSTD_AVAILABLE else [])
+    rows = [measure(None, data, mode='-', threshold=threshold)]
+    for codec in codecs:
+        for mode in ('request', 'stream'):
+            row = measure(codec, data, mode=mode, threshold=threshold)
+            row['codec'] += f'-{codec.level}'
+            rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--payloads', type=int, nargs='+', default=[32, 1024], help='message sizes in bytes')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100],
+                        help='messages per replication request or stream frame')
+    parser.add_argument('--threshold', type=int, default=1024, help='minimum size of compressed request in bytes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to write json results to')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = []
+    for payload in args.payloads:
+        for batch_size in args.batch_sizes:
+            for row in run(messages=args.messages, payload=payload, batch_size=batch_size, threshold=args.threshold):
+                results.append({'payload': payload, 'batch': batch_size, **row})
+    common.report(f'compression (messages={args.messages}, threshold={args.threshold})', results,
+                  output=args.output)
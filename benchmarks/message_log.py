@@ -0,0 +1,66 @@
+"""
+append throughput of MessageLog for every fsync policy and recovery (replay) throughput.
+every writer waits for its append to be synced (as registry.persist() does before acknowledging messages),
+concurrent writers measure group commit: appends made while one fsync runs are synced by the next one
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+import common
+from config.config import FsyncPolicy
+from models.models import Message
+from registries.message_log import MessageLog
+
+
+async def run(policy: FsyncPolicy, messages: int, batch_size: int, payload: int, writers: int) -> dict:
+    with tempfile.TemporaryDirectory() as path:
+        log = MessageLog(path=path, segment_size=64 * 1024 * 1024, fsync_policy=policy, fsync_interval=0.1)
+        message_id = 0
+
+        async def write():
+            nonlocal message_id
+            batch = [Message(message='x' * payload).register(message_id=0) for _ in range(batch_size)]
+            while message_id < messages:
+                for message in batch:
+                    message_id += 1
+                    message.meta.message_id = message_id
+                log.append(batch)
+                await log.sync()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(write() for _ in range(writers)))
+        log.close()
+        append_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        replayed = sum(1 for _ in MessageLog(path=path, segment_size=64 * 1024 * 1024,
+                                             fsync_policy=FsyncPolicy.NEVER).replay())
+        replay_time = time.perf_counter() - start
+
+    return {
+        'fsync': policy.value,
+        'batch_size': batch_size,
+        'writers': writers,
+        'messages': message_id,
+        'append_msg_per_sec': round(message_id / append_time),
+        'replay_msg_per_sec': round(replayed / replay_time)
+    }
+
+
+async def main(args: argparse.Namespace) -> list[dict]:
+    return [await run(policy=policy, messages=args.messages, batch_size=batch_size, payload=args.payload,
+                      writers=writers)
+            for policy in FsyncPolicy for batch_size in args.batch_sizes for writers in args.writers]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 32], help='numbers of concurrent writers')
+    parser.add_argument('--payload', type=int, default=100, help='message size in bytes')
+    parser.add_argument('--output', help='file to write json results to')
+    args = parser.parse_args()
+
+    common.report('message_log', asyncio.run(main(args)), output=args.output)
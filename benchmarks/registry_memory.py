@@ -0,0 +1,63 @@
+"""
+memory used by message registry per stored message for every message store.
+every case runs in a separate process and is measured as growth of its resident set size
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import common
+from config.config import MessageStore
+
+
+def measure(store: MessageStore, messages: int, payload: int, replicas: int, chunk: int = 10000) -> dict:
+    from models.models import Message
+    from registries.message_registry import MessageRegistry
+    from registries.columnar_registry import ColumnarMessageRegistry
+
+    registry = {MessageStore.DICT: MessageRegistry, MessageStore.COLUMNAR: ColumnarMessageRegistry}[store]()
+    servers = [f'secondary-{replica}' for replica in range(replicas)]
+    before = common.rss()
+    start = time.perf_counter()
+    while registry.message_id < messages:
+        message_ids = registry.register_batch([Message(message='x' * payload)
+                                               for _ in range(min(chunk, messages - registry.message_id))])
+        for message_id in message_ids:
+            for server_id in servers:
+                registry.ack(message_id=message_id, server_id=server_id)
+    elapsed = time.perf_counter() - start
+    used = common.rss() - before
+    return {
+        'store': store.value,
+        'messages': messages,
+        'payload': payload,
+        'rss_mb': round(used / 2 ** 20, 1),
+        'bytes_per_message': round(used / messages, 1),
+        'register_msg_per_sec': round(messages / elapsed)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--stores', nargs='+', default=[store.value for store in MessageStore])
+    parser.add_argument('--payload', type=int, default=32, help='message size in bytes')
+    parser.add_argument('--replicas', type=int, default=3, help='number of acknowledgements per message')
+    parser.add_argument('--case', nargs=2, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='file to write json results to')
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(measure(store=MessageStore(args.case[0]), messages=int(args.case[1]),
+                      payload=args.payload, replicas=args.replicas)))
+        sys.exit()
+
+    rows = []
+    for size in args.sizes:
+        for store in args.stores:
+            output = subprocess.run([sys.executable, __file__, '--case', store, str(size),
+                                     '--payload', str(args.payload), '--replicas', str(args.replicas)],
+                                    capture_output=True, text=True, check=True).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+    common.report('registry_memory', rows, output=args.output)
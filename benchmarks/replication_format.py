@@ -0,0 +1,79 @@
+"""
+cost of parsing replicated batches on secondary:
+- json (endpoint): PUT /messages/batch, json is parsed and list[Message] is validated field by field
+- json (stream): json lines of replication stream, validated straight from json
+- binary: length-prefixed records constructed into messages without validation
+"""
+import argparse
+import json
+import time
+import common
+from pydantic import TypeAdapter
+from models.models import Message
+from models.wire_format import decode_batch, encode_batch
+from utils.serialization import join_array
+
+MESSAGES_ADAPTER = TypeAdapter(list[Message])
+
+
+def measure(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(messages: int, payload: int, batch_size: int, repeat: int) -> list[dict]:
+    registered = [Message(message='x' * payload).register(message_id=message_id)
+                  for message_id in range(1, messages + 1)]
+    batches = [registered[start:start + batch_size] for start in range(0, messages, batch_size)]
+    json_batches = [join_array(message.encode() for message in batch) for batch in batches]
+    binary_batches = [encode_batch(batch) for batch in batches]
+
+    def parse_endpoint():
+        return [MESSAGES_ADAPTER.validate_python(json.loads(batch)) for batch in json_batches]
+
+    def parse_stream():
+        return [MESSAGES_ADAPTER.validate_json(batch) for batch in json_batches]
+
+    def parse_binary():
+        return [decode_batch(batch) for batch in binary_batches]
+
+    expected = [(message.meta.message_id, message.meta.registered_at, message.message) for message in registered]
+    for func in (parse_endpoint, parse_stream, parse_binary):
+        assert [(message.meta.message_id, message.meta.registered_at, message.message)
+                for batch in func() for message in batch] == expected
+
+    results = []
+    for name, func, data in (('json (endpoint)', parse_endpoint, json_batches),
+                             ('json (stream)', parse_stream, json_batches),
+                             ('binary', parse_binary, binary_batches)):
+        elapsed = measure(func, repeat=repeat)
+        results.append({
+            'format': name,
+            'payload': payload,
+            'batch': batch_size,
+            'bytes_per_message': round(sum(len(batch) for batch in data) / messages, 1),
+            'us_per_message': round(elapsed / messages * 1e6, 3),
+            'msg_per_sec': round(messages / elapsed)
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--payloads', type=int, nargs='+', default=[32, 1024], help='message sizes in bytes')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100],
+                        help='messages per replication request or stream frame')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='file to write json results to')
+    args = parser.parse_args()
+
+    results = []
+    for payload in args.payloads:
+        for batch_size in args.batch_sizes:
+            results.extend(run(messages=args.messages, payload=payload, batch_size=batch_size, repeat=args.repeat))
+    common.report(f'replication format (messages={args.messages})', results, output=args.output)
@@ -0,0 +1,63 @@
+"""
+cost of serializing messages for replication and GET /messages:
+Message.dict() + json (previous behaviour) against cached Message.encode()
+"""
+import argparse
+import json
+import time
+import common
+from models.models import Message
+from utils.serialization import join_array
+
+
+def measure(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(messages: int, payload: int, replicas: int, repeat: int) -> list[dict]:
+    batch = [Message(message='x' * payload).register(message_id=message_id) for message_id in range(1, messages + 1)]
+    for message in batch:
+        message.meta.registered_to.update(f'secondary-{replica}' for replica in range(replicas))
+
+    def to_dict():
+        return json.dumps([message.dict() for message in batch], ensure_ascii=False, separators=(',', ':'))
+
+    def encode():
+        return join_array(message.encode() for message in batch)
+
+    def encode_cold():
+        for message in batch:
+            message._encoded = None
+        return encode()
+
+    assert json.loads(to_dict()) == json.loads(encode())
+    results = []
+    for name, func in (('dict+json', to_dict), ('encode (cold cache)', encode_cold), ('encode (cached)', encode)):
+        elapsed = measure(func, repeat=repeat)
+        results.append({
+            'method': name,
+            'messages': messages,
+            'payload': payload,
+            'us_per_message': round(elapsed / messages * 1e6, 3),
+            'msg_per_sec': round(messages / elapsed)
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--payload', type=int, default=100, help='message size in bytes')
+    parser.add_argument('--replicas', type=int, default=3, help='size of registered_to')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='file to write json results to')
+    args = parser.parse_args()
+
+    common.report('serialization', run(messages=args.messages, payload=args.payload,
+                                       replicas=args.replicas, repeat=args.repeat),
+                  output=args.output)